@@ -2,11 +2,39 @@
 Health check endpoints
 """
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from datetime import datetime
 
+from app.config import get_settings
+from app.core.governor import get_governor
+from app.core.startup import get_startup
+
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now()}
\ No newline at end of file
+    """Liveness check; answers as soon as the server is up, with this worker's upstream breaker states"""
+    health = {"status": "healthy", "timestamp": datetime.now()}
+    if get_settings().upstream_governor_enabled:
+        health["upstream"] = {source: get_governor(source).status() for source in ("wqp", "nwis")}
+    return health
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness check
+    
+    Returns 503 until the startup warm-up has loaded the query routes, with
+    a breakdown of import and initialization time per step.
+    """
+    startup = get_startup()
+    status = "ready" if startup.ready else "failed" if startup.error else "starting"
+    return JSONResponse(
+        status_code=200 if startup.ready else 503,
+        content=jsonable_encoder({
+            "status": status,
+            "timestamp": datetime.now(),
+            "startup": startup.report()
+        })
+    )
@@ -1,119 +1,1022 @@
 """
 Water quality endpoints
 """
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional
-from datetime import date
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import gzip
+import math
+import time
+from datetime import date, datetime, timezone
 import pandas as pd
 
-from app.models.requests import WaterQualityQuery, ReportConfig, ReportType
-from app.models.responses import WaterQualityReport, SitesResponse, ParametersResponse
-from app.core.data_fetcher import USGSDataFetcher
-from app.core.data_processor import DataProcessor
-from app.core.report_generator import ReportGenerator
+from app.models.requests import WaterQualityQuery, ReportConfig, ReportType, ReportFormat, ReportSection, BatchQuery, BatchRequest
+from app.models.responses import WaterQualityReport, SitesResponse, ParametersResponse, JobResponse
+from app.core.data_fetcher import USGSDataFetcher, SITE_TYPE_CODES
+from app.core.data_processor import DataProcessor, ALL_REPORT_COLUMNS
+from app.core.report_generator import COLUMNAR_FORMATS, ReportGenerator
+from app.core.batch import BatchPlanner, MergedFetch, RowIndex
+from app.core.cache import CachedResult, QueryCache, get_query_cache, make_cache_key
+from app.core.conditional import STARTED_AT, Validators, cache_control
+from app.core.executor import ExecutorBusyError, get_executor
+from app.core.governor import UpstreamUnavailableError, find_upstream_error
+from app.core.jobs import Job, JobQueueFullError, JobStatus, get_job_manager
+from app.core.query_planner import QueryPlanner
+from app.core.result_store import ResultStore, get_result_store
+from app.core.rollups import SECTION_LEVELS, SUMMARY_CELL_COLUMNS
+from app.core.site_catalog import SiteIndex, get_site_catalog
+from app.core.metrics import observe_frame, observe_stale_response, time_stage, time_stream
+from app.core.upstream import get_upstream_client
+from app.core import serialization
+from app.config import get_settings
 
 router = APIRouter()
 
-@router.post("/query", response_model=WaterQualityReport)
+# Sections generated for each report type when ReportConfig.sections is not set
+REPORT_TYPE_SECTIONS = {
+    ReportType.summary: [ReportSection.summary],
+    ReportType.detailed: [ReportSection.detailed],
+    ReportType.trend: [ReportSection.trend],
+    ReportType.comparison: [ReportSection.summary, ReportSection.comparison, ReportSection.detailed],
+    ReportType.spatial: [ReportSection.spatial]
+}
+
+# Sections that can be combined from stored rollups
+ROLLUP_SECTIONS = {ReportSection.summary, ReportSection.trend}
+
+# Detailed rows included in comparison reports
+COMPARISON_DETAIL_LIMIT = 100
+
+def _report_sections(config: ReportConfig) -> List[ReportSection]:
+    """Sections a report config asks for, in order and without repeats"""
+    return list(dict.fromkeys(config.sections or REPORT_TYPE_SECTIONS[config.report_type]))
+
+def _load_query_data(query_params: Dict[str, Any]):
+    """Fetch and clean WQP data (runs on the worker pool)"""
+    if get_upstream_client().running:
+        return _load_streamed(query_params)
+    
+    # Fetch the whole WQP response, then clean it at once
+    with time_stage('fetch'):
+        df, md = USGSDataFetcher.fetch_water_quality_data(query_params)
+    
+    # Clean and validate data, keeping only the columns any report reads
+    memory_report = {} if get_settings().report_memory_usage else None
+    with time_stage('clean'):
+        df = DataProcessor.clean_and_validate_data(
+            df, columns=ALL_REPORT_COLUMNS, memory_report=memory_report
+        )
+    
+    metadata = md or None
+    if memory_report is not None:
+        metadata = {**(metadata or {}), 'memory_usage': memory_report}
+    return df, metadata
+
+def _load_streamed(query_params: Dict[str, Any]):
+    """Fetch WQP data over the pooled client, cleaning it chunk by chunk (runs on the worker pool)"""
+    stream_info: Dict[str, Any] = {}
+    chunks = USGSDataFetcher.iter_water_quality_chunks(
+        query_params, get_settings().fetch_chunk_size, stream_info
+    )
+    with time_stream(chunks) as timed_chunks:
+        df, rows_read = DataProcessor.collect_limited(timed_chunks, None, ALL_REPORT_COLUMNS)
+    
+    metadata = {**stream_info, 'rows_read': rows_read}
+    if get_settings().report_memory_usage:
+        metadata['memory_usage'] = {'typed': DataProcessor.memory_usage(df)}
+    return df, metadata
+
+def _load_limited(query_params: Dict[str, Any], max_records: int):
+    """Stream WQP data until max_records valid rows arrive (runs on the worker pool)"""
+    stream_info: Dict[str, Any] = {}
+    chunks = USGSDataFetcher.iter_water_quality_chunks(
+        query_params, get_settings().fetch_chunk_size, stream_info
+    )
+    with time_stream(chunks) as timed_chunks:
+        df, rows_read = DataProcessor.collect_limited(timed_chunks, max_records, ALL_REPORT_COLUMNS)
+    return df, {**stream_info, 'rows_read': rows_read, 'truncated': len(df) >= max_records}
+
+def _iter_shard_chunks(shards: List[Dict[str, Any]], stream_info: Dict[str, Any]):
+    """Chunks of each shard's WQP response in turn"""
+    chunk_size = get_settings().fetch_chunk_size
+    for shard in shards:
+        yield from USGSDataFetcher.iter_water_quality_chunks(shard, chunk_size, stream_info)
+
+def _load_sample(query_params: Dict[str, Any], sample_size: int):
+    """
+    Stream all WQP data, keeping a bounded random sample (runs on the worker pool)
+    
+    Shards are streamed one after another into the same sample, so long
+    site lists are split into requests WQP accepts.
+    """
+    stream_info: Dict[str, Any] = {}
+    chunks = _iter_shard_chunks(_plan_shards(query_params), stream_info)
+    with time_stream(chunks) as timed_chunks:
+        df, population = DataProcessor.collect_sample(timed_chunks, sample_size, ALL_REPORT_COLUMNS)
+    return df, {**stream_info, 'sampling': {'sample_rows': len(df), 'population_rows': population}}
+
+async def _get_query_frame(query_params: Dict[str, Any], config: Optional[ReportConfig]):
+    """
+    Return the cleaned frame and metadata for a query
+    
+    Date-bounded queries are answered from the local result store when it
+    is enabled. Otherwise sampled summaries and small row limits stream the
+    WQP response (or its shards) and stop early, and everything else
+    (including any query without a config) fetches the full (possibly
+    sharded) result. Partial results are cached separately from full ones.
+    """
+    settings = get_settings()
+    executor = get_executor()
+    cache = get_query_cache() if settings.cache_enabled else None
+    
+    if settings.result_store_enabled and ResultStore.supports(query_params):
+        variant = None
+        loader = lambda: _load_from_store(query_params)
+    elif config is not None and config.sample_size and _report_sections(config) == [ReportSection.summary]:
+        variant = f"sample={config.sample_size}"
+        loader = lambda: executor.run(_load_sample, query_params, config.sample_size)
+    elif config is not None and config.max_records <= settings.early_termination_max_records:
+        if cache is not None:
+            full_result = await cache.get(query_params)
+            if full_result is not None:
+                return full_result
+        variant = f"limit={config.max_records}"
+        shards = _plan_shards(query_params)
+        if len(shards) == 1:
+            loader = lambda: executor.run(_load_limited, query_params, config.max_records)
+        else:
+            loader = lambda: _load_limited_shards(shards, config.max_records)
+    else:
+        variant = None
+        loader = lambda: _fetch_query_data(query_params)
+    
+    async def load():
+        df, md = await loader()
+        observe_frame(df)
+        # Cached with the frame, so repeat requests can be validated without rebuilding
+        md = dict(md or {})
+        md.setdefault('fetched_at', datetime.now(timezone.utc).isoformat())
+        return df, md
+    
+    # Serve repeated queries from the cache
+    if cache is None:
+        return await load()
+    try:
+        return await cache.get_or_load(query_params, load, variant=variant)
+    except Exception as e:
+        stale = _stale_result(cache, query_params, variant, e)
+        if stale is None:
+            raise
+        return stale
+
+def _stale_result(
+    cache: QueryCache,
+    query_params: Dict[str, Any],
+    variant: Optional[str],
+    error: Exception
+) -> Optional[CachedResult]:
+    """An expired cached result to answer with when upstream has failed or refused the load"""
+    upstream = find_upstream_error(error)
+    if upstream is None:
+        return None
+    # A full result also answers row-limited and sampled queries
+    found = cache.get_stale(query_params, variant) or (cache.get_stale(query_params) if variant else None)
+    if found is None:
+        return None
+    (df, md), age = found
+    observe_stale_response()
+    return df, {**(md or {}), 'stale': {'age_seconds': round(age), 'reason': str(upstream)}}
+
+def _stale_headers(md: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Warning and Age headers for a report built from a stale cached result"""
+    stale = (md or {}).get('stale')
+    if not stale:
+        return {}
+    return {"Warning": '110 - "Response is Stale"', "Age": str(stale['age_seconds'])}
+
+async def _fill_store(filter_params: Dict[str, Any], start: date, end: date) -> List[Tuple[date, date]]:
+    """Fetch the dates missing from the local store into it; returns the fetched intervals"""
+    store = get_result_store()
+    executor = get_executor()
+    
+    gaps = await executor.run(store.missing_intervals, filter_params, start, end)
+    for gap_start, gap_end in gaps:
+        gap_params = {**filter_params, **ResultStore.date_params(gap_start, gap_end)}
+        gap_df, _ = await _fetch_query_data(gap_params)
+        await executor.run(store.ingest, filter_params, gap_df, gap_start, gap_end)
+    return gaps
+
+def _store_metadata(gaps: List[Tuple[date, date]]) -> Dict[str, Any]:
+    return {
+        'result_store': {
+            'fetched_intervals': [[lo.isoformat(), hi.isoformat()] for lo, hi in gaps]
+        }
+    }
+
+async def _load_from_store(query_params: Dict[str, Any]):
+    """Answer a date-bounded query from the local store, fetching only missing dates"""
+    filter_params, start, end = ResultStore.split_query(query_params)
+    gaps = await _fill_store(filter_params, start, end)
+    store = get_result_store()
+    df = await get_executor().run(store.read, filter_params, start, end, ALL_REPORT_COLUMNS)
+    return df, {**_store_metadata(gaps), 'fetched_at': store.last_modified(filter_params).isoformat()}
+
+def _merge_shards(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Merge cleaned shard frames and restore compact dtypes"""
+    with time_stage('merge'):
+        return DataProcessor.optimize_dtypes(QueryPlanner.merge_results(frames))
+
+def _catalog_counties(query_params: Dict[str, Any]) -> Dict[str, List[str]]:
+    """County codes of the query's states that the site catalog has loaded, without fetching"""
+    catalog = get_site_catalog()
+    counties = {}
+    for state in query_params.get('statecode') or []:
+        index = catalog.loaded(state)
+        if index is not None:
+            counties[state] = index.county_codes()
+    return counties
+
+def _plan_shards(query_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    settings = get_settings()
+    return QueryPlanner.plan(
+        query_params,
+        window_days=settings.query_shard_window_days,
+        max_sites_per_shard=settings.query_shard_max_sites,
+        max_shards=settings.query_max_shards,
+        counties=_catalog_counties(query_params)
+    )
+
+async def _load_limited_shards(shards: List[Dict[str, Any]], max_records: int):
+    """
+    Stream shards until max_records valid rows arrive, drawing on every shard
+    
+    Each shard is read up to an equal share of max_records, so the rows span
+    all the planned locations and date windows rather than the first shards.
+    While rows are still missing, the shards that filled their share are
+    read again with a larger one; WQP has no offset, so each pass rereads a
+    shard from its start. shard_rows in the metadata gives the rows each
+    shard supplied.
+    """
+    settings = get_settings()
+    executor = get_executor()
+    frames: List[pd.DataFrame] = [pd.DataFrame()] * len(shards)
+    shard_metadata: List[Optional[Dict[str, Any]]] = [None] * len(shards)
+    limits = [0] * len(shards)
+    rows_read = 0
+    passes = 0
+    pending = list(range(len(shards)))
+    share = -(-max_records // len(shards))
+    
+    while pending:
+        passes += 1
+        for i in pending:
+            limits[i] += share
+        limit_of = {id(shards[i]): limits[i] for i in pending}
+        pass_frames, pass_metadata = await QueryPlanner.fetch_shards(
+            [shards[i] for i in pending],
+            lambda shard: executor.run(_load_limited, shard, limit_of[id(shard)]),
+            concurrency=settings.query_shard_concurrency,
+            retries=settings.query_shard_retries,
+            backoff=settings.query_shard_backoff
+        )
+        for i, frame, md in zip(pending, pass_frames, pass_metadata):
+            frames[i], shard_metadata[i] = frame, md
+            rows_read += (md or {}).get('rows_read', 0)
+        
+        missing = max_records - sum(len(frame) for frame in frames)
+        # Only shards that stopped at their limit can have more rows
+        pending = [i for i in pending if len(frames[i]) >= limits[i]]
+        if missing <= 0 or not pending:
+            break
+        share = -(-missing // len(pending))
+    
+    df = await executor.run(_merge_shards, frames)
+    return df.head(max_records), {
+        'shards': shard_metadata,
+        'shards_planned': len(shards),
+        'shard_rows': [len(frame) for frame in frames],
+        'passes': passes,
+        'rows_read': rows_read,
+        'truncated': len(df) >= max_records
+    }
+
+async def _fetch_query_data(query_params: Dict[str, Any]):
+    """Fetch and clean WQP data, fanning large queries out over shards"""
+    settings = get_settings()
+    executor = get_executor()
+    
+    shards = _plan_shards(query_params)
+    if len(shards) == 1:
+        return await executor.run(_load_query_data, query_params)
+    
+    frames, shard_metadata = await QueryPlanner.fetch_shards(
+        shards,
+        lambda shard: executor.run(_load_query_data, shard),
+        concurrency=settings.query_shard_concurrency,
+        retries=settings.query_shard_retries,
+        backoff=settings.query_shard_backoff
+    )
+    df = await executor.run(_merge_shards, frames)
+    return df, {'shards': shard_metadata}
+
+def _comparison_thresholds(config: ReportConfig) -> Optional[Dict[str, Dict[str, Any]]]:
+    if not config.comparison_thresholds:
+        return None
+    return {
+        name: threshold.model_dump(exclude_none=True)
+        for name, threshold in config.comparison_thresholds.items()
+    }
+
+def _spatial_zones(config: ReportConfig, site_indexes: List[SiteIndex]) -> Dict[str, pd.Series]:
+    """Site to zone mappings for each requested spatial level, over the given catalog indexes"""
+    zones = {}
+    for level in dict.fromkeys(config.spatial_levels):
+        mappings = [index.zones(level.value, config.grid_degrees) for index in site_indexes]
+        combined = pd.concat(mappings) if mappings else pd.Series(dtype=object)
+        zones[level.value] = combined[~combined.index.duplicated()]
+    return zones
+
+async def _site_indexes_for(query_params: Dict[str, Any], config: ReportConfig) -> Optional[List[SiteIndex]]:
+    """Catalog indexes of the query's states, when the report aggregates by site location"""
+    if ReportSection.spatial not in _report_sections(config):
+        return None
+    catalog = get_site_catalog()
+    return [await catalog.get(state) for state in query_params.get('statecode', [])]
+
+def _build_report(
+    df: pd.DataFrame,
+    query_params: Dict[str, Any],
+    config: ReportConfig,
+    population_rows: Optional[int] = None,
+    site_indexes: Optional[List[SiteIndex]] = None
+):
+    """
+    Generate report sections for a cleaned frame (runs on the worker pool)
+    
+    population_rows is set when df is a random sample of a larger result;
+    site_indexes supply the site locations spatial sections aggregate by.
+    """
+    # Limit records if specified
+    df = DataProcessor.limit_records(df, config.max_records)
+    
+    detail_limit = config.detail_limit
+    if detail_limit is None and config.report_type == ReportType.comparison and not config.sections:
+        detail_limit = COMPARISON_DETAIL_LIMIT
+    
+    stage = "report_sections" if config.sections else f"report_{config.report_type.value}"
+    with time_stage(stage):
+        results = ReportGenerator.generate_sections(
+            df,
+            query_params,
+            [section.value for section in _report_sections(config)],
+            detail_limit=detail_limit,
+            population_rows=population_rows,
+            granularity=config.trend_granularity.value,
+            by_unit=config.trend_by_unit,
+            trend_statistics=config.trend_statistics,
+            comparison_percentiles=config.comparison_percentiles,
+            comparison_thresholds=_comparison_thresholds(config),
+            comparison_by_unit=config.comparison_by_unit,
+            spatial_zones=_spatial_zones(config, site_indexes) if site_indexes is not None else None,
+            grid_degrees=config.grid_degrees
+        )
+    
+    data_records = results.pop(ReportSection.detailed.value, [])
+    if config.sections:
+        report_data = results
+    else:
+        # Single-type reports keep their flat data_summary; comparison reports
+        # add the comparison keys to the summary fields they always had
+        report_data = {}
+        for result in results.values():
+            for key, value in result.items():
+                report_data.setdefault(key, value)
+    
+    return report_data, data_records, len(df)
+
+def _render_report(report: Dict[str, Any]) -> bytes:
+    """Serialize a report body to JSON (runs on the worker pool)"""
+    with time_stage('serialize'):
+        return serialization.dumps(report)
+
+def _search_upstream_sites(
+    state_cd: List[str],
+    site_type: List[str],
+    has_data_since: Optional[date],
+    filters: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Fetch site metadata from NWIS and filter it (runs on the worker pool)"""
+    sites_df = USGSDataFetcher.fetch_site_info(state_cd, site_type, has_data_since)
+    
+    if sites_df.empty:
+        return []
+    
+    index = SiteIndex(sites_df, get_settings().site_catalog_cell_degrees)
+    return index.records_at(index.search(**filters))
+
+async def _resolve_bbox_sites(state_cd: Optional[List[str]], bbox: List[float]) -> List[str]:
+    """WQP site ids of catalogued sites inside bbox, for the query's states"""
+    catalog = get_site_catalog()
+    site_ids: List[str] = []
+    for state in state_cd or []:
+        index = await catalog.get(state)
+        site_ids.extend(index.wqp_site_ids(index.search(bbox=bbox)))
+    return site_ids
+
+# Formats served as a row stream instead of a JSON report
+STREAM_MEDIA_TYPES = {
+    ReportFormat.csv: "text/csv",
+    ReportFormat.ndjson: "application/x-ndjson",
+    ReportFormat.arrow: "application/vnd.apache.arrow.stream",
+    ReportFormat.parquet: "application/vnd.apache.parquet"
+}
+
+# Download file names of streamed formats
+STREAM_FILENAMES = {
+    ReportFormat.csv: "water-quality.csv",
+    ReportFormat.arrow: "water-quality.arrows",
+    ReportFormat.parquet: "water-quality.parquet"
+}
+
+def _stream_report(
+    df: pd.DataFrame,
+    config: ReportConfig,
+    query_params: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None
+) -> StreamingResponse:
+    """Stream detailed report rows as CSV, NDJSON, Arrow IPC or Parquet"""
+    settings = get_settings()
+    df = DataProcessor.limit_records(df, config.max_records)
+    if config.detail_limit is not None:
+        df = df.head(config.detail_limit)
+    if config.format.value in COLUMNAR_FORMATS:
+        chunks = ReportGenerator.iter_columnar_chunks(
+            df,
+            config.format.value,
+            settings.columnar_batch_rows,
+            {
+                'query_info': query_params,
+                'report_type': ReportType.detailed.value,
+                'generated_at': datetime.now().isoformat(),
+                'records_processed': len(df)
+            },
+            compression=settings.columnar_compression
+        )
+    else:
+        chunks = ReportGenerator.iter_detailed_chunks(df, config.format.value, settings.stream_chunk_size)
+    headers = {**(headers or {}), "X-Records-Processed": str(len(df))}
+    if config.format in STREAM_FILENAMES:
+        headers["Content-Disposition"] = f'attachment; filename="{STREAM_FILENAMES[config.format]}"'
+    return StreamingResponse(
+        chunks,
+        media_type=STREAM_MEDIA_TYPES[config.format],
+        headers=headers
+    )
+
+def _busy_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+def _upstream_error(error: Exception) -> Optional[HTTPException]:
+    """503 for a call the upstream governor refused, 502 for a failed one; None for other errors"""
+    upstream = find_upstream_error(error)
+    if upstream is None:
+        return None
+    headers = {"Retry-After": str(math.ceil(upstream.retry_after))} if upstream.retry_after else None
+    status = 503 if isinstance(upstream, UpstreamUnavailableError) else 502
+    return HTTPException(status_code=status, detail=str(upstream), headers=headers)
+
+def _timeout_error(timeout: int) -> HTTPException:
+    return HTTPException(status_code=504, detail=f"Request exceeded {timeout}s timeout")
+
+async def _query_params_for(query: WaterQualityQuery) -> Dict[str, Any]:
+    """WQP parameters for a query, resolving a bbox to catalogued sites when enabled"""
+    site_no, bbox = query.site_no, query.bbox
+    if get_settings().site_catalog_resolve_bbox and bbox and not site_no:
+        # Turn the bbox into an explicit site list from the local catalog
+        resolved = await _resolve_bbox_sites(query.state_cd, bbox)
+        if resolved:
+            site_no, bbox = resolved, None
+    
+    return USGSDataFetcher.build_wqp_query_params(
+        site_no=site_no,
+        state_cd=query.state_cd,
+        county_cd=query.county_cd,
+        huc=query.huc,
+        bbox=bbox,
+        characteristic_name=query.characteristic_name,
+        start_date=query.start_date,
+        end_date=query.end_date,
+        sample_media=query.sample_media,
+        organization=query.organization
+    )
+
+async def _generate_report(
+    df: pd.DataFrame,
+    md: Optional[Dict[str, Any]],
+    query_params: Dict[str, Any],
+    config: ReportConfig
+) -> Dict[str, Any]:
+    """Build the JSON report body for a cleaned frame"""
+    sampling = (md or {}).get('sampling')
+    site_indexes = await _site_indexes_for(query_params, config)
+    report_data, data_records, records_processed = await get_executor().run(
+        _build_report, df, query_params, config,
+        sampling['population_rows'] if sampling else None,
+        site_indexes
+    )
+    
+    return dict(
+        query_info=query_params,
+        report_type=config.report_type.value,
+        generated_at=datetime.now(),
+        data_summary=report_data,
+        records_processed=records_processed,
+        data=data_records,
+        metadata=md if config.include_metadata else None
+    )
+
+def _rollups_apply(query_params: Dict[str, Any], config: ReportConfig) -> bool:
+    """Whether a report can be combined from stored rollups instead of rows"""
+    settings = get_settings()
+    return (
+        settings.rollups_enabled
+        and settings.result_store_enabled
+        and ResultStore.supports(query_params)
+        and set(_report_sections(config)) <= ROLLUP_SECTIONS
+    )
+
+async def _generate_rollup_report(
+    query_params: Dict[str, Any],
+    config: ReportConfig,
+    gaps: List[Tuple[date, date]]
+) -> Dict[str, Any]:
+    """
+    Build the JSON report body from the local store's rollups
+    
+    The store must already be filled for the query (gaps are the intervals
+    that filling fetched). Rollups cover every stored record in the date
+    range, so max_records does not apply and medians are sketch estimates.
+    """
+    store = get_result_store()
+    executor = get_executor()
+    filter_params, start, end = ResultStore.split_query(query_params)
+    sections = [section.value for section in _report_sections(config)]
+    rollups = {}
+    for section in sections:
+        # Summaries only read a few cell columns; trend medians need the sketches
+        summary = section == ReportSection.summary.value
+        rollups[SECTION_LEVELS[section]] = await executor.run(
+            store.read_rollup, filter_params, start, end, SECTION_LEVELS[section],
+            not summary, SUMMARY_CELL_COLUMNS if summary else None
+        )
+    
+    def build():
+        with time_stage("report_rollups"):
+            return ReportGenerator.generate_rollup_sections(
+                rollups,
+                query_params,
+                sections,
+                granularity=config.trend_granularity.value,
+                by_unit=config.trend_by_unit,
+                trend_statistics=config.trend_statistics
+            )
+    results = await executor.run(build)
+    
+    metadata = {
+        **_store_metadata(gaps),
+        'rollups': {
+            level: {'cells': len(rollup.cells), 'centroids': len(rollup.centroids)}
+            for level, rollup in rollups.items()
+        }
+    }
+    return dict(
+        query_info=query_params,
+        report_type=config.report_type.value,
+        generated_at=datetime.now(),
+        data_summary=results if config.sections else next(iter(results.values()), {}),
+        records_processed=next(iter(rollups.values())).records,
+        data=[],
+        metadata=metadata if config.include_metadata else None
+    )
+
+def _query_validators(
+    query_params: Dict[str, Any],
+    config: ReportConfig,
+    fetched_at: Optional[datetime]
+) -> Optional[Validators]:
+    """
+    Validators of a /query response, known before its report is built
+    
+    The ETag covers the query, the report config and when the data was
+    fetched, so a cached frame or unchanged store answers If-None-Match
+    without generating or serializing the report. Cache-Control allows
+    reuse for what remains of the cache TTL.
+    """
+    if fetched_at is None:
+        return None
+    settings = get_settings()
+    age = (datetime.now(timezone.utc) - fetched_at).total_seconds()
+    max_age = int(settings.cache_ttl - age) if settings.cache_enabled else 0
+    return Validators.for_inputs(
+        make_cache_key(query_params, variant=config.model_dump_json()),
+        fetched_at.isoformat(),
+        last_modified=fetched_at,
+        cache_control=cache_control(max_age, public=False)
+    )
+
+def _fetched_at(md: Optional[Dict[str, Any]]) -> Optional[datetime]:
+    fetched_at = (md or {}).get('fetched_at')
+    return datetime.fromisoformat(fetched_at) if fetched_at else None
+
+@router.post(
+    "/query",
+    response_model=WaterQualityReport,
+    responses={
+        200: {
+            "content": {media_type: {} for media_type in STREAM_MEDIA_TYPES.values()},
+            "description": "JSON report, or streamed rows when format is csv, ndjson, arrow or parquet"
+        }
+    }
+)
 async def query_water_quality(
     query: WaterQualityQuery,
+    request: Request,
+    response: Response,
     config: ReportConfig = ReportConfig()
 ):
     """
     Query water quality data from USGS Water Quality Portal and generate reports
     
     This endpoint allows you to query water quality data with various filters
-    and generate different types of reports (summary, detailed, trend analysis).
+    and generate different types of reports (summary, detailed, trend analysis,
+    comparison of sites by characteristic against optional thresholds, and
+    spatial aggregation by HUC level or lat/lon grid cell for map layers).
+    Detailed reports can be streamed as CSV, NDJSON, Arrow IPC or Parquet by
+    setting the format; Arrow and Parquet carry query_info in their schema
+    metadata.
+    Responses carry an ETag; repeating a request with If-None-Match returns
+    304 while the underlying data is unchanged.
     """
     
-    try:
-        # Build query parameters
-        query_params = USGSDataFetcher.build_wqp_query_params(
-            site_no=query.site_no,
-            state_cd=query.state_cd,
-            county_cd=query.county_cd,
-            huc=query.huc,
-            bbox=query.bbox,
-            characteristic_name=query.characteristic_name,
-            start_date=query.start_date,
-            end_date=query.end_date,
-            sample_media=query.sample_media,
-            organization=query.organization
+    settings = get_settings()
+    executor = get_executor()
+    
+    if config.format in STREAM_MEDIA_TYPES and _report_sections(config) != [ReportSection.detailed]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format '{config.format.value}' is only available for detailed reports"
         )
+    
+    async def run_query():
+        query_params = await _query_params_for(query)
+        if _rollups_apply(query_params, config):
+            filter_params, start, end = ResultStore.split_query(query_params)
+            gaps = await _fill_store(filter_params, start, end)
+            validators = _query_validators(
+                query_params, config, get_result_store().last_modified(filter_params)
+            )
+            if validators is not None and validators.matches(request):
+                return validators.not_modified()
+            report = await _generate_rollup_report(query_params, config, gaps)
+            stale = {}
+        else:
+            df, md = await _get_query_frame(query_params, config)
+            validators = _query_validators(query_params, config, _fetched_at(md))
+            if validators is not None and validators.matches(request):
+                return validators.not_modified()
+            stale = _stale_headers(md)
+            
+            if config.format in STREAM_MEDIA_TYPES:
+                return _stream_report(df, config, query_params, {**(validators.headers() if validators else {}), **stale})
+            
+            report = await _generate_report(df, md, query_params, config)
         
-        # Fetch data from WQP
-        df, md = USGSDataFetcher.fetch_water_quality_data(query_params)
-        
-        # Clean and validate data
-        df = DataProcessor.clean_and_validate_data(df)
-        
-        # Limit records if specified
-        df = DataProcessor.limit_records(df, config.max_records)
-        
-        # Generate report based on type
-        if config.report_type == ReportType.summary:
-            report_data = ReportGenerator.generate_summary_report(df, query_params)
-            data_records = []
-        elif config.report_type == ReportType.detailed:
-            report_data = {}
-            data_records = ReportGenerator.generate_detailed_report(df, query_params)
-        elif config.report_type == ReportType.trend:
-            report_data = ReportGenerator.generate_trend_report(df, query_params)
-            data_records = []
-        else:  # comparison
-            report_data = ReportGenerator.generate_summary_report(df, query_params)
-            data_records = ReportGenerator.generate_detailed_report(df, query_params)[:100]
+        headers = {**(validators.headers() if validators else {}), **stale}
+        # Returning a Response skips response_model validation and encoding;
+        # the model still documents the schema
+        if settings.fast_json_enabled:
+            body = await executor.run(_render_report, report)
+            return Response(content=body, media_type="application/json", headers=headers)
         
         # Create response
-        response = WaterQualityReport(
-            query_info=query_params,
-            report_type=config.report_type.value,
-            generated_at=datetime.now(),
-            data_summary=report_data,
-            records_processed=len(df),
-            data=data_records,
-            metadata=md.to_dict() if config.include_metadata and md is not None else None
+        response.headers.update(headers)
+        with time_stage('validate'):
+            return WaterQualityReport(**report)
+    
+    try:
+        return await asyncio.wait_for(run_query(), timeout=settings.request_timeout)
+    except ExecutorBusyError:
+        raise _busy_error()
+    except asyncio.TimeoutError:
+        raise _timeout_error(settings.request_timeout)
+    except Exception as e:
+        raise _upstream_error(e) or HTTPException(status_code=500, detail=f"Error querying data: {str(e)}")
+
+def _batch_line(index: int, item: BatchQuery, **fields: Any) -> bytes:
+    """One NDJSON line of a batch response (runs on the worker pool)"""
+    with time_stage('serialize'):
+        return serialization.dumps({"index": index, "id": item.id, **fields}) + b"\n"
+
+def _batch_error_line(index: int, item: BatchQuery, error: Exception) -> bytes:
+    upstream = _upstream_error(error)
+    if isinstance(error, ExecutorBusyError):
+        status, detail = 503, _busy_error().detail
+    elif upstream is not None:
+        status, detail = upstream.status_code, upstream.detail
+    else:
+        status, detail = 500, f"Error querying data: {str(error)}"
+    return _batch_line(index, item, status=status, detail=detail)
+
+async def _run_batch_fetch(
+    fetch_number: int,
+    fetch: MergedFetch,
+    items: List[BatchQuery],
+    query_params: List[Dict[str, Any]],
+    semaphore: asyncio.Semaphore,
+    lines: asyncio.Queue
+) -> None:
+    """Fetch one merged query, then queue a result line for each query it covers"""
+    executor = get_executor()
+    try:
+        async with semaphore:
+            df, md = await _get_query_frame(fetch.params, None)
+        index = await executor.run(RowIndex, df)
+    except Exception as e:
+        for i in fetch.members:
+            await lines.put((False, _batch_error_line(i, items[i], e)))
+        return
+    
+    for i in fetch.members:
+        try:
+            with time_stage('fanout'):
+                rows = await executor.run(index.subset, query_params[i])
+            metadata = {
+                **(md or {}),
+                'batch': {'fetch': fetch_number, 'fetch_records': len(df), 'queries_in_fetch': len(fetch.members)}
+            }
+            report = await _generate_report(rows, metadata, query_params[i], items[i].config)
+            line = await executor.run(_batch_line, i, items[i], status=200, report=report)
+            await lines.put((True, line))
+        except Exception as e:
+            await lines.put((False, _batch_error_line(i, items[i], e)))
+
+@router.post(
+    "/batch",
+    responses={200: {"content": {"application/x-ndjson": {}}, "description": "One JSON line per query as it completes, then a summary line"}}
+)
+async def query_water_quality_batch(batch: BatchRequest):
+    """
+    Answer many water quality queries, sharing upstream fetches where they overlap
+    
+    Queries that differ only in sites, characteristics or overlapping date
+    ranges are merged into one WQP fetch, which is cleaned once and split
+    back into each query's rows through an index on monitoring location.
+    Results stream back as NDJSON lines, in completion order, each with
+    the query's index and id and either a report or an error status and
+    detail; a final line summarizes the batch. Reports are built from the
+    full rows of each query, so sample_size is not applied.
+    """
+    
+    settings = get_settings()
+    items = batch.queries
+    if len(items) > settings.batch_max_queries:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can hold at most {settings.batch_max_queries} queries"
         )
-        
-        return response
-        
+    for item in items:
+        if item.config.format in STREAM_MEDIA_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Format '{item.config.format.value}' is not available for batch queries"
+            )
+    
+    try:
+        query_params = [await _query_params_for(item.query) for item in items]
+        fetches = BatchPlanner.plan(query_params)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error querying data: {str(e)}")
+        raise _upstream_error(e) or HTTPException(status_code=500, detail=f"Error planning batch: {str(e)}")
+    
+    async def stream():
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(settings.batch_fetch_concurrency)
+        lines: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(_run_batch_fetch(n, fetch, items, query_params, semaphore, lines))
+            for n, fetch in enumerate(fetches)
+        ]
+        succeeded = 0
+        try:
+            for _ in items:
+                ok, line = await lines.get()
+                succeeded += ok
+                yield line
+            yield serialization.dumps({"summary": {
+                "queries": len(items),
+                "upstream_fetches": len(fetches),
+                "succeeded": succeeded,
+                "failed": len(items) - succeeded,
+                "elapsed_seconds": round(time.perf_counter() - started, 3)
+            }}) + b"\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Queries": str(len(items)), "X-Batch-Fetches": str(len(fetches))}
+    )
+
+async def _run_report_job(job: Job, query_params: Dict[str, Any], config: ReportConfig) -> bytes:
+    """Fetch, report and serialize a job's query, recording its progress"""
+    job.report_progress("fetching", 0.1)
+    if _rollups_apply(query_params, config):
+        gaps = await _fill_store(*ResultStore.split_query(query_params))
+        job.report_progress("generating report", 0.6)
+        report = await _generate_rollup_report(query_params, config, gaps)
+    else:
+        df, md = await _get_query_frame(query_params, config)
+        job.report_progress("generating report", 0.6)
+        report = await _generate_report(df, md, query_params, config)
+    job.report_progress("serializing", 0.85)
+    return await get_executor().run(_render_report, report)
+
+def _job_response(job: Job) -> JobResponse:
+    result_url = f"/water-quality/jobs/{job.id}/result" if job.status == JobStatus.succeeded else None
+    return JobResponse(**job.to_dict(), result_url=result_url)
+
+def _get_job(job_id: str) -> Job:
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found or expired")
+    return job
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_report_job(
+    query: WaterQualityQuery,
+    config: ReportConfig = ReportConfig(),
+    priority: int = Query(5, ge=0, le=9, description="Job priority, 0 runs first")
+):
+    """
+    Queue a report for background generation
+    
+    Use this for queries too large to answer within the request timeout.
+    Submitting a query and config identical to a queued or running job
+    returns that job. Poll the job for progress and fetch its result once
+    it has succeeded.
+    """
+    
+    if config.format in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format '{config.format.value}' is not available for report jobs"
+        )
+    
+    try:
+        query_params = await _query_params_for(query)
+        job = get_job_manager().submit(
+            make_cache_key(query_params, variant=config.model_dump_json()),
+            priority,
+            lambda job: _run_report_job(job, query_params, config)
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        raise _upstream_error(e) or HTTPException(status_code=500, detail=f"Error submitting job: {str(e)}")
+    
+    return _job_response(job)
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_report_job(job_id: str):
+    """Get the status and progress of a report job"""
+    return _job_response(_get_job(job_id))
+
+@router.get(
+    "/jobs/{job_id}/result",
+    response_model=WaterQualityReport,
+    responses={404: {"description": "Unknown or expired job"}, 409: {"description": "Job has not succeeded"}}
+)
+async def get_report_job_result(job_id: str, request: Request):
+    """
+    Get the report produced by a succeeded job
+    
+    Results are stored gzip-compressed and sent as-is to clients that
+    accept gzip.
+    """
+    
+    manager = get_job_manager()
+    job = _get_job(job_id)
+    if job.status != JobStatus.succeeded:
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {job.status.value}")
+    
+    try:
+        body = await get_executor().run(manager.read_result, job)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Result for job '{job_id}' has expired")
+    
+    headers = {"Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_report_job(job_id: str):
+    """
+    Cancel a queued or running report job
+    
+    Deleting a finished job removes it and its stored result.
+    """
+    
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found or expired")
+    return _job_response(job)
 
 @router.get("/sites", response_model=SitesResponse)
 async def get_monitoring_sites(
+    request: Request,
+    response: Response,
     state_cd: List[str] = Query(["CA"], description="State codes"),
     site_type: List[str] = Query(["Stream"], description="Site types"),
-    has_data_since: Optional[date] = Query(None, description="Sites with data since this date")
+    has_data_since: Optional[date] = Query(None, description="Sites with data since this date"),
+    bbox: Optional[List[float]] = Query(None, description="Bounding box [minx, miny, maxx, maxy]"),
+    latitude: Optional[float] = Query(None, description="Latitude of radius search center"),
+    longitude: Optional[float] = Query(None, description="Longitude of radius search center"),
+    radius_km: Optional[float] = Query(None, gt=0, description="Radius search distance in kilometers"),
+    huc: Optional[str] = Query(None, description="Hydrologic Unit Code or prefix")
 ):
     """
     Get information about monitoring sites
     
     Returns metadata about water quality monitoring sites including
-    location, site type, and data availability.
+    location, site type, and data availability. Sites are served from an
+    in-memory catalog unless has_data_since requires an upstream query.
+    Catalog responses are validated by when the state indexes were built,
+    so If-None-Match returns 304 without searching.
     """
     
+    if bbox is not None and len(bbox) != 4:
+        raise HTTPException(status_code=400, detail="bbox must have four values: minx, miny, maxx, maxy")
+    if (latitude is None, longitude is None, radius_km is None).count(True) not in (0, 3):
+        raise HTTPException(status_code=400, detail="latitude, longitude and radius_km must be given together")
+    
+    settings = get_settings()
+    catalog = get_site_catalog()
+    filters = {
+        'bbox': bbox,
+        'latitude': latitude,
+        'longitude': longitude,
+        'radius_km': radius_km,
+        'huc': huc
+    }
+    
+    policy = cache_control(settings.cache_ttl)
+    
+    async def search_sites():
+        if has_data_since is None and catalog.covers(site_type):
+            indexes = [await catalog.get(state) for state in state_cd]
+            built = [index.built_at for index in indexes]
+            validators = Validators.for_inputs(
+                state_cd, site_type, filters, built,
+                last_modified=max(built, default=None), cache_control=policy
+            )
+            if validators.matches(request):
+                return None, validators
+            site_codes = [SITE_TYPE_CODES.get(st, st) for st in site_type]
+            records = []
+            for index in indexes:
+                records.extend(index.records_at(index.search(site_types=site_codes, **filters)))
+            return records, validators
+        records = await get_executor().run(
+            _search_upstream_sites, state_cd, site_type, has_data_since, filters
+        )
+        validators = Validators.for_content(serialization.dumps(records), cache_control=policy)
+        return records, validators
+    
     try:
-        sites_df = USGSDataFetcher.fetch_site_info(state_cd, site_type, has_data_since)
+        sites_records, validators = await asyncio.wait_for(search_sites(), timeout=settings.request_timeout)
+        if sites_records is None or validators.matches(request):
+            return validators.not_modified()
+        response.headers.update(validators.headers())
         
-        if sites_df.empty:
+        if not sites_records:
             return SitesResponse(sites=[], count=0, query_params={})
         
-        # Convert to records
-        sites_records = sites_df.to_dict('records')
-        
-        # Clean up records
-        for record in sites_records:
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = None
-        
         query_params = {
             'stateCd': state_cd,
             'siteType': site_type
         }
         if has_data_since:
             query_params['startDt'] = has_data_since.strftime('%Y-%m-%d')
+        query_params.update({key: value for key, value in filters.items() if value is not None})
         
         return SitesResponse(
             sites=sites_records,
@@ -121,11 +1024,23 @@ async def get_monitoring_sites(
             query_params=query_params
         )
         
+    except ExecutorBusyError:
+        raise _busy_error()
+    except asyncio.TimeoutError:
+        raise _timeout_error(settings.request_timeout)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving sites: {str(e)}")
+        raise _upstream_error(e) or HTTPException(status_code=500, detail=f"Error retrieving sites: {str(e)}")
+
+def _static_validators(content: Any) -> Validators:
+    """Validators of a response that only changes with a deploy"""
+    return Validators.for_content(
+        serialization.dumps(content),
+        last_modified=STARTED_AT,
+        cache_control=cache_control(get_settings().cache_ttl)
+    )
 
 @router.get("/parameters", response_model=ParametersResponse)
-async def get_available_parameters():
+async def get_available_parameters(request: Request, response: Response):
     """
     Get list of available water quality parameters
     
@@ -153,14 +1068,19 @@ async def get_available_parameters():
         ]
     }
     
-    return ParametersResponse(
+    result = ParametersResponse(
         parameters=parameters,
         total_categories=len(parameters),
         usage_note="Use these parameter names in the 'characteristic_name' field when querying data"
     )
+    validators = _static_validators(result.model_dump())
+    if validators.matches(request):
+        return validators.not_modified()
+    response.headers.update(validators.headers())
+    return result
 
 @router.get("/example-queries")
-async def get_example_queries():
+async def get_example_queries(request: Request, response: Response):
     """
     Get example queries for different use cases
     
@@ -211,7 +1131,12 @@ async def get_example_queries():
         }
     }
     
-    return {
+    result = {
         "examples": examples,
         "note": "Use these examples as templates for your own queries"
-    }
\ No newline at end of file
+    }
+    validators = _static_validators(result)
+    if validators.matches(request):
+        return validators.not_modified()
+    response.headers.update(validators.headers())
+    return result
\ No newline at end of file
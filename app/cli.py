@@ -0,0 +1,76 @@
+"""
+Command line entry points
+"""
+import argparse
+import json
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import get_settings
+from app.core.data_fetcher import USGSDataFetcher
+from app.core.data_processor import DataProcessor, ALL_REPORT_COLUMNS
+from app.core.result_store import ResultStore, get_result_store
+from app.models.requests import WaterQualityQuery
+
+
+def load_regions(path: Path) -> List[WaterQualityQuery]:
+    """Read a JSON list of WaterQualityQuery objects describing regions to keep warm"""
+    return [WaterQualityQuery(**region) for region in json.loads(path.read_text())]
+
+
+def warm_store(regions: List[WaterQualityQuery], default_days: int) -> None:
+    """Fetch any missing date intervals for each region into the result store"""
+    store = get_result_store()
+    for region in regions:
+        start = region.start_date or date.today() - timedelta(days=default_days)
+        query_params = USGSDataFetcher.build_wqp_query_params(
+            site_no=region.site_no,
+            state_cd=region.state_cd,
+            county_cd=region.county_cd,
+            huc=region.huc,
+            bbox=region.bbox,
+            characteristic_name=region.characteristic_name,
+            start_date=start,
+            end_date=region.end_date,
+            sample_media=region.sample_media,
+            organization=region.organization
+        )
+        filter_params, start, end = ResultStore.split_query(query_params)
+
+        for gap_start, gap_end in store.missing_intervals(filter_params, start, end):
+            gap_params = {**filter_params, **ResultStore.date_params(gap_start, gap_end)}
+            df, _ = USGSDataFetcher.fetch_water_quality_data(gap_params)
+            df = DataProcessor.clean_and_validate_data(df, columns=ALL_REPORT_COLUMNS)
+            rows = store.ingest(filter_params, df, gap_start, gap_end)
+            print(f"{json.dumps(filter_params, sort_keys=True)} {gap_start}..{gap_end}: {rows} rows")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    warm = commands.add_parser("warm-store", help="Pre-fetch configured regions into the local result store")
+    warm.add_argument(
+        "--regions",
+        type=Path,
+        default=settings.result_store_regions_file,
+        help="JSON file with a list of WaterQualityQuery objects (default: RESULT_STORE_REGIONS_FILE)"
+    )
+    warm.add_argument(
+        "--days",
+        type=int,
+        default=365,
+        help="History to fetch for regions without a start_date"
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "warm-store":
+        if args.regions is None:
+            parser.error("--regions is required when RESULT_STORE_REGIONS_FILE is not set")
+        warm_store(load_regions(Path(args.regions)), args.days)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,19 +19,111 @@ class Settings(BaseSettings):
     # Database/Cache Configuration
     redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
     cache_ttl: int = Field(default=3600, env="CACHE_TTL")
+    cache_enabled: bool = Field(default=True, env="CACHE_ENABLED")
+    cache_max_entries: int = Field(default=256, env="CACHE_MAX_ENTRIES")
+    cache_max_bytes: int = Field(default=256 * 1024 * 1024, env="CACHE_MAX_BYTES")
+    # Expired entries are kept this long to answer queries while upstream is unavailable
+    cache_stale_seconds: int = Field(default=86400, env="CACHE_STALE_SECONDS")
     
     # USGS API Configuration
     usgs_base_url: str = "https://waterqualitydata.us"
+    nwis_base_url: str = Field(default="https://waterservices.usgs.gov/nwis", env="NWIS_BASE_URL")
     max_records_per_request: int = 10000
     request_timeout: int = 30
     
+    # Pooled keep-alive HTTP client for upstream requests (one-off requests calls are the fallback)
+    upstream_client_enabled: bool = Field(default=True, env="UPSTREAM_CLIENT_ENABLED")
+    upstream_max_connections: int = Field(default=32, env="UPSTREAM_MAX_CONNECTIONS")
+    upstream_max_connections_per_host: int = Field(default=8, env="UPSTREAM_MAX_CONNECTIONS_PER_HOST")
+    upstream_http2: bool = Field(default=True, env="UPSTREAM_HTTP2")
+    
+    # Upstream governor: token bucket, AIMD concurrency (up to the per-host limit) and circuit breaker, per source and worker
+    upstream_governor_enabled: bool = Field(default=True, env="UPSTREAM_GOVERNOR_ENABLED")
+    upstream_rate_limit: float = Field(default=10.0, env="UPSTREAM_RATE_LIMIT")  # calls per second; 0 disables
+    upstream_rate_burst: int = Field(default=20, env="UPSTREAM_RATE_BURST")
+    upstream_min_concurrency: int = Field(default=1, env="UPSTREAM_MIN_CONCURRENCY")
+    upstream_target_latency: float = Field(default=10.0, env="UPSTREAM_TARGET_LATENCY")
+    upstream_breaker_failures: int = Field(default=5, env="UPSTREAM_BREAKER_FAILURES")
+    upstream_breaker_reset_seconds: float = Field(default=30.0, env="UPSTREAM_BREAKER_RESET_SECONDS")
+    upstream_max_wait_seconds: float = Field(default=10.0, env="UPSTREAM_MAX_WAIT_SECONDS")
+    
+    # Worker pool for blocking fetches and pandas processing
+    worker_pool_size: int = Field(default=4, env="WORKER_POOL_SIZE")
+    worker_queue_size: int = Field(default=32, env="WORKER_QUEUE_SIZE")
+    
+    # Sharding of large WQP queries
+    query_shard_window_days: int = Field(default=180, env="QUERY_SHARD_WINDOW_DAYS")
+    query_shard_max_sites: int = Field(default=100, env="QUERY_SHARD_MAX_SITES")
+    query_max_shards: int = Field(default=32, env="QUERY_MAX_SHARDS")
+    query_shard_concurrency: int = Field(default=4, env="QUERY_SHARD_CONCURRENCY")
+    query_shard_retries: int = Field(default=2, env="QUERY_SHARD_RETRIES")
+    query_shard_backoff: float = Field(default=0.5, env="QUERY_SHARD_BACKOFF")
+    
+    # Queries limited to this many records stream WQP results and stop early
+    early_termination_max_records: int = Field(default=50000, env="EARLY_TERMINATION_MAX_RECORDS")
+    fetch_chunk_size: int = Field(default=10000, env="FETCH_CHUNK_SIZE")
+    
+    # Local Parquet store answering date-bounded queries
+    result_store_enabled: bool = Field(default=False, env="RESULT_STORE_ENABLED")
+    result_store_path: str = Field(default="data/result-store", env="RESULT_STORE_PATH")
+    result_store_refresh_days: int = Field(default=7, env="RESULT_STORE_REFRESH_DAYS")
+    result_store_regions_file: Optional[str] = Field(default=None, env="RESULT_STORE_REGIONS_FILE")
+    rollups_enabled: bool = Field(default=False, env="ROLLUPS_ENABLED")
+    rollup_sketch_size: int = Field(default=32, env="ROLLUP_SKETCH_SIZE")
+    
+    # In-memory site catalog serving /water-quality/sites
+    site_catalog_states: List[str] = Field(default=["CA"], env="SITE_CATALOG_STATES")
+    site_catalog_site_types: List[str] = Field(default=["Stream", "Lake", "Groundwater"], env="SITE_CATALOG_SITE_TYPES")
+    site_catalog_refresh_seconds: int = Field(default=86400, env="SITE_CATALOG_REFRESH_SECONDS")
+    site_catalog_cell_degrees: float = Field(default=0.25, env="SITE_CATALOG_CELL_DEGREES")
+    site_catalog_resolve_bbox: bool = Field(default=False, env="SITE_CATALOG_RESOLVE_BBOX")
+    
+    # Include per-stage DataFrame memory usage in query metadata
+    report_memory_usage: bool = Field(default=False, env="REPORT_MEMORY_USAGE")
+    
+    # Rows serialized per chunk for streamed CSV/NDJSON reports
+    stream_chunk_size: int = Field(default=5000, env="STREAM_CHUNK_SIZE")
+    
+    # Rows per record batch / row group and compression codec of Arrow and Parquet reports
+    columnar_batch_rows: int = Field(default=65536, env="COLUMNAR_BATCH_ROWS")
+    columnar_compression: Optional[str] = Field(default="zstd", env="COLUMNAR_COMPRESSION")
+    
+    # Serialize JSON reports directly to bytes instead of through the response model
+    fast_json_enabled: bool = Field(default=True, env="FAST_JSON_ENABLED")
+    
     # Logging
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     
+    # Background Report Jobs
+    jobs_workers: int = Field(default=2, env="JOBS_WORKERS")
+    jobs_max_queue: int = Field(default=100, env="JOBS_MAX_QUEUE")
+    jobs_result_path: str = Field(default="data/jobs", env="JOBS_RESULT_PATH")
+    jobs_result_ttl: int = Field(default=86400, env="JOBS_RESULT_TTL")
+    jobs_timeout: int = Field(default=1800, env="JOBS_TIMEOUT")
+    
+    # Batch queries (POST /water-quality/batch)
+    batch_max_queries: int = Field(default=500, env="BATCH_MAX_QUERIES")
+    batch_fetch_concurrency: int = Field(default=2, env="BATCH_FETCH_CONCURRENCY")
+    
+    # Multi-worker production server (python -m app.server)
+    server_host: str = Field(default="0.0.0.0", env="SERVER_HOST")
+    server_port: int = Field(default=8000, env="SERVER_PORT")
+    server_workers: int = Field(default=0, env="SERVER_WORKERS")  # 0 starts one per available CPU
+    server_graceful_timeout: int = Field(default=30, env="SERVER_GRACEFUL_TIMEOUT")
+    server_worker_max_memory_mb: int = Field(default=2048, env="SERVER_WORKER_MAX_MEMORY_MB")  # 0 disables recycling
+    server_memory_check_seconds: float = Field(default=10, env="SERVER_MEMORY_CHECK_SECONDS")
+    # Socket of the cache and load claims shared by workers; set by app.server
+    shared_state_socket: Optional[str] = Field(default=None, env="SHARED_STATE_SOCKET")
+    shared_state_lease_seconds: int = Field(default=120, env="SHARED_STATE_LEASE_SECONDS")
+    
     # Monitoring
     sentry_dsn: Optional[str] = Field(default=None, env="SENTRY_DSN")
     enable_metrics: bool = Field(default=True, env="ENABLE_METRICS")
     
+    # Sampling profiler, enabled per request with an X-Profile header
+    profiling_enabled: bool = Field(default=False, env="PROFILING_ENABLED")
+    profiling_interval: float = Field(default=0.005, env="PROFILING_INTERVAL")
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
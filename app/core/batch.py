@@ -0,0 +1,131 @@
+"""
+Batch query planning: merging overlapping WQP queries into shared fetches
+and fanning the merged rows back out to each query
+"""
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.query_planner import QueryPlanner
+
+# WQP parameters widened to cover every query in a merged fetch; all other
+# parameters must be equal for queries to share a fetch
+MERGED_KEYS = ('siteid', 'characteristicName', 'startDateLo', 'startDateHi')
+
+
+class MergedFetch:
+    """One upstream query covering several batch queries"""
+
+    def __init__(self, params: Dict[str, Any], members: List[int]):
+        self.params = params
+        self.members = members
+
+
+class RowIndex:
+    """
+    Row positions of a cleaned frame grouped by monitoring location
+
+    Built once per merged frame with one stable sort of the site codes, so
+    each query's rows are gathered from the slices of its own sites.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        sites = df['MonitoringLocationIdentifier'] if len(df) else pd.Series([], dtype='category')
+        if not isinstance(sites.dtype, pd.CategoricalDtype):
+            sites = sites.astype('category')
+        codes = sites.cat.codes.to_numpy()
+        self.sites = sites.cat.categories
+        self.order = np.argsort(codes, kind='stable')
+        # Missing sites (-1) sort first and belong to no slice
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.sites))
+        self.bounds = np.concatenate([[0], np.cumsum(counts)]) + int((codes < 0).sum())
+
+    def positions(self, site_ids: Optional[List[str]]) -> np.ndarray:
+        """Positions, in frame order, of the rows at any of site_ids (all rows when None)"""
+        if site_ids is None:
+            return np.arange(len(self.df))
+        found = self.sites.get_indexer(list(dict.fromkeys(site_ids)))
+        found = found[found >= 0]
+        if not len(found):
+            return np.array([], dtype='int64')
+        return np.sort(np.concatenate([self.order[self.bounds[i]:self.bounds[i + 1]] for i in found]))
+
+    def subset(self, params: Dict[str, Any]) -> pd.DataFrame:
+        """Rows of the merged frame matching one query's site, characteristic and date filters"""
+        rows = self.df.take(self.positions(params.get('siteid')))
+        mask = np.ones(len(rows), dtype=bool)
+        if params.get('characteristicName') and 'CharacteristicName' in rows.columns:
+            mask &= rows['CharacteristicName'].isin(params['characteristicName']).to_numpy()
+        if 'ActivityStartDate' in rows.columns:
+            dates = rows['ActivityStartDate']
+            if params.get('startDateLo'):
+                mask &= (dates >= pd.Timestamp(QueryPlanner._parse_date(params['startDateLo']))).to_numpy()
+            if params.get('startDateHi'):
+                mask &= (dates <= pd.Timestamp(QueryPlanner._parse_date(params['startDateHi']))).to_numpy()
+        return rows if mask.all() else rows[mask]
+
+
+class BatchPlanner:
+    """Merges the WQP parameters of batch queries into the fewest fetches"""
+
+    @staticmethod
+    def _date_range(params: Dict[str, Any]) -> tuple:
+        lo, hi = params.get('startDateLo'), params.get('startDateHi')
+        return (
+            QueryPlanner._parse_date(lo) if lo else date.min,
+            QueryPlanner._parse_date(hi) if hi else date.max
+        )
+
+    @staticmethod
+    def _merge_params(queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Parameters of a fetch returning every row of each query"""
+        params = {key: value for key, value in queries[0].items() if key not in MERGED_KEYS}
+        for key in ('siteid', 'characteristicName'):
+            # A query without the filter needs all values
+            if all(query.get(key) for query in queries):
+                params[key] = sorted({value for query in queries for value in query[key]})
+        ranges = [BatchPlanner._date_range(query) for query in queries]
+        start, end = min(lo for lo, _ in ranges), max(hi for _, hi in ranges)
+        if start != date.min:
+            params['startDateLo'] = QueryPlanner._format_date(start)
+        if end != date.max:
+            params['startDateHi'] = QueryPlanner._format_date(end)
+        return params
+
+    @staticmethod
+    def plan(queries: List[Dict[str, Any]]) -> List[MergedFetch]:
+        """
+        Group queries into merged fetches
+
+        Queries share a fetch when they agree on every parameter outside
+        MERGED_KEYS and their date ranges overlap or touch; site lists and
+        characteristics of a fetch are the union of its queries'. Disjoint
+        date ranges are fetched separately rather than filling the gap.
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            shared = {key: value for key, value in query.items() if key not in MERGED_KEYS}
+            groups.setdefault(json.dumps(shared, sort_keys=True, default=str), []).append(i)
+
+        fetches = []
+        for members in groups.values():
+            members = sorted(members, key=lambda i: BatchPlanner._date_range(queries[i]))
+            cluster: List[int] = []
+            cluster_end = date.min
+            for i in members:
+                start, end = BatchPlanner._date_range(queries[i])
+                if cluster and cluster_end != date.max and start > cluster_end + timedelta(days=1):
+                    fetches.append(cluster)
+                    cluster = []
+                cluster.append(i)
+                cluster_end = max(cluster_end, end)
+            fetches.append(cluster)
+
+        return [
+            MergedFetch(BatchPlanner._merge_params([queries[i] for i in members]), sorted(members))
+            for members in fetches
+        ]
@@ -0,0 +1,341 @@
+"""
+Query result caching functionality
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.config import get_settings
+from app.core import serialization
+from app.core.shared_state import SharedStateClient, get_shared_state
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is an optional dependency
+    aioredis = None
+
+CachedResult = Tuple[pd.DataFrame, Optional[Dict[str, Any]]]
+
+# WQP date parameters are sent as MM-DD-YYYY; keys use ISO dates instead
+DATE_PARAMS = ('startDateLo', 'startDateHi')
+
+# Parquet schema metadata key holding a cached result's metadata as JSON
+METADATA_KEY = b'wqp_metadata'
+PARQUET_MAGIC = b'PAR1'
+
+
+def make_cache_key(query_params: Dict[str, Any], variant: Optional[str] = None) -> str:
+    """
+    Build a stable cache key from WQP query parameters
+    
+    variant distinguishes partial results of the same query, such as a
+    row-limited or sampled fetch, from the full result.
+    """
+    canonical = {}
+    for key, value in query_params.items():
+        if value is None or value == [] or value == '':
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted({str(item).strip() for item in value})
+        elif key in DATE_PARAMS:
+            value = datetime.strptime(value, '%m-%d-%Y').date().isoformat()
+        canonical[key] = value
+    if variant:
+        canonical['__variant__'] = variant
+
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return 'wqp:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def serialize_result(df: pd.DataFrame, metadata: Optional[Dict[str, Any]]) -> bytes:
+    """
+    Serialize a cleaned DataFrame and its metadata to compressed bytes
+    
+    The frame is written as zstd-compressed Parquet, whose dictionary
+    encoding keeps repeated strings small, with pandas' dtype and index
+    metadata; the metadata is stored as JSON in the schema metadata. Blobs
+    are shared with other workers and Redis, so reading one back must never
+    run code.
+    """
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        METADATA_KEY: serialization.dumps(metadata)
+    })
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression='zstd')
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_result(blob: bytes) -> CachedResult:
+    """Inverse of serialize_result"""
+    table = pq.read_table(pa.BufferReader(blob))
+    metadata = orjson.loads(table.schema.metadata[METADATA_KEY])
+    return table.to_pandas(), metadata
+
+
+class QueryCache:
+    """
+    Tiered cache for cleaned WQP results
+
+    Entries live in an in-process LRU, then in the LRU shared by the
+    server's workers (when running multi-worker), then optionally Redis.
+    """
+
+    def __init__(
+        self,
+        ttl: int,
+        max_entries: int,
+        max_bytes: int,
+        redis_url: Optional[str] = None,
+        shared: Optional[SharedStateClient] = None,
+        lease: float = 120,
+        stale_ttl: int = 0
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, "asyncio.Future[bytes]"] = {}
+        self._redis = aioredis.from_url(redis_url) if redis_url and aioredis else None
+        self._shared = shared
+        self.lease = lease
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "stale_hits": self.stale_hits,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "shared_enabled": self._shared is not None,
+            "redis_enabled": self._redis is not None
+        }
+
+    def _get_local(self, key: str) -> Optional[bytes]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, blob = item
+        if expires_at < time.monotonic():
+            # Expired entries stay for stale_ttl, until LRU eviction, for get_stale
+            if expires_at + self.stale_ttl < time.monotonic():
+                self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return blob
+
+    def _set_local(self, key: str, blob: bytes) -> None:
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, blob)
+        self._bytes += len(blob)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        _, blob = self._entries.pop(key)
+        self._bytes -= len(blob)
+
+    async def get_blob(self, key: str) -> Optional[bytes]:
+        """Look up a serialized result in the local tier, then the shared tier, then Redis"""
+        blob = self._get_local(key)
+        if blob is not None:
+            self.hits += 1
+            return blob
+
+        if self._shared is not None:
+            blob = await asyncio.to_thread(self._shared.get, key)
+            if blob is not None:
+                self.shared_hits += 1
+                self._set_local(key, blob)
+                return blob
+
+        if self._redis is not None:
+            try:
+                blob = await self._redis.get(key)
+            except Exception:
+                blob = None
+            # Entries written by older versions in another format are misses
+            if blob is not None and blob.startswith(PARQUET_MAGIC):
+                self.redis_hits += 1
+                self._set_local(key, blob)
+                return blob
+
+        return None
+
+    async def set_blob(self, key: str, blob: bytes) -> None:
+        """Store a serialized result in every tier"""
+        self._set_local(key, blob)
+        if self._shared is not None:
+            await asyncio.to_thread(self._shared.set, key, blob, self.ttl)
+        if self._redis is not None:
+            try:
+                await self._redis.set(key, blob, ex=self.ttl)
+            except Exception:
+                pass
+
+    async def get(
+        self,
+        query_params: Dict[str, Any],
+        variant: Optional[str] = None
+    ) -> Optional[CachedResult]:
+        """Return a cached result without loading on a miss"""
+        blob = await self.get_blob(make_cache_key(query_params, variant))
+        return deserialize_result(blob) if blob is not None else None
+
+    def get_stale(
+        self,
+        query_params: Dict[str, Any],
+        variant: Optional[str] = None
+    ) -> Optional[Tuple[CachedResult, float]]:
+        """
+        A local result for query_params even if expired (within stale_ttl), with its age in seconds
+        
+        Used to answer while upstream is unavailable.
+        """
+        key = make_cache_key(query_params, variant)
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, blob = item
+        now = time.monotonic()
+        if expires_at + self.stale_ttl < now:
+            self._discard(key)
+            return None
+        self.stale_hits += 1
+        return deserialize_result(blob), now - (expires_at - self.ttl)
+
+    async def get_or_load(
+        self,
+        query_params: Dict[str, Any],
+        loader: Callable[[], Awaitable[CachedResult]],
+        variant: Optional[str] = None
+    ) -> CachedResult:
+        """
+        Return the cached result for query_params, calling loader on a miss.
+
+        Concurrent callers asking for the same key while a load is in flight
+        wait for that load instead of starting their own, including loads in
+        other workers of the server. Every caller gets its own deserialized
+        copy, so downstream mutation is safe.
+        """
+        key = make_cache_key(query_params, variant)
+
+        blob = await self.get_blob(key)
+        if blob is not None:
+            return deserialize_result(blob)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                blob = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leading request was cancelled; take over the load
+                return await self.get_or_load(query_params, loader, variant)
+            return deserialize_result(blob)
+
+        future: "asyncio.Future[bytes]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        claimed = False
+        try:
+            if self._shared is not None:
+                blob = await self._claim_shared(key)
+                if blob is not None:
+                    self.coalesced += 1
+                    self._set_local(key, blob)
+                    future.set_result(blob)
+                    return deserialize_result(blob)
+                claimed = True
+            self.misses += 1
+            df, metadata = await loader()
+            blob = serialize_result(df, metadata)
+            await self.set_blob(key, blob)
+            future.set_result(blob)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            if claimed:
+                await asyncio.to_thread(self._shared.release, key)
+
+        return deserialize_result(blob)
+
+    async def _claim_shared(self, key: str) -> Optional[bytes]:
+        """
+        Claim the load of key across workers, or wait for the worker loading it
+
+        Returns the blob another worker stored, or None once this worker
+        holds the claim. A claim lapses after lease seconds, so a worker
+        that dies mid-load only delays the others.
+        """
+        delay = 0.05
+        while True:
+            if await asyncio.to_thread(self._shared.claim, key, self.lease):
+                # The previous holder may have stored its result just before releasing
+                blob = await asyncio.to_thread(self._shared.get, key)
+                if blob is not None:
+                    await asyncio.to_thread(self._shared.release, key)
+                return blob
+            blob = await asyncio.to_thread(self._shared.get, key)
+            if blob is not None:
+                return blob
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def clear(self) -> None:
+        """Drop all local entries"""
+        self._entries.clear()
+        self._bytes = 0
+
+
+@lru_cache()
+def get_query_cache() -> QueryCache:
+    settings = get_settings()
+    return QueryCache(
+        ttl=settings.cache_ttl,
+        max_entries=settings.cache_max_entries,
+        max_bytes=settings.cache_max_bytes,
+        redis_url=settings.redis_url,
+        shared=get_shared_state(),
+        lease=settings.shared_state_lease_seconds,
+        stale_ttl=settings.cache_stale_seconds
+    )
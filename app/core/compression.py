@@ -0,0 +1,96 @@
+"""
+Response compression that passes through already-compressed media types
+"""
+import zlib
+from typing import Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Server-sent events must reach the client unbuffered
+ALWAYS_EXCLUDED_MEDIA_TYPES = ("text/event-stream",)
+
+
+class GZipMiddleware:
+    """
+    Gzip responses for clients that accept it
+
+    The first body message decides: responses that are already encoded, of
+    an excluded media type, or sent whole in fewer than minimum_size bytes
+    pass through unchanged. Arrow and Parquet bodies are compressed by their
+    writers; gzipping them again costs CPU for no reduction in size. Each
+    chunk of a streamed response is compressed and flushed as it is sent,
+    so streamed lines (e.g. batch results) reach the client without waiting
+    for the compressor to fill. Only the ASGI message protocol is relied on.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        compresslevel: int = 9,
+        excluded_media_types: Sequence[str] = ()
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.excluded_media_types = ALWAYS_EXCLUDED_MEDIA_TYPES + tuple(excluded_media_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("accept-encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held until the first body message shows whether to compress
+                start = {**message, "headers": list(message.get("headers", []))}
+                return
+            if passthrough or message["type"] != "http.response.body":
+                if start is not None:
+                    passthrough = True
+                    await send(start)
+                    start = None
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(self.excluded_media_types)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+
+                compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+                headers["Content-Encoding"] = "gzip"
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.compress(body) + compressor.flush()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body, "more_body": False})
+                    start = None
+                    return
+                await send(start)
+                start = None
+
+            flush_mode = zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH
+            data = compressor.compress(body) + compressor.flush(flush_mode)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
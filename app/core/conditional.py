@@ -0,0 +1,81 @@
+"""
+Conditional request support: ETags, Last-Modified and Cache-Control
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+from app.config import get_settings
+
+# Last-Modified of responses that only change with a deploy
+STARTED_AT = datetime.now(timezone.utc)
+
+
+def cache_control(max_age: int, public: bool = True) -> str:
+    """Cache-Control value allowing caches to reuse a response for max_age seconds"""
+    if max_age <= 0:
+        return "no-cache"
+    return f"{'public' if public else 'private'}, max-age={max_age}"
+
+
+class Validators:
+    """ETag and Last-Modified of a response, plus its Cache-Control policy"""
+
+    def __init__(self, etag: str, last_modified: Optional[datetime] = None, cache_control: Optional[str] = None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+
+    @staticmethod
+    def for_content(body: bytes, **kwargs: Any) -> 'Validators':
+        """Strong ETag from the bytes of a response body"""
+        return Validators(f'"{hashlib.sha256(body).hexdigest()[:32]}"', **kwargs)
+
+    @staticmethod
+    def for_inputs(*parts: Any, **kwargs: Any) -> 'Validators':
+        """
+        Weak ETag from whatever determines a response, known before it is built
+
+        The app version is included, so a deploy that changes report output
+        also changes every ETag.
+        """
+        payload = json.dumps([get_settings().version, *parts], sort_keys=True, default=str)
+        return Validators(f'W/"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"', **kwargs)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified.astimezone(timezone.utc), usegmt=True)
+        if self.cache_control is not None:
+            headers["Cache-Control"] = self.cache_control
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        """
+        Whether the client's copy is current
+
+        If-None-Match is compared weakly and, when present, takes precedence
+        over If-Modified-Since.
+        """
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.last_modified.replace(microsecond=0) <= since
+        return False
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers())
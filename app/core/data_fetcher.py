@@ -1,12 +1,25 @@
 """
 USGS data fetching functionality
 """
+import io
 import pandas as pd
-import dataretrieval.nwis as nwis
-import dataretrieval.wqp as wqp
-from typing import Dict, Any, Tuple, Optional, List
+import requests
+from typing import Dict, Any, Iterator, Tuple, Optional, List
 from datetime import date
 
+from app.config import get_settings
+from app.core.governor import governed
+from app.core.metrics import observe_upstream
+from app.core.upstream import get_upstream_client, upstream_headers
+
+# Map site types to USGS codes
+SITE_TYPE_CODES = {
+    'Stream': 'ST',
+    'Lake': 'LK', 
+    'Groundwater': 'GW',
+    # Add more mappings as needed
+}
+
 class USGSDataFetcher:
     """Handles fetching data from USGS APIs"""
     
@@ -50,9 +63,118 @@ class USGSDataFetcher:
         return query_params
     
     @staticmethod
-    def fetch_water_quality_data(query_params: Dict[str, Any]) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
-        """Fetch water quality data from WQP"""
-        return wqp.get_results(**query_params)
+    def fetch_water_quality_data(query_params: Dict[str, Any]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Fetch all WQP results for a query, with the response url, headers and elapsed time
+        
+        Read through iter_water_quality_chunks, so the call has a timeout and
+        error statuses raise and count against the WQP governor.
+        """
+        stream_info: Dict[str, Any] = {}
+        chunks = list(USGSDataFetcher.iter_water_quality_chunks(
+            query_params, get_settings().fetch_chunk_size, stream_info
+        ))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        return df, stream_info
+    
+    @staticmethod
+    def iter_water_quality_chunks(
+        query_params: Dict[str, Any],
+        chunk_size: int,
+        stream_info: Optional[Dict[str, Any]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Stream WQP results as DataFrame chunks parsed from the CSV response
+        
+        The connection is closed as soon as the caller stops iterating (or
+        closes the generator), so no more of the response is downloaded than
+        was consumed. stream_info, when given, receives the response url,
+        headers and elapsed time once the response starts.
+        
+        Uses the shared pooled client when it is running (inside the app),
+        and a one-off requests connection otherwise. Either way the call is
+        admitted by the WQP governor and held until the stream is closed.
+        """
+        settings = get_settings()
+        url = f"{settings.usgs_base_url.rstrip('/')}/data/Result/search"
+        payload = {
+            key: ';'.join(map(str, value)) if isinstance(value, (list, tuple)) else value
+            for key, value in query_params.items()
+        }
+        payload['mimeType'] = 'csv'
+        
+        client = get_upstream_client()
+        if client.running:
+            yield from USGSDataFetcher._iter_pooled_chunks(client, url, payload, chunk_size, stream_info)
+            return
+        with governed('wqp') as permit, requests.get(
+            url, params=payload, headers=upstream_headers(), stream=True,
+            timeout=settings.request_timeout
+        ) as response:
+            permit.responded()
+            if response.status_code in (400, 404):
+                raise ValueError(f"WQP returned {response.status_code} for {response.url}")
+            response.raise_for_status()
+            if stream_info is not None:
+                stream_info['url'] = response.url
+                stream_info['query_time_seconds'] = response.elapsed.total_seconds()
+                stream_info['header'] = dict(response.headers)
+            
+            response.raw.decode_content = True
+            rows = 0
+            try:
+                reader = pd.read_csv(response.raw, chunksize=chunk_size, low_memory=False)
+                for chunk in reader:
+                    rows += len(chunk)
+                    yield chunk
+            except pd.errors.EmptyDataError:
+                return
+            finally:
+                # Bytes read off the wire, before gzip decoding
+                observe_upstream('wqp', rows, response.raw.tell())
+    
+    @staticmethod
+    def _iter_pooled_chunks(
+        client: Any,
+        url: str,
+        payload: Dict[str, Any],
+        chunk_size: int,
+        stream_info: Optional[Dict[str, Any]]
+    ) -> Iterator[pd.DataFrame]:
+        """Parse CSV blocks streamed by the pooled client, one DataFrame per block"""
+        with governed('wqp') as permit:
+            blocks = client.iter_blocking(
+                client.stream_csv_blocks(url, payload, chunk_size, stream_info)
+            )
+            rows = 0
+            try:
+                for block in blocks:
+                    permit.responded()
+                    chunk = pd.read_csv(io.BytesIO(block), low_memory=False)
+                    rows += len(chunk)
+                    yield chunk
+            finally:
+                blocks.close()
+                observe_upstream('wqp', rows, None)
+    
+    @staticmethod
+    def parse_rdb(text: str) -> pd.DataFrame:
+        """Parse an NWIS RDB table (comment lines, header, field-format line, rows)"""
+        lines = text.splitlines()
+        comments = 0
+        while comments < len(lines) and lines[comments].startswith('#'):
+            comments += 1
+        if comments >= len(lines):
+            return pd.DataFrame()
+        fields = lines[comments].split('\t')
+        return pd.read_csv(
+            io.StringIO(text),
+            delimiter='\t',
+            skiprows=comments + 2,
+            names=fields,
+            na_values='NaN',
+            dtype={'site_no': str, 'dec_long_va': float, 'dec_lat_va': float}
+        )
     
     @staticmethod
     def fetch_site_info(
@@ -62,32 +184,46 @@ class USGSDataFetcher:
     ) -> pd.DataFrame:
         """Fetch site information from NWIS"""
 
-        # Map site types to USGS codes
-        site_type_mapping = {
-            'Stream': 'ST',
-            'Lake': 'LK', 
-            'Groundwater': 'GW',
-            # Add more mappings as needed
-        }
-
         # Convert site types to USGS codes
         mapped_site_types = []
         for st in site_type:
-            mapped_site_types.append(site_type_mapping.get(st, st))
+            mapped_site_types.append(SITE_TYPE_CODES.get(st, st))
 
         query_params = {
             'stateCd': state_cd,
             'siteType': mapped_site_types,
-            'siteOutput': 'expanded'  # need to override the library's "Expanded" value to make this work
+            'siteOutput': 'expanded'
         }
         
         if has_data_since:
             query_params['startDt'] = has_data_since.strftime('%Y-%m-%d')
         
-        result = nwis.get_info(**query_params)
-    
-        # Handle if result is a tuple
-        if isinstance(result, tuple):
-            return result[0]  # Usually the first element is the DataFrame
+        settings = get_settings()
+        url = f"{settings.nwis_base_url.rstrip('/')}/site/"
+        payload = {
+            key: ','.join(value) if isinstance(value, list) else value
+            for key, value in query_params.items()
+        }
+        payload['format'] = 'rdb'
+        
+        # NWIS answers 404 when no sites match
+        client = get_upstream_client()
+        if client.running:
+            with governed('nwis'):
+                text = client.call_blocking(client.get_text(url, payload, empty_on_404=True))
         else:
-            return result
\ No newline at end of file
+            with governed('nwis') as permit, requests.get(
+                url, params=payload, headers=upstream_headers(), timeout=settings.request_timeout
+            ) as response:
+                permit.responded()
+                if response.status_code == 404:
+                    text = ''
+                elif response.status_code == 400:
+                    raise ValueError(f"NWIS returned 400 for {response.url}")
+                else:
+                    response.raise_for_status()
+                    text = response.text
+        
+        sites_df = USGSDataFetcher.parse_rdb(text)
+        observe_upstream('nwis', len(sites_df), len(text))
+        return sites_df
@@ -1,42 +1,215 @@
 """
 Data cleaning and validation functionality
 """
+import numpy as np
 import pandas as pd
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Legacy WQP profile column names mapped to the names used throughout the app
+COLUMN_ALIASES = {
+    'ResultMeasure/MeasureUnitCode': 'ResultMeasureUnitCode',
+    'DetectionQuantitationLimitMeasure/MeasureValue': 'DetectionQuantitationLimitMeasureValue',
+}
+
+# Rows missing any of these are dropped
+ESSENTIAL_COLUMNS = ['OrganizationIdentifier', 'MonitoringLocationIdentifier',
+                     'ActivityStartDate', 'CharacteristicName']
+
+# Identify individual results; kept so shard merges can de-duplicate
+KEY_COLUMNS = ['ActivityIdentifier', 'ResultIdentifier', 'ResultSampleFractionText']
+
+# Columns each report type reads, beyond ESSENTIAL_COLUMNS and KEY_COLUMNS
+REPORT_COLUMNS = {
+    'summary': [],
+    'detailed': ['ResultMeasureValue', 'ResultMeasureUnitCode',
+                 'ResultStatusIdentifier', 'ResultCommentText'],
+    'trend': ['ResultMeasureValue', 'ResultMeasureUnitCode'],
+    'comparison': ['ResultMeasureValue', 'ResultMeasureUnitCode',
+                   'ResultStatusIdentifier', 'ResultCommentText'],
+    'spatial': ['ResultMeasureValue'],
+}
+
+# Repeated identifiers stored as category
+CATEGORY_COLUMNS = ['OrganizationIdentifier', 'MonitoringLocationIdentifier',
+                    'CharacteristicName', 'ResultMeasureUnitCode',
+                    'ResultStatusIdentifier', 'ResultSampleFractionText']
+
+# Measurement values are reported verbatim and stay float64; limits do not
+FLOAT64_COLUMNS = ['ResultMeasureValue']
+FLOAT32_COLUMNS = ['DetectionQuantitationLimitMeasureValue']
+
+DATE_COLUMNS = ['ActivityStartDate', 'ActivityEndDate']
+
+# Temporary column holding the random key used for bottom-k sampling
+SAMPLE_KEY_COLUMN = '_sample_key'
 
 class DataProcessor:
     """Handles data cleaning and validation"""
-    
+
     @staticmethod
-    def clean_and_validate_data(df: pd.DataFrame) -> pd.DataFrame:
-        """Clean and validate water quality data"""
+    def columns_for_reports(report_types: Iterable[str]) -> List[str]:
+        """Columns needed to produce the given report types"""
+        columns = list(ESSENTIAL_COLUMNS) + list(KEY_COLUMNS)
+        for report_type in report_types:
+            for col in REPORT_COLUMNS[report_type]:
+                if col not in columns:
+                    columns.append(col)
+        return columns
+
+    @staticmethod
+    def memory_usage(df: pd.DataFrame) -> int:
+        """Deep memory usage of a frame in bytes"""
+        return int(df.memory_usage(deep=True).sum())
+
+    @staticmethod
+    def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+        """Convert identifier columns to category and limit columns to float32"""
+        conversions = {}
+        for col in CATEGORY_COLUMNS:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                conversions[col] = 'category'
+        for col in FLOAT32_COLUMNS:
+            if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
+                conversions[col] = 'float32'
+        return df.astype(conversions) if conversions else df
+
+    @staticmethod
+    def clean_and_validate_data(
+        df: pd.DataFrame,
+        columns: Optional[List[str]] = None,
+        memory_report: Optional[Dict[str, int]] = None
+    ) -> pd.DataFrame:
+        """
+        Clean and validate water quality data
+
+        When columns is given, only those columns are kept (see
+        columns_for_reports). When memory_report is given, it is filled with
+        the deep memory usage of the frame after each stage.
+        """
         if df.empty:
             return df
-        
+
+        if memory_report is not None:
+            memory_report['raw'] = DataProcessor.memory_usage(df)
+
+        renames = {
+            alias: name for alias, name in COLUMN_ALIASES.items()
+            if alias in df.columns and name not in df.columns
+        }
+        if renames:
+            df = df.rename(columns=renames)
+
+        # Project down to the columns the reports need
+        if columns is not None:
+            df = df[[col for col in columns if col in df.columns]]
+            if memory_report is not None:
+                memory_report['projected'] = DataProcessor.memory_usage(df)
+
         # Remove rows with missing essential data
-        essential_cols = ['OrganizationIdentifier', 'MonitoringLocationIdentifier', 
-                         'ActivityStartDate', 'CharacteristicName']
-        
-        for col in essential_cols:
-            if col in df.columns:
-                df = df.dropna(subset=[col])
-        
+        essential_cols = [col for col in ESSENTIAL_COLUMNS if col in df.columns]
+        if essential_cols:
+            df = df.dropna(subset=essential_cols)
+        else:
+            df = df.copy()
+        if memory_report is not None:
+            memory_report['filtered'] = DataProcessor.memory_usage(df)
+
         # Clean numeric columns
-        numeric_cols = ['ResultMeasureValue', 'DetectionQuantitationLimitMeasureValue']
-        for col in numeric_cols:
+        for col in FLOAT64_COLUMNS + FLOAT32_COLUMNS:
             if col in df.columns:
                 df[col] = pd.to_numeric(df[col], errors='coerce')
-        
+
         # Convert date columns
-        date_cols = ['ActivityStartDate', 'ActivityEndDate']
-        for col in date_cols:
+        for col in DATE_COLUMNS:
             if col in df.columns:
                 df[col] = pd.to_datetime(df[col], errors='coerce')
-        
+
+        df = DataProcessor.optimize_dtypes(df)
+        if memory_report is not None:
+            memory_report['typed'] = DataProcessor.memory_usage(df)
+
         return df
-    
+
+    @staticmethod
+    def _concat_cleaned(frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """Concatenate cleaned chunks and restore compact dtypes"""
+        if not frames:
+            return pd.DataFrame()
+        if len(frames) == 1:
+            return frames[0]
+        return DataProcessor.optimize_dtypes(pd.concat(frames, ignore_index=True))
+
+    @staticmethod
+    def collect_limited(
+        chunks: Iterable[pd.DataFrame],
+        max_records: Optional[int],
+        columns: Optional[List[str]] = None
+    ) -> Tuple[pd.DataFrame, int]:
+        """
+        Clean raw chunks until max_records valid rows have been collected
+
+        Stops pulling from chunks as soon as the limit is reached; with
+        max_records None every chunk is cleaned. Returns the cleaned rows and
+        the number of raw rows read.
+        """
+        frames = []
+        collected = 0
+        rows_read = 0
+        for chunk in chunks:
+            rows_read += len(chunk)
+            cleaned = DataProcessor.clean_and_validate_data(chunk, columns=columns)
+            if cleaned.empty:
+                continue
+            if max_records is not None:
+                cleaned = cleaned.head(max_records - collected)
+            frames.append(cleaned)
+            collected += len(cleaned)
+            if max_records is not None and collected >= max_records:
+                break
+        return DataProcessor._concat_cleaned(frames), rows_read
+
+    @staticmethod
+    def collect_sample(
+        chunks: Iterable[pd.DataFrame],
+        sample_size: int,
+        columns: Optional[List[str]] = None,
+        seed: Optional[int] = None
+    ) -> Tuple[pd.DataFrame, int]:
+        """
+        Uniform random sample of valid rows from a stream of raw chunks
+
+        Every cleaned row gets a random key and only the sample_size rows
+        with the smallest keys are kept (bottom-k sampling), so memory stays
+        bounded by sample_size plus one chunk. Returns the sample and the
+        number of valid rows seen.
+        """
+        rng = np.random.default_rng(seed)
+        sample: Optional[pd.DataFrame] = None
+        population = 0
+        for chunk in chunks:
+            cleaned = DataProcessor.clean_and_validate_data(chunk, columns=columns)
+            if cleaned.empty:
+                continue
+            population += len(cleaned)
+            cleaned = cleaned.assign(**{SAMPLE_KEY_COLUMN: rng.random(len(cleaned))})
+            if sample is not None:
+                cleaned = pd.concat([sample, cleaned], ignore_index=True)
+            if len(cleaned) > sample_size:
+                cleaned = cleaned.nsmallest(sample_size, SAMPLE_KEY_COLUMN)
+            sample = cleaned
+
+        if sample is None:
+            return pd.DataFrame(), 0
+        sample = sample.drop(columns=SAMPLE_KEY_COLUMN).reset_index(drop=True)
+        return DataProcessor.optimize_dtypes(sample), population
+
     @staticmethod
     def limit_records(df: pd.DataFrame, max_records: int) -> pd.DataFrame:
         """Limit the number of records"""
         if len(df) > max_records:
             return df.head(max_records)
-        return df
\ No newline at end of file
+        return df
+
+
+# Columns kept for cached and stored frames, which serve every report type
+ALL_REPORT_COLUMNS = DataProcessor.columns_for_reports(REPORT_COLUMNS)
@@ -0,0 +1,86 @@
+"""
+Bounded worker pool for blocking USGS fetches and pandas processing
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from app.config import get_settings
+
+T = TypeVar('T')
+
+
+class ExecutorBusyError(Exception):
+    """Raised when the worker pool queue is full"""
+
+
+class WorkExecutor:
+    """Runs blocking callables on a thread pool without stalling the event loop"""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wq-worker')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of submitted tasks that are queued or running"""
+        return self._pending
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters"""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self.rejected
+        }
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> T:
+        """
+        Run func(*args, **kwargs) on the pool and await its result.
+
+        Raises ExecutorBusyError when max_workers + max_queue tasks are already
+        pending, and asyncio.TimeoutError when timeout elapses. A task that
+        times out before it starts is dropped from the queue.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorBusyError("Worker pool queue is full")
+            self._pending += 1
+
+        # Counted slots are released when the thread finishes, not when the
+        # awaiting coroutine gives up, so timed-out work still counts as load.
+        future = self._pool.submit(functools.partial(func, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def shutdown(self) -> None:
+        """Stop accepting work and cancel queued tasks"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache()
+def get_executor() -> WorkExecutor:
+    settings = get_settings()
+    return WorkExecutor(
+        max_workers=settings.worker_pool_size,
+        max_queue=settings.worker_queue_size
+    )
@@ -0,0 +1,265 @@
+"""
+Upstream governor: rate limit, adaptive concurrency and circuit breaker for WQP and NWIS
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+
+from app.config import get_settings
+from app.core.metrics import observe_upstream_call, observe_upstream_rejected, set_upstream_state
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+
+class UpstreamError(Exception):
+    """An upstream service failed (5xx, 429, timeout or connection error)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """A call was refused without reaching upstream: breaker open or limits saturated"""
+
+
+def find_upstream_error(error: BaseException) -> Optional[UpstreamError]:
+    """The UpstreamError behind error (e.g. inside a ShardFetchError), if any"""
+    while error is not None:
+        if isinstance(error, UpstreamError):
+            return error
+        error = error.__cause__
+    return None
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Whether an exception counts against the upstream's health
+
+    4xx responses (raised as ValueError) and parse errors are the caller's
+    problem; closed generators and cancellations are not errors at all.
+    """
+    if not isinstance(error, Exception) or isinstance(error, (ValueError, UpstreamError)):
+        return False
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status >= 500 or status == 429
+    return True
+
+
+class Permit:
+    """One admitted upstream call; responded() marks when its response started"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.responded_at: Optional[float] = None
+
+    def responded(self) -> None:
+        if self.responded_at is None:
+            self.responded_at = time.monotonic()
+
+    @property
+    def latency(self) -> float:
+        return (self.responded_at or time.monotonic()) - self.started
+
+
+class Governor:
+    """
+    Admission control for one upstream service, shared by the worker threads
+
+    Calls take a token from a token bucket, then wait for a concurrency
+    slot. The concurrency limit adapts by AIMD: it grows by one per limit's
+    worth of calls answered within target_latency, and halves (at most once
+    per target_latency) on a slow response or failure. After
+    failure_threshold consecutive failures the breaker opens and calls are
+    refused for reset_seconds; then a single probe call decides whether it
+    closes again. Waiting longer than max_wait for a token or slot is
+    refused too, so overload sheds load instead of queueing it.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        rate: float,
+        burst: int,
+        min_concurrency: int,
+        max_concurrency: int,
+        target_latency: float,
+        failure_threshold: int,
+        reset_seconds: float,
+        max_wait: float
+    ):
+        self.source = source
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.target_latency = target_latency
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_wait = max_wait
+
+        self._lock = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        set_upstream_state(source, self.state, self.limit, self.in_flight)
+
+    def _refuse(self, reason: str, retry_after: float) -> UpstreamUnavailableError:
+        self.rejected += 1
+        observe_upstream_rejected(self.source, reason)
+        return UpstreamUnavailableError(
+            f"Upstream {self.source} unavailable ({reason.replace('_', ' ')})", retry_after=retry_after
+        )
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        set_upstream_state(self.source, state, self.limit, self.in_flight)
+
+    def _admit_breaker(self) -> bool:
+        """Check the breaker (lock held); True when this call is the half-open probe"""
+        if self.state == OPEN:
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                raise self._refuse('circuit_open', remaining)
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing:
+                raise self._refuse('circuit_open', 1.0)
+            self._probing = True
+            return True
+        return False
+
+    def _take_token(self) -> float:
+        """Reserve a token (lock held); returns seconds to wait for it"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if wait > self.max_wait:
+            raise self._refuse('rate_limited', wait)
+        self._tokens -= 1
+        return wait
+
+    def acquire(self) -> bool:
+        """Admit a call, blocking for a token and a slot; returns whether it is the probe"""
+        with self._lock:
+            probe = self._admit_breaker()
+            try:
+                wait = self._take_token()
+            except UpstreamUnavailableError:
+                self._probing = self._probing and not probe
+                raise
+        if wait:
+            time.sleep(wait)
+
+        deadline = time.monotonic() + self.max_wait
+        with self._lock:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._probing = self._probing and not probe
+                    raise self._refuse('concurrency', 1.0)
+                self._lock.wait(remaining)
+            self.in_flight += 1
+            set_upstream_state(self.source, self.state, self.limit, self.in_flight)
+        return probe
+
+    def release(self, permit: Permit, failed: bool, probe: bool) -> None:
+        """Record a finished call, adapting the limit and breaker state"""
+        latency = permit.latency
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if failed or latency > self.target_latency:
+                if now - self._decreased_at >= self.target_latency:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._decreased_at = now
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            if probe:
+                self._probing = False
+            if failed:
+                self.failures += 1
+                if probe or self.failures >= self.failure_threshold:
+                    self._opened_at = now
+                    self._set_state(OPEN)
+            else:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._set_state(CLOSED)
+            set_upstream_state(self.source, self.state, self.limit, self.in_flight)
+            self._lock.notify_all()
+        observe_upstream_call(self.source, latency, failed)
+
+    @contextmanager
+    def call(self) -> Iterator[Permit]:
+        """
+        Govern the enclosed upstream call
+
+        Upstream failures are re-raised as UpstreamError (chained to the
+        original); other exceptions pass through unchanged.
+        """
+        probe = self.acquire()
+        permit = Permit()
+        try:
+            yield permit
+        except BaseException as exc:
+            failed = is_upstream_failure(exc)
+            self.release(permit, failed, probe)
+            if failed:
+                raise UpstreamError(f"Upstream {self.source} failed: {exc}") from exc
+            raise
+        self.release(permit, False, probe)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "rejected": self.rejected
+            }
+            if self.state == OPEN:
+                status["retry_after"] = round(max(0.0, self._opened_at + self.reset_seconds - time.monotonic()), 1)
+            return status
+
+
+@lru_cache()
+def get_governor(source: str) -> Governor:
+    """The governor of an upstream source ('wqp' or 'nwis')"""
+    settings = get_settings()
+    return Governor(
+        source,
+        rate=settings.upstream_rate_limit,
+        burst=settings.upstream_rate_burst,
+        min_concurrency=settings.upstream_min_concurrency,
+        max_concurrency=settings.upstream_max_connections_per_host,
+        target_latency=settings.upstream_target_latency,
+        failure_threshold=settings.upstream_breaker_failures,
+        reset_seconds=settings.upstream_breaker_reset_seconds,
+        max_wait=settings.upstream_max_wait_seconds
+    )
+
+
+@contextmanager
+def governed(source: str) -> Iterator[Permit]:
+    """get_governor(source).call(), or an ungoverned permit when the governor is disabled"""
+    if not get_settings().upstream_governor_enabled:
+        yield Permit()
+        return
+    with get_governor(source).call() as permit:
+        yield permit
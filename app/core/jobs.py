@@ -0,0 +1,335 @@
+"""
+Background report jobs with a priority queue and on-disk results
+"""
+import asyncio
+import gzip
+import itertools
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import get_settings
+from app.core.executor import ExecutorBusyError, get_executor
+from app.core.shared_state import SharedStateClient, get_shared_state
+
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue already holds max_queue jobs"""
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+FINISHED_STATUSES = (JobStatus.succeeded, JobStatus.failed, JobStatus.cancelled)
+
+
+class Job:
+    """A queued report and its progress; runner produces the JSON result bytes"""
+
+    def __init__(self, key: str, priority: int, runner: Callable[['Job'], Awaitable[bytes]]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.priority = priority
+        self.runner = runner
+        self.status = JobStatus.queued
+        self.stage = "queued"
+        self.progress = 0.0
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.expires_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.result_path: Optional[Path] = None
+        self.cancel_requested = False
+        self.listener: Optional[Callable[['Job'], None]] = None
+        self._task: Optional[asyncio.Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def report_progress(self, stage: str, progress: float) -> None:
+        self.stage = stage
+        self.progress = progress
+        if self.listener is not None:
+            self.listener(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "priority": self.priority,
+            "stage": self.stage,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.expires_at,
+            "error": self.error
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.to_dict(),
+            "key": self.key,
+            "result_path": str(self.result_path) if self.result_path else None
+        }
+
+    @staticmethod
+    def from_snapshot(snapshot: Dict[str, Any]) -> 'Job':
+        """Detached view of a job owned by another worker"""
+        job = Job(snapshot["key"], snapshot["priority"], runner=None)
+        job.id = snapshot["job_id"]
+        job.status = JobStatus(snapshot["status"])
+        for name in ("stage", "progress", "created_at", "started_at", "finished_at", "expires_at", "error"):
+            setattr(job, name, snapshot[name])
+        job.result_path = Path(snapshot["result_path"]) if snapshot["result_path"] else None
+        return job
+
+
+class JobManager:
+    """
+    Runs jobs on a fixed number of async workers, most urgent priority first
+
+    Submitting a job whose key matches a queued or running job returns the
+    existing job instead. Results are stored gzip-compressed under
+    result_dir and removed, along with the job, ttl seconds after it
+    finishes.
+    
+    Under the multi-worker server, each worker runs the jobs submitted to
+    it and publishes their snapshots to the shared state, so any worker
+    can report on, deduplicate against or cancel them.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        result_dir: Path,
+        ttl: int,
+        timeout: int,
+        shared: Optional[SharedStateClient] = None
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_dir = Path(result_dir)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.shared = shared
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._tasks: list = []
+
+    def _ensure_started(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._sweeper()))
+        if self.shared is not None:
+            self._tasks.append(asyncio.ensure_future(self._cancel_watcher()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queued_count(self) -> int:
+        return sum(1 for job in self._in_flight.values() if job.status == JobStatus.queued)
+
+    def submit(self, key: str, priority: int, runner: Callable[[Job], Awaitable[bytes]]) -> Job:
+        """Queue a job, or return the queued/running job with the same key"""
+        self._ensure_started()
+        existing = self._in_flight.get(key)
+        if existing is None and self.shared is not None:
+            existing = self.get(self.shared.get_record(f"job-key:{key}") or "")
+        if existing is not None and not existing.finished:
+            return existing
+        if self.queued_count() >= self.max_queue:
+            raise JobQueueFullError(f"Job queue is full ({self.max_queue} jobs)")
+
+        job = Job(key, priority, runner)
+        job.listener = self._publish
+        self._jobs[job.id] = job
+        self._in_flight[key] = job
+        if self.shared is not None:
+            self.shared.put_record(f"job-key:{key}", job.id, self.timeout + self.ttl)
+        self._publish(job)
+        self._enqueue(job)
+        return job
+
+    def _enqueue(self, job: Job) -> None:
+        self._queue.put_nowait((job.priority, next(self._sequence), job.id))
+
+    def _publish(self, job: Job) -> None:
+        if self.shared is not None:
+            self.shared.put_record(f"job:{job.id}", job.snapshot(), self.timeout + self.ttl)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job of this worker, or a snapshot view of another worker's job"""
+        job = self._jobs.get(job_id)
+        if job is None and self.shared is not None and job_id:
+            snapshot = self.shared.get_record(f"job:{job_id}")
+            if snapshot is not None:
+                job = Job.from_snapshot(snapshot)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel an unfinished job; for a finished job, delete it and its result"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return self._cancel_remote(job_id)
+        if job.finished:
+            self._discard(job)
+        elif job.status == JobStatus.queued:
+            self._finish(job, JobStatus.cancelled)
+        else:
+            job.cancel_requested = True
+            job.report_progress("cancelling", job.progress)
+            if job._task is not None:
+                job._task.cancel()
+        return job
+
+    def _cancel_remote(self, job_id: str) -> Optional[Job]:
+        """Ask the worker owning a job to cancel it, or delete its finished result"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.finished:
+            self.shared.pop_record(f"job:{job_id}")
+            self._discard(job)
+        else:
+            self.shared.put_record(f"job-cancel:{job_id}", True, self.timeout)
+            job.stage = "cancelling"
+        return job
+
+    async def _cancel_watcher(self) -> None:
+        """Apply cancellations requested through other workers"""
+        while True:
+            await asyncio.sleep(1)
+            for job in list(self._in_flight.values()):
+                if self.shared.pop_record(f"job-cancel:{job.id}"):
+                    self.cancel(job.id)
+
+    def read_result(self, job: Job) -> bytes:
+        """Stored result of a succeeded job, gzip-compressed"""
+        return job.result_path.read_bytes()
+
+    def _finish(self, job: Job, status: JobStatus, error: Optional[str] = None) -> None:
+        job.status = status
+        job.error = error
+        job.stage = status.value
+        job.finished_at = datetime.now()
+        job.expires_at = job.finished_at + timedelta(seconds=self.ttl)
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+            if self.shared is not None:
+                self.shared.pop_record(f"job-key:{job.key}")
+        self._publish(job)
+
+    def _discard(self, job: Job) -> None:
+        self._jobs.pop(job.id, None)
+        if self.shared is not None:
+            self.shared.pop_record(f"job:{job.id}")
+        if job.result_path is not None:
+            job.result_path.unlink(missing_ok=True)
+
+    def _store(self, job_id: str, body: bytes) -> Path:
+        """Write a result atomically, gzip-compressed (runs on the worker pool)"""
+        self.result_dir.mkdir(parents=True, exist_ok=True)
+        path = self.result_dir / f"{job_id}.json.gz"
+        fd, tmp_name = tempfile.mkstemp(dir=self.result_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(gzip.compress(body, compresslevel=6))
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return path
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.queued:
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        job.status = JobStatus.running
+        job.started_at = job.started_at or datetime.now()
+        job.report_progress("starting", 0.0)
+
+        job._task = asyncio.ensure_future(asyncio.wait_for(job.runner(job), timeout=self.timeout))
+        try:
+            body = await job._task
+            job.report_progress("storing", 0.95)
+            job.result_path = await get_executor().run(self._store, job.id, body)
+        except ExecutorBusyError:
+            # The worker pool is saturated by interactive requests; retry later
+            job.status = JobStatus.queued
+            job.report_progress("waiting for workers", 0.0)
+            await asyncio.sleep(1)
+            self._enqueue(job)
+            return
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                raise
+            self._finish(job, JobStatus.cancelled)
+            return
+        except asyncio.TimeoutError:
+            self._finish(job, JobStatus.failed, f"Job exceeded {self.timeout}s timeout")
+            return
+        except Exception as e:
+            self._finish(job, JobStatus.failed, str(e))
+            return
+        finally:
+            job._task = None
+        job.progress = 1.0
+        self._finish(job, JobStatus.succeeded)
+
+    def _sweep(self) -> None:
+        """Drop expired jobs and result files left behind by earlier processes"""
+        now = datetime.now()
+        for job in list(self._jobs.values()):
+            if job.expires_at is not None and job.expires_at <= now:
+                self._discard(job)
+        if self.result_dir.exists():
+            known = {job.result_path for job in self._jobs.values()}
+            cutoff = time.time() - self.ttl
+            for path in self.result_dir.glob('*.json.gz'):
+                if path not in known and path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+
+    async def _sweeper(self) -> None:
+        while True:
+            self._sweep()
+            await asyncio.sleep(min(self.ttl, 60))
+
+
+@lru_cache()
+def get_job_manager() -> JobManager:
+    settings = get_settings()
+    return JobManager(
+        workers=settings.jobs_workers,
+        max_queue=settings.jobs_max_queue,
+        result_dir=Path(settings.jobs_result_path),
+        ttl=settings.jobs_result_ttl,
+        timeout=settings.jobs_timeout,
+        shared=get_shared_state()
+    )
@@ -0,0 +1,322 @@
+"""
+Prometheus metrics and request profiling
+"""
+import collections
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:  # pandas is loaded by the startup warm-up, not at import
+    import pandas as pd
+
+# Request header that asks for a sampling profile instead of the response
+PROFILE_HEADER = b'x-profile'
+
+STAGE_SECONDS = Histogram(
+    'wqp_stage_duration_seconds',
+    'Time spent in each stage of a query',
+    ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+UPSTREAM_BYTES = Counter(
+    'wqp_upstream_bytes_total',
+    'Bytes received from upstream services',
+    ['source']
+)
+UPSTREAM_ROWS = Counter(
+    'wqp_upstream_rows_total',
+    'Rows parsed from upstream responses',
+    ['source']
+)
+UPSTREAM_CALL_SECONDS = Histogram(
+    'wqp_upstream_call_seconds',
+    'Upstream response latency (time to first data) of governed calls',
+    ['source', 'outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+UPSTREAM_REJECTED = Counter(
+    'wqp_upstream_rejected_total',
+    'Upstream calls refused by the governor',
+    ['source', 'reason']
+)
+# Per worker process: each has its own governor
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    'wqp_upstream_circuit_state',
+    'Circuit breaker state (0 closed, 1 half open, 2 open)',
+    ['source'],
+    multiprocess_mode='max'
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    'wqp_upstream_concurrency_limit',
+    'Adaptive limit on concurrent upstream calls',
+    ['source'],
+    multiprocess_mode='liveall'
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'wqp_upstream_in_flight',
+    'Upstream calls in progress',
+    ['source'],
+    multiprocess_mode='livesum'
+)
+STALE_RESPONSES = Counter(
+    'wqp_stale_responses_total',
+    'Responses served from expired cache entries while upstream was unavailable'
+)
+# Per worker process (labelled by pid under the multi-worker server)
+WORKER_PEAK_RSS = Gauge(
+    'wqp_worker_peak_rss_bytes',
+    'Peak resident set size of the worker since it started',
+    multiprocess_mode='liveall'
+)
+FRAME_BYTES = Histogram(
+    'wqp_frame_memory_bytes',
+    'Deep memory usage of cleaned query frames',
+    buckets=tuple(2 ** power for power in range(16, 34, 2))
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency',
+    ['method', 'route', 'status']
+)
+RESPONSE_BYTES = Histogram(
+    'http_response_bytes',
+    'Uncompressed HTTP response body size',
+    ['route'],
+    buckets=tuple(2 ** power for power in range(8, 32, 2))
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Record the duration of the enclosed block under stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_upstream(source: str, rows: int, n_bytes: Optional[int]) -> None:
+    UPSTREAM_ROWS.labels(source).inc(rows)
+    if n_bytes:
+        UPSTREAM_BYTES.labels(source).inc(n_bytes)
+
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def observe_upstream_call(source: str, seconds: float, failed: bool) -> None:
+    UPSTREAM_CALL_SECONDS.labels(source, 'failure' if failed else 'success').observe(seconds)
+
+
+def observe_upstream_rejected(source: str, reason: str) -> None:
+    UPSTREAM_REJECTED.labels(source, reason).inc()
+
+
+def set_upstream_state(source: str, state: str, limit: float, in_flight: int) -> None:
+    UPSTREAM_CIRCUIT_STATE.labels(source).set(CIRCUIT_STATES[state])
+    UPSTREAM_CONCURRENCY_LIMIT.labels(source).set(limit)
+    UPSTREAM_IN_FLIGHT.labels(source).set(in_flight)
+
+
+def observe_stale_response() -> None:
+    STALE_RESPONSES.inc()
+
+
+def observe_worker_memory() -> None:
+    # ru_maxrss is in kilobytes on Linux
+    WORKER_PEAK_RSS.set(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+def observe_frame(df: 'pd.DataFrame') -> None:
+    if not df.empty:
+        FRAME_BYTES.observe(int(df.memory_usage(deep=True).sum()))
+
+
+class TimedIterator:
+    """Iterator wrapper accumulating the time spent producing items"""
+
+    def __init__(self, iterator: Iterator[Any]):
+        self.iterator = iterator
+        self.seconds = 0.0
+
+    def __iter__(self) -> 'TimedIterator':
+        return self
+
+    def __next__(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def close(self) -> None:
+        self.iterator.close()
+
+
+@contextmanager
+def time_stream(chunks: Iterator[Any], fetch_stage: str = 'fetch', process_stage: str = 'clean'):
+    """
+    Time a block consuming a chunk generator, splitting fetch from processing
+
+    Time spent pulling chunks (network reads and CSV parsing) is recorded as
+    fetch_stage and the rest of the block as process_stage. The generator is
+    closed on exit.
+    """
+    timed = TimedIterator(chunks)
+    start = time.perf_counter()
+    try:
+        yield timed
+    finally:
+        timed.close()
+        observe_stage(fetch_stage, timed.seconds)
+        observe_stage(process_stage, time.perf_counter() - start - timed.seconds)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency, response size and worker peak RSS
+
+    Installed inside GZipMiddleware, so response sizes are uncompressed and
+    the time spent in send (which includes gzip compression) is recorded as
+    the 'send' stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        body_bytes = 0
+        send_seconds = 0.0
+
+        async def timed_send(message):
+            nonlocal status, body_bytes, send_seconds
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                body_bytes += len(message.get('body', b''))
+            send_start = time.perf_counter()
+            await send(message)
+            send_seconds += time.perf_counter() - send_start
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            route = scope.get('route')
+            route_path = getattr(route, 'path', None) or 'unmatched'
+            REQUEST_SECONDS.labels(scope['method'], route_path, str(status)).observe(
+                time.perf_counter() - start
+            )
+            RESPONSE_BYTES.labels(route_path).observe(body_bytes)
+            observe_stage('send', send_seconds)
+            observe_worker_memory()
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler over all threads
+
+    Work runs on the event loop and the worker pool, so every thread is
+    sampled; threads idling in threading/queue/selectors waits are skipped.
+    The result is in collapsed-stack format (one 'frame;frame;frame count'
+    line per stack), readable by flamegraph.pl and speedscope.
+    """
+
+    IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py')
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Dict[str, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                if os.path.basename(frame.f_code.co_filename) in self.IDLE_MODULES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return ''.join(
+            f"{stack} {count}\n"
+            for stack, count in sorted(self.samples.items(), key=lambda item: -item[1])
+        )
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware profiling requests that carry the X-Profile header
+
+    The profiled request runs normally, but its response is replaced by the
+    collapsed stack samples; the original status is returned in the
+    X-Profiled-Status header.
+    """
+
+    def __init__(self, app, interval: float):
+        self.app = app
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not any(
+            name == PROFILE_HEADER for name, _ in scope.get('headers', [])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            sampler.stop()
+
+        body = sampler.collapsed().encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/plain; charset=utf-8'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-profiled-status', str(status).encode())
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
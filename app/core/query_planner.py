@@ -0,0 +1,207 @@
+"""
+Query planning and parallel shard fetching for large WQP queries
+"""
+import asyncio
+import itertools
+import random
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.governor import UpstreamUnavailableError
+
+# List-valued WQP parameters that can be split into independent shards,
+# narrowest first. Only the first one present in a query is split.
+SPATIAL_SHARD_KEYS = ('siteid', 'huc', 'countycode', 'statecode')
+
+# Columns identifying a single result row, in order of preference
+RESULT_KEY_COLUMNS = ['ResultIdentifier']
+FALLBACK_KEY_COLUMNS = [
+    'ActivityIdentifier', 'CharacteristicName', 'ResultSampleFractionText',
+    'ResultMeasureValue', 'ResultMeasureUnitCode'
+]
+
+ShardResult = Tuple[pd.DataFrame, Optional[Dict[str, Any]]]
+
+
+class ShardFetchError(Exception):
+    """Raised when a shard still fails after all retries"""
+
+    def __init__(self, shard: Dict[str, Any], cause: Exception):
+        super().__init__(f"Shard {shard} failed: {cause}")
+        self.shard = shard
+        self.cause = cause
+
+
+class QueryPlanner:
+    """Splits large WQP queries into shards and merges their results"""
+
+    @staticmethod
+    def _parse_date(value: str) -> date:
+        return datetime.strptime(value, '%m-%d-%Y').date()
+
+    @staticmethod
+    def _format_date(value: date) -> str:
+        return value.strftime('%m-%d-%Y')
+
+    @staticmethod
+    def split_date_range(start: date, end: date, window_days: int) -> List[Tuple[date, date]]:
+        """Split an inclusive date range into non-overlapping windows"""
+        windows = []
+        window_start = start
+        while window_start <= end:
+            window_end = min(window_start + timedelta(days=window_days - 1), end)
+            windows.append((window_start, window_end))
+            window_start = window_end + timedelta(days=1)
+        return windows
+
+    @staticmethod
+    def _county_parts(
+        states: List[str],
+        counties: Dict[str, List[str]],
+        max_shards: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Split states into groups of their counties, within max_shards overall
+
+        States without known counties stay whole. Each group keeps its
+        state, so WQP matches the same results as the state filter would.
+        """
+        per_state = max(1, max_shards // len(states))
+        parts: List[Dict[str, Any]] = []
+        for state in states:
+            codes = counties.get(state)
+            if not codes:
+                parts.append({'statecode': [state]})
+                continue
+            size = -(-len(codes) // per_state)
+            parts.extend(
+                {'statecode': [state], 'countycode': codes[i:i + size]}
+                for i in range(0, len(codes), size)
+            )
+        return parts
+
+    @staticmethod
+    def plan(
+        query_params: Dict[str, Any],
+        window_days: int,
+        max_sites_per_shard: int,
+        max_shards: int,
+        counties: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Split query params into shards whose union is the original query.
+
+        The narrowest list-valued location filter is split (site lists in
+        chunks of max_sites_per_shard, other filters one value per shard), and
+        bounded date ranges longer than window_days are split into windows.
+        Site-list queries are already narrow and are not split by date.
+        Windows are widened as needed to stay within max_shards.
+
+        Undated state queries have no date range to split, so states found
+        in counties (WQP county codes by state value, e.g. from the site
+        catalog) are split into groups of counties instead. Results at sites
+        in a county that is not listed are not fetched.
+        """
+        split_key = next(
+            (key for key in SPATIAL_SHARD_KEYS
+             if isinstance(query_params.get(key), list) and query_params[key]),
+            None
+        )
+        spatial_parts: List[Dict[str, Any]] = [{}]
+        if split_key == 'statecode' and 'startDateLo' not in query_params and counties:
+            spatial_parts = QueryPlanner._county_parts(query_params['statecode'], counties, max_shards)
+        elif split_key is not None:
+            values = query_params[split_key]
+            chunk_size = max_sites_per_shard if split_key == 'siteid' else 1
+            if len(values) > chunk_size:
+                spatial_parts = [
+                    {split_key: values[i:i + chunk_size]}
+                    for i in range(0, len(values), chunk_size)
+                ]
+
+        date_parts: List[Dict[str, Any]] = [{}]
+        if 'startDateLo' in query_params and 'siteid' not in query_params and window_days > 0:
+            start = QueryPlanner._parse_date(query_params['startDateLo'])
+            end = (
+                QueryPlanner._parse_date(query_params['startDateHi'])
+                if 'startDateHi' in query_params else date.today()
+            )
+            span_days = (end - start).days + 1
+            if span_days > window_days:
+                max_windows = max(1, max_shards // len(spatial_parts))
+                window_days = max(window_days, -(-span_days // max_windows))
+                date_parts = [
+                    {
+                        'startDateLo': QueryPlanner._format_date(lo),
+                        'startDateHi': QueryPlanner._format_date(hi)
+                    }
+                    for lo, hi in QueryPlanner.split_date_range(start, end, window_days)
+                ]
+
+        return [
+            {**query_params, **spatial, **dates}
+            for spatial, dates in itertools.product(spatial_parts, date_parts)
+        ]
+
+    @staticmethod
+    def merge_results(frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """Concatenate shard frames, dropping results returned by more than one shard"""
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        if len(frames) == 1:
+            return frames[0]
+
+        merged = pd.concat(frames, ignore_index=True)
+        key_cols = [col for col in RESULT_KEY_COLUMNS if col in merged.columns]
+        if not key_cols:
+            key_cols = [col for col in FALLBACK_KEY_COLUMNS if col in merged.columns]
+        if key_cols:
+            merged = merged.drop_duplicates(subset=key_cols, ignore_index=True)
+        return merged
+
+    @staticmethod
+    async def fetch_shards(
+        shards: List[Dict[str, Any]],
+        fetch_shard: Callable[[Dict[str, Any]], Awaitable[ShardResult]],
+        concurrency: int,
+        retries: int,
+        backoff: float
+    ) -> Tuple[List[pd.DataFrame], List[Optional[Dict[str, Any]]]]:
+        """
+        Fetch shards concurrently, retrying each failed shard on its own.
+
+        Retries use exponential backoff with jitter. ValueError (raised for
+        400 and 404 responses) is not retried, nor are calls the
+        upstream governor refused.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(shard: Dict[str, Any]) -> ShardResult:
+            async with semaphore:
+                attempt = 0
+                while True:
+                    try:
+                        return await fetch_shard(shard)
+                    except (ValueError, UpstreamUnavailableError):
+                        raise
+                    except Exception as exc:
+                        if attempt >= retries:
+                            raise ShardFetchError(shard, exc) from exc
+                    delay = backoff * (2 ** attempt)
+                    attempt += 1
+                    await asyncio.sleep(delay + random.uniform(0, delay))
+
+        tasks = [asyncio.ensure_future(run(shard)) for shard in shards]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        frames = [frame for frame, _ in results]
+        metadata = [md for _, md in results]
+        return frames, metadata
@@ -1,14 +1,205 @@
 """
 Report generation functionality
 """
+import io
+import json
+import math
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Any
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.rollups import SECTION_LEVELS, Rollup, unknown_units
+from app.core.site_catalog import grid_cell_bounds
+
+# Columns included in detailed reports and streamed exports
+DETAIL_COLUMNS = [
+    'OrganizationIdentifier', 'MonitoringLocationIdentifier', 
+    'ActivityStartDate', 'CharacteristicName', 'ResultMeasureValue',
+    'ResultMeasureUnitCode', 'ResultStatusIdentifier', 'ResultCommentText'
+]
+
+# Formats supported by iter_detailed_chunks
+STREAM_FORMATS = ('csv', 'ndjson')
+
+# Formats supported by iter_columnar_chunks
+COLUMNAR_FORMATS = ('arrow', 'parquet')
+
+# Labels for seasonal trend periods, in period order
+SEASONS = ('DJF', 'MAM', 'JJA', 'SON')
+
+# Mann-Kendall settings
+MIN_TREND_PERIODS = 3
+TREND_ALPHA = 0.05
+# Period pairs evaluated at once (groups x periods^2); bounds the broadcast arrays
+TREND_PAIR_BUDGET = 2_000_000
+
+# Report sections generate_sections can produce
+REPORT_SECTIONS = ('summary', 'trend', 'comparison', 'spatial', 'detailed')
+
+# Percentiles of each site's results in comparison reports
+COMPARISON_PERCENTILES = (10, 25, 75, 90)
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file collecting what a pyarrow writer emits, drained between batches"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class AggregationPlan:
+    """
+    Aggregates shared between report sections, each computed at most once
+    
+    Summary and trend sections generated from the same plan reuse the
+    per-characteristic counts and date range instead of rescanning the frame.
+    """
+    
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._results: Dict[str, Any] = {}
+    
+    def _memo(self, name: str, compute: Callable[[], Any]) -> Any:
+        if name not in self._results:
+            self._results[name] = compute()
+        return self._results[name]
+    
+    def _value_counts(self, column: str) -> pd.Series:
+        """Records per value, most frequent first, skipping unused categories"""
+        def compute():
+            counts = self.df[column].value_counts()
+            return counts[counts > 0]
+        return self._memo(f"counts:{column}", compute)
+    
+    def characteristic_counts(self) -> pd.Series:
+        return self._value_counts('CharacteristicName')
+    
+    def organization_counts(self) -> pd.Series:
+        return self._value_counts('OrganizationIdentifier')
+    
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        def compute():
+            dates = self.df['ActivityStartDate']
+            if dates.isnull().all():
+                return None, None
+            return dates.min(), dates.max()
+        return self._memo('date_range', compute)
 
 class ReportGenerator:
     """Handles generation of different report types"""
     
     @staticmethod
-    def generate_summary_report(df: pd.DataFrame, query_info: Dict) -> Dict[str, Any]:
+    def generate_sections(
+        df: pd.DataFrame,
+        query_info: Dict,
+        sections: Sequence[str],
+        detail_limit: Optional[int] = None,
+        population_rows: Optional[int] = None,
+        granularity: str = 'yearly',
+        by_unit: bool = False,
+        trend_statistics: bool = False,
+        comparison_percentiles: Sequence[float] = COMPARISON_PERCENTILES,
+        comparison_thresholds: Optional[Dict[str, Dict[str, Any]]] = None,
+        comparison_by_unit: bool = False,
+        spatial_zones: Optional[Dict[str, pd.Series]] = None,
+        grid_degrees: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate several report sections from one shared aggregation plan
+        
+        Only the first detail_limit rows are converted for the detailed
+        section. population_rows marks df as a random sample, which makes
+        the summary an estimate.
+        """
+        plan = AggregationPlan(df)
+        results: Dict[str, Any] = {}
+        for section in sections:
+            if section == 'summary' and population_rows is not None:
+                results[section] = ReportGenerator.generate_sampled_summary_report(
+                    df, query_info, population_rows, plan=plan
+                )
+            elif section == 'summary':
+                results[section] = ReportGenerator.generate_summary_report(df, query_info, plan=plan)
+            elif section == 'trend':
+                results[section] = ReportGenerator.generate_trend_report(
+                    df, query_info,
+                    granularity=granularity,
+                    by_unit=by_unit,
+                    trend_statistics=trend_statistics,
+                    plan=plan
+                )
+            elif section == 'comparison':
+                results[section] = ReportGenerator.generate_comparison_report(
+                    df, query_info,
+                    percentiles=comparison_percentiles,
+                    thresholds=comparison_thresholds,
+                    by_unit=comparison_by_unit
+                )
+            elif section == 'spatial':
+                results[section] = ReportGenerator.generate_spatial_report(
+                    df, query_info, spatial_zones or {}, grid_degrees=grid_degrees
+                )
+            elif section == 'detailed':
+                rows = df if detail_limit is None else df.head(detail_limit)
+                results[section] = ReportGenerator.generate_detailed_report(rows, query_info)
+            else:
+                raise ValueError(f"Unsupported report section: {section}")
+        return results
+    
+    @staticmethod
+    def generate_rollup_sections(
+        rollups: Dict[str, Rollup],
+        query_info: Dict,
+        sections: Sequence[str],
+        granularity: str = 'yearly',
+        by_unit: bool = False,
+        trend_statistics: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Generate summary and trend sections from rollups instead of result rows
+        
+        rollups maps each level in SECTION_LEVELS that the sections need to
+        the rollup covering the query.
+        """
+        results: Dict[str, Any] = {}
+        for section in sections:
+            if section not in SECTION_LEVELS:
+                raise ValueError(f"Report section '{section}' cannot be generated from rollups")
+            rollup = rollups[SECTION_LEVELS[section]]
+            if section == 'summary':
+                results[section] = ReportGenerator.generate_summary_report_from_rollup(rollup, query_info)
+            else:
+                results[section] = ReportGenerator.generate_trend_report_from_rollup(
+                    rollup, query_info,
+                    granularity=granularity,
+                    by_unit=by_unit,
+                    trend_statistics=trend_statistics
+                )
+        return results
+    
+    @staticmethod
+    def generate_summary_report(
+        df: pd.DataFrame,
+        query_info: Dict,
+        plan: Optional[AggregationPlan] = None
+    ) -> Dict[str, Any]:
         """Generate summary report from water quality data"""
         if df.empty:
             return {
@@ -19,73 +210,650 @@ class ReportGenerator:
                 "locations": []
             }
         
+        plan = plan or AggregationPlan(df)
+        start, end = plan.date_range()
+        parameters = plan.characteristic_counts()
         summary = {
             "total_records": len(df),
             "date_range": {
-                "start": df['ActivityStartDate'].min().isoformat() if not df['ActivityStartDate'].isnull().all() else None,
-                "end": df['ActivityStartDate'].max().isoformat() if not df['ActivityStartDate'].isnull().all() else None
+                "start": start.isoformat() if start is not None else None,
+                "end": end.isoformat() if end is not None else None
             },
-            "parameters": df['CharacteristicName'].value_counts().head(10).to_dict(),
-            "organizations": df['OrganizationIdentifier'].value_counts().head(10).to_dict(),
+            "parameters": parameters.head(10).to_dict(),
+            "organizations": plan.organization_counts().head(10).to_dict(),
             "locations": df['MonitoringLocationIdentifier'].nunique(),
-            "unique_parameters": df['CharacteristicName'].nunique()
+            "unique_parameters": len(parameters)
         }
         
         return summary
 
+    @staticmethod
+    def generate_sampled_summary_report(
+        sample: pd.DataFrame,
+        query_info: Dict,
+        population_rows: int,
+        plan: Optional[AggregationPlan] = None
+    ) -> Dict[str, Any]:
+        """
+        Estimate a summary report from a uniform random sample
+        
+        Record counts are scaled up to the population; location and
+        parameter counts are the distinct values seen in the sample.
+        """
+        summary = ReportGenerator.generate_summary_report(sample, query_info, plan=plan)
+        if sample.empty:
+            return summary
+        
+        scale = population_rows / len(sample)
+        summary["total_records"] = population_rows
+        for key in ("parameters", "organizations"):
+            summary[key] = {name: int(round(count * scale)) for name, count in summary[key].items()}
+        summary["sampling"] = {
+            "sample_rows": len(sample),
+            "population_rows": population_rows,
+            "scale_factor": round(scale, 4),
+            "estimated": True
+        }
+        return summary
+
+    @staticmethod
+    def generate_summary_report_from_rollup(rollup: Rollup, query_info: Dict) -> Dict[str, Any]:
+        """Summary report combined from site-level rollup cells"""
+        if rollup.records == 0:
+            return ReportGenerator.generate_summary_report(pd.DataFrame(), query_info)
+        
+        cells = rollup.cells
+        
+        def top(column: str) -> pd.Series:
+            counts = cells.groupby(column, observed=True)['records'].sum()
+            return counts[counts > 0].sort_values(ascending=False)
+        
+        parameters = top('CharacteristicName')
+        return {
+            "total_records": rollup.records,
+            "date_range": {
+                "start": cells['first_date'].min().isoformat(),
+                "end": cells['last_date'].max().isoformat()
+            },
+            "parameters": parameters.head(10).to_dict(),
+            "organizations": top('OrganizationIdentifier').head(10).to_dict(),
+            "locations": cells['MonitoringLocationIdentifier'].nunique(),
+            "unique_parameters": len(parameters)
+        }
+
+    @staticmethod
+    def _iso_strings(dates: pd.Series) -> pd.Series:
+        """Format a datetime column as ISO 8601 seconds, leaving NaT as missing"""
+        text = np.datetime_as_string(dates.to_numpy(dtype='datetime64[s]'), unit='s')
+        return pd.Series(text, index=dates.index, dtype=object).where(dates.notna())
+
     @staticmethod
     def generate_detailed_report(df: pd.DataFrame, query_info: Dict) -> List[Dict[str, Any]]:
-        """Generate detailed report with individual records"""
+        """
+        Generate detailed report with individual records
+        
+        Values are converted a column at a time (missing values to None,
+        dates to ISO strings) and only then zipped into per-record dicts.
+        """
         if df.empty:
             return []
         
         # Select relevant columns for detailed report
-        detail_cols = [
-            'OrganizationIdentifier', 'MonitoringLocationIdentifier', 
-            'ActivityStartDate', 'CharacteristicName', 'ResultMeasureValue',
-            'ResultMeasureUnitCode', 'ResultStatusIdentifier', 'ResultCommentText'
+        available_cols = [col for col in DETAIL_COLUMNS if col in df.columns]
+        
+        columns = []
+        for col in available_cols:
+            values = df[col]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                values = ReportGenerator._iso_strings(values)
+            values = values.astype(object)
+            columns.append(values.where(values.notna(), None).tolist())
+        
+        return [dict(zip(available_cols, row)) for row in zip(*columns)]
+
+    @staticmethod
+    def iter_detailed_chunks(df: pd.DataFrame, fmt: str, chunk_size: int) -> Iterator[bytes]:
+        """
+        Serialize detailed report rows as CSV or NDJSON, one chunk at a time
+        
+        Each chunk of chunk_size rows is encoded with pandas' vectorized
+        writers, so memory is bounded by the chunk rather than the result.
+        """
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        
+        available_cols = [col for col in DETAIL_COLUMNS if col in df.columns]
+        date_cols = [
+            col for col in available_cols
+            if pd.api.types.is_datetime64_any_dtype(df[col])
         ]
         
-        available_cols = [col for col in detail_cols if col in df.columns]
-        detail_df = df[available_cols].copy()
+        if df.empty:
+            if fmt == 'csv':
+                yield (','.join(available_cols) + '\n').encode('utf-8')
+            return
+        
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size][available_cols]
+            if date_cols:
+                chunk = chunk.assign(**{
+                    col: ReportGenerator._iso_strings(chunk[col]) for col in date_cols
+                })
+            
+            if fmt == 'csv':
+                text = chunk.to_csv(index=False, header=(start == 0))
+            else:
+                text = chunk.to_json(orient='records', lines=True)
+                if not text.endswith('\n'):
+                    text += '\n'
+            yield text.encode('utf-8')
+
+    @staticmethod
+    def iter_columnar_chunks(
+        df: pd.DataFrame,
+        fmt: str,
+        batch_rows: int,
+        metadata: Dict[str, Any],
+        compression: Optional[str] = 'zstd'
+    ) -> Iterator[bytes]:
+        """
+        Write detailed report rows as an Arrow IPC stream or a Parquet file
         
-        # Convert to records
-        records = detail_df.to_dict('records')
+        Columns keep their cleaned dtypes (categoricals become dictionary
+        columns) and each batch of batch_rows rows is converted and written
+        on its own, as an IPC record batch or a Parquet row group. metadata
+        is stored as JSON values in the schema metadata, alongside pandas'
+        own, so readers get it without reading any rows.
+        """
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported columnar format: {fmt}")
         
-        # Clean up records
-        for record in records:
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = None
-                elif isinstance(value, pd.Timestamp):
-                    record[key] = value.isoformat()
+        available_cols = [col for col in DETAIL_COLUMNS if col in df.columns]
+        df = df[available_cols]
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        schema = schema.with_metadata({
+            **(schema.metadata or {}),
+            **{key: json.dumps(value, default=str) for key, value in metadata.items()}
+        })
         
-        return records
+        sink = _ChunkSink()
+        if fmt == 'arrow':
+            writer = pa.ipc.new_stream(
+                sink, schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+            )
+            write = writer.write_batch
+        else:
+            writer = pq.ParquetWriter(sink, schema, compression=compression or 'none')
+            write = writer.write_batch
+        
+        try:
+            for start in range(0, len(df), batch_rows):
+                chunk = df.iloc[start:start + batch_rows]
+                write(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def _trend_periods(dates: pd.Series, granularity: str) -> pd.Series:
+        """Map sample dates to a numeric period start expressed in fractional years"""
+        return ReportGenerator._periods_from_parts(dates.dt.year, dates.dt.month, granularity)
+
+    @staticmethod
+    def _periods_from_parts(year: pd.Series, month: pd.Series, granularity: str) -> pd.Series:
+        """Numeric period start, in fractional years, for each year and month"""
+        if granularity == 'yearly':
+            return year.astype('float64')
+        if granularity == 'monthly':
+            return year + (month - 1) / 12
+        if granularity == 'seasonal':
+            # Meteorological seasons; December belongs to the following winter
+            return year + (month == 12) + (month % 12 // 3) / 4
+        raise ValueError(f"Unsupported trend granularity: {granularity}")
+
+    @staticmethod
+    def _period_label(period: float, granularity: str) -> Any:
+        """Convert a numeric period from _trend_periods back into a readable key"""
+        year = int(period + 1e-9)
+        if granularity == 'yearly':
+            return year
+        if granularity == 'monthly':
+            return f"{year}-{round((period - year) * 12) + 1:02d}"
+        return f"{year}-{SEASONS[round((period - year) * 4)]}"
 
     @staticmethod
-    def generate_trend_report(df: pd.DataFrame, query_info: Dict) -> Dict[str, Any]:
-        """Generate trend analysis report"""
+    def _mann_kendall_block(values: np.ndarray, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Mann-Kendall S and Sen's slope for each row of values, broadcast over period pairs"""
+        n_periods = len(times)
+        upper = np.triu(np.ones((n_periods, n_periods), dtype=bool), k=1)
+        diffs = values[:, None, :] - values[:, :, None]
+        valid = upper & ~np.isnan(diffs)
+        s = np.where(valid, np.sign(diffs), 0).sum(axis=(1, 2))
+        
+        time_diffs = times[None, :] - times[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = np.where(valid, diffs / time_diffs, np.nan)
+        slopes = slopes.reshape(len(values), -1)
+        has_slope = valid.reshape(len(values), -1).any(axis=1)
+        sen = np.full(len(values), np.nan)
+        if has_slope.any():
+            sen[has_slope] = np.nanmedian(slopes[has_slope], axis=1)
+        return s, sen
+    
+    @staticmethod
+    def _mann_kendall_series(values: np.ndarray, times: np.ndarray) -> Tuple[float, float]:
+        """Mann-Kendall S and Sen's slope of one series, one period at a time"""
+        keep = ~np.isnan(values)
+        values, times = values[keep], times[keep]
+        k = len(values)
+        slopes = np.empty(k * (k - 1) // 2)
+        s = 0.0
+        start = 0
+        for i in range(k - 1):
+            diffs = values[i + 1:] - values[i]
+            s += np.sign(diffs).sum()
+            slopes[start:start + len(diffs)] = diffs / (times[i + 1:] - times[i])
+            start += len(diffs)
+        return s, float(np.median(slopes)) if len(slopes) else np.nan
+    
+    @staticmethod
+    def _trend_statistics(series: pd.DataFrame) -> List[Dict[str, Any]]:
+        """
+        Mann-Kendall test and Sen's slope for each row of a (group x period) frame
+        
+        Columns are numeric periods in fractional years. Groups are evaluated
+        in blocks broadcast over period pairs, sized to TREND_PAIR_BUDGET;
+        series with more periods than one block allows (e.g. monthly over
+        decades) are evaluated one at a time. The variance of S omits the
+        tie correction.
+        """
+        values = series.to_numpy(dtype='float64')
+        times = series.columns.to_numpy(dtype='float64')
+        n_periods = len(times)
+        
+        s = np.zeros(len(values))
+        sen = np.full(len(values), np.nan)
+        block = TREND_PAIR_BUDGET // max(1, n_periods * n_periods)
+        if block:
+            for start in range(0, len(values), block):
+                s[start:start + block], sen[start:start + block] = ReportGenerator._mann_kendall_block(
+                    values[start:start + block], times
+                )
+        else:
+            for i in range(len(values)):
+                s[i], sen[i] = ReportGenerator._mann_kendall_series(values[i], times)
+        
+        n = (~np.isnan(values)).sum(axis=1)
+        var_s = n * (n - 1) * (2 * n + 5) / 18.0
+        sd_s = np.sqrt(np.where(var_s > 0, var_s, np.nan))
+        z = np.where(s > 0, (s - 1) / sd_s, np.where(s < 0, (s + 1) / sd_s, 0.0))
+        pairs = n * (n - 1) / 2.0
+        tau = np.where(pairs > 0, s / np.where(pairs > 0, pairs, 1), np.nan)
+        
+        results = []
+        for i in range(len(values)):
+            if n[i] < MIN_TREND_PERIODS:
+                results.append({"periods": int(n[i]), "trend": "insufficient data"})
+                continue
+            p_value = math.erfc(abs(z[i]) / math.sqrt(2))
+            if p_value < TREND_ALPHA:
+                trend = "increasing" if s[i] > 0 else "decreasing"
+            else:
+                trend = "no trend"
+            results.append({
+                "periods": int(n[i]),
+                "mann_kendall_s": int(s[i]),
+                "kendall_tau": round(float(tau[i]), 4),
+                "z_score": round(float(z[i]), 4),
+                "p_value": round(p_value, 4),
+                "trend": trend,
+                "sens_slope_per_year": round(float(sen[i]), 6)
+            })
+        return results
+
+    @staticmethod
+    def generate_trend_report(
+        df: pd.DataFrame,
+        query_info: Dict,
+        granularity: str = 'yearly',
+        by_unit: bool = False,
+        trend_statistics: bool = False,
+        plan: Optional[AggregationPlan] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate trend analysis report
+        
+        Statistics for every characteristic (and optionally unit) and period
+        come from a single groupby over the frame, which is not modified.
+        Trend statistics are computed on the series of period medians.
+        """
         if df.empty or 'ActivityStartDate' not in df.columns:
             return {"error": "Insufficient data for trend analysis"}
+        if 'ResultMeasureValue' not in df.columns:
+            return {}
+        
+        by_unit = by_unit and 'ResultMeasureUnitCode' in df.columns
+        group_keys = [df['CharacteristicName']]
+        if by_unit:
+            group_keys.append(unknown_units(df['ResultMeasureUnitCode']))
+        
+        period = ReportGenerator._trend_periods(df['ActivityStartDate'], granularity)
+        period.name = 'Period'
+        
+        stats = df['ResultMeasureValue'].groupby(
+            group_keys + [period], observed=True, sort=True
+        ).agg(['count', 'mean', 'median', 'std', 'min', 'max']).round(3)
+        if by_unit:
+            totals = df.groupby(group_keys, observed=True, sort=True).size()
+        else:
+            totals = (plan or AggregationPlan(df)).characteristic_counts().sort_index()
         
-        # Group by year and parameter
-        df['Year'] = df['ActivityStartDate'].dt.year
+        return ReportGenerator._assemble_trend(stats, totals, granularity, by_unit, trend_statistics)
+
+    @staticmethod
+    def generate_trend_report_from_rollup(
+        rollup: Rollup,
+        query_info: Dict,
+        granularity: str = 'yearly',
+        by_unit: bool = False,
+        trend_statistics: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Trend analysis report combined from rollup cells
+        
+        Counts, means, standard deviations and extremes are exact up to
+        floating point; medians come from the merged quantile sketches.
+        """
+        if rollup.empty:
+            return {"error": "Insufficient data for trend analysis"}
+        
+        def group_keys(frame: pd.DataFrame) -> List[pd.Series]:
+            keys = [frame['CharacteristicName']]
+            if by_unit:
+                keys.append(unknown_units(frame['ResultMeasureUnitCode']))
+            period = ReportGenerator._periods_from_parts(
+                frame['year'].astype('int64'), frame['month'].astype('int64'), granularity
+            )
+            period.name = 'Period'
+            return keys + [period]
+        
+        cells = rollup.cells
+        sums = cells[['records', 'count', 'sum', 'sum_sq', 'min', 'max']].groupby(
+            group_keys(cells), observed=True, sort=True
+        ).agg({'records': 'sum', 'count': 'sum', 'sum': 'sum', 'sum_sq': 'sum', 'min': 'min', 'max': 'max'})
+        
+        count = sums['count'].astype('int64')
+        mean = (sums['sum'] / count).where(count > 0)
+        variance = (sums['sum_sq'] - sums['sum'] * mean) / (count - 1)
+        medians = Rollup.weighted_medians(rollup.centroids, group_keys(rollup.centroids))
+        
+        stats = pd.DataFrame({
+            'count': count,
+            'mean': mean,
+            'median': medians.reindex(sums.index),
+            'std': np.sqrt(variance.clip(lower=0)).where(count > 1),
+            'min': sums['min'],
+            'max': sums['max']
+        }).round(3)
+        n_keys = 2 if by_unit else 1
+        totals = sums['records'].groupby(level=list(range(n_keys)), observed=True, sort=True).sum()
+        
+        return ReportGenerator._assemble_trend(stats, totals, granularity, by_unit, trend_statistics)
+
+    @staticmethod
+    def _assemble_trend(
+        stats: pd.DataFrame,
+        totals: pd.Series,
+        granularity: str,
+        by_unit: bool,
+        trend_statistics: bool
+    ) -> Dict[str, Any]:
+        """
+        Nest per-period statistics under each characteristic (and unit)
+        
+        stats is indexed by the group keys plus a numeric Period level;
+        totals holds the record count of each group.
+        """
+        n_keys = 2 if by_unit else 1
+        
+        statistic_key = f"{granularity}_statistics"
+        stats_dict = stats.astype(object).where(stats.notna(), None).to_dict('index')
+        
+        groups: Dict[Any, Dict[str, Any]] = {
+            (key if n_keys > 1 else (key,)): {statistic_key: {}} for key in totals.index
+        }
+        for key, row in stats_dict.items():
+            group, period_value = key[:n_keys], key[n_keys]
+            entry = groups[group]
+            label = ReportGenerator._period_label(period_value, granularity)
+            entry[statistic_key][label] = row
         
-        trend_data = {}
-        for param in df['CharacteristicName'].unique():
-            if pd.isna(param):
+        if trend_statistics and groups:
+            medians = stats['median'].unstack('Period')
+            for key, result in zip(medians.index, ReportGenerator._trend_statistics(medians)):
+                group = key if isinstance(key, tuple) else (key,)
+                groups[group]['trend_statistics'] = result
+        
+        trend_data: Dict[str, Any] = {}
+        for group, entry in groups.items():
+            entry['total_samples'] = int(totals[group if n_keys > 1 else group[0]])
+            if granularity == 'yearly':
+                entry['years_covered'] = len(entry[statistic_key])
+            else:
+                entry['periods_covered'] = len(entry[statistic_key])
+            
+            if by_unit:
+                param, unit = group
+                trend_data.setdefault(param, {'units': {}})['units'][unit] = entry
+            else:
+                trend_data[group[0]] = entry
+        
+        return trend_data
+
+    @staticmethod
+    def _category_codes(values: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+        """Category codes of a column (-1 where missing) and its categories"""
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        return values.cat.codes.to_numpy(), values.cat.categories
+
+    @staticmethod
+    def _threshold_flags(df: pd.DataFrame, thresholds: Dict[str, Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per-row flags of results compared against a threshold, and of those outside it
+        
+        Limits are arranged by characteristic category code and gathered
+        with the row codes, so the cost is one pass over the rows however
+        many characteristics have thresholds.
+        """
+        char_codes, characteristics = ReportGenerator._category_codes(df['CharacteristicName'])
+        if 'ResultMeasureUnitCode' in df.columns:
+            unit_codes, units = ReportGenerator._category_codes(df['ResultMeasureUnitCode'])
+        else:
+            unit_codes, units = np.full(len(df), -1), pd.Index([])
+        
+        # One slot per category plus a trailing one, which missing codes (-1) select
+        n_slots = len(characteristics) + 1
+        has_threshold = np.zeros(n_slots, dtype=bool)
+        lower = np.full(n_slots, -np.inf)
+        upper = np.full(n_slots, np.inf)
+        # -1 compares any unit; -2 matches no unit code
+        required_unit = np.full(n_slots, -1)
+        for name, limits in thresholds.items():
+            if name not in characteristics:
                 continue
-                
-            param_data = df[df['CharacteristicName'] == param]
-            if 'ResultMeasureValue' in param_data.columns:
-                yearly_stats = param_data.groupby('Year')['ResultMeasureValue'].agg([
-                    'count', 'mean', 'median', 'std', 'min', 'max'
-                ]).round(3)
-                
-                trend_data[param] = {
-                    'yearly_statistics': yearly_stats.to_dict('index'),
-                    'total_samples': len(param_data),
-                    'years_covered': len(yearly_stats)
+            slot = characteristics.get_loc(name)
+            has_threshold[slot] = True
+            if limits.get('min') is not None:
+                lower[slot] = limits['min']
+            if limits.get('max') is not None:
+                upper[slot] = limits['max']
+            if limits.get('unit') is not None:
+                required_unit[slot] = units.get_loc(limits['unit']) if limits['unit'] in units else -2
+        
+        values = df['ResultMeasureValue'].to_numpy(dtype='float64', na_value=np.nan)
+        required = required_unit[char_codes]
+        compared = has_threshold[char_codes] & ~np.isnan(values) & ((required == -1) | (required == unit_codes))
+        exceeded = compared & ((values < lower[char_codes]) | (values > upper[char_codes]))
+        return compared, exceeded
+
+    @staticmethod
+    def generate_comparison_report(
+        df: pd.DataFrame,
+        query_info: Dict,
+        percentiles: Sequence[float] = COMPARISON_PERCENTILES,
+        thresholds: Optional[Dict[str, Dict[str, Any]]] = None,
+        by_unit: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Compare monitoring locations for each characteristic (and optionally unit)
+        
+        One groupby over characteristic and site gives each site's count,
+        median, percentiles, extremes and threshold exceedances. Only the
+        site and characteristic pairs present in the data are produced, so
+        the cost follows the rows rather than sites x characteristics.
+        Sites are ranked by median within each characteristic, highest first.
+        """
+        if df.empty or 'ResultMeasureValue' not in df.columns:
+            return {"error": "Insufficient data for comparison"}
+        
+        thresholds = thresholds or {}
+        percentiles = sorted(set(percentiles))
+        by_unit = by_unit and 'ResultMeasureUnitCode' in df.columns
+        group_keys = [df['CharacteristicName']]
+        if by_unit:
+            group_keys.append(unknown_units(df['ResultMeasureUnitCode']))
+        n_keys = len(group_keys)
+        
+        compared, exceeded = ReportGenerator._threshold_flags(df, thresholds)
+        frame = pd.DataFrame(
+            {'value': df['ResultMeasureValue'], 'compared': compared, 'exceeded': exceeded},
+            index=df.index
+        )
+        grouped = frame.groupby(group_keys + [df['MonitoringLocationIdentifier']], observed=True, sort=True)
+        
+        stats = grouped['value'].agg(['count', 'median', 'min', 'max'])
+        if percentiles:
+            bands = grouped['value'].quantile([p / 100 for p in percentiles]).unstack()
+            bands.columns = [f"p{p:g}" for p in percentiles]
+            stats = stats.join(bands)
+        stats = stats.round(3)
+        
+        group_levels = list(range(n_keys))
+        stats['rank'] = stats['median'].groupby(level=group_levels, observed=True).rank(
+            ascending=False, method='min'
+        ).astype('Int64')
+        
+        # Exceedance columns stay empty for characteristics without a threshold
+        counts = grouped[['compared', 'exceeded']].sum()
+        has_threshold = stats.index.get_level_values(0).isin(list(thresholds))
+        stats['compared'] = counts['compared'].astype('Int64').where(has_threshold)
+        stats['exceedances'] = counts['exceeded'].astype('Int64').where(has_threshold)
+        stats['exceedance_rate'] = (counts['exceeded'] / counts['compared'].where(counts['compared'] > 0)).round(4)
+        
+        by_group = stats.groupby(level=group_levels, observed=True, sort=True)
+        overview = pd.DataFrame({
+            'sites': by_group.size(),
+            'median_of_site_medians': by_group['median'].median().round(3),
+            'sites_exceeding': (stats['exceedances'] > 0).groupby(level=group_levels, observed=True).sum()
+        })
+        overview_dict = overview.astype(object).where(overview.notna(), None).to_dict('index')
+        cells = stats.astype(object).where(stats.notna(), None).to_dict('index')
+        
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for key, row in overview_dict.items():
+            group = key if n_keys > 1 else (key,)
+            entry = groups[group] = row
+            if group[0] in thresholds:
+                entry['threshold'] = thresholds[group[0]]
+            else:
+                entry['sites_exceeding'] = None
+            entry['locations'] = {}
+        for key, row in cells.items():
+            groups[key[:n_keys]]['locations'][key[n_keys]] = row
+        
+        comparison: Dict[str, Any] = {}
+        for group, entry in groups.items():
+            if by_unit:
+                param, unit = group
+                comparison.setdefault(param, {'units': {}})['units'][unit] = entry
+            else:
+                comparison[group[0]] = entry
+        
+        characteristics = set(df['CharacteristicName'].dropna().unique())
+        return {
+            "total_records": len(df),
+            "locations": df['MonitoringLocationIdentifier'].nunique(),
+            "characteristics": len(comparison),
+            "percentiles": percentiles,
+            "unmatched_thresholds": sorted(name for name in thresholds if name not in characteristics),
+            "comparison": comparison
+        }
+
+    @staticmethod
+    def generate_spatial_report(
+        df: pd.DataFrame,
+        query_info: Dict,
+        zones: Dict[str, pd.Series],
+        grid_degrees: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Aggregate results by the zone of their monitoring location
+        
+        zones maps each level (e.g. 'huc8', 'grid') to a series of zone
+        labels indexed by MonitoringLocationIdentifier. Zones are looked up
+        once per site category and gathered onto the rows by code, then
+        one groupby per level gives each zone's statistics by
+        characteristic. Grid zones also carry their bounds.
+        """
+        if df.empty or 'ResultMeasureValue' not in df.columns:
+            return {"error": "Insufficient data for spatial aggregation"}
+        
+        site_codes, sites = ReportGenerator._category_codes(df['MonitoringLocationIdentifier'])
+        observed_sites = np.unique(site_codes[site_codes >= 0])
+        
+        levels: Dict[str, Any] = {}
+        for level, site_zones in zones.items():
+            zone_of_site, labels = pd.factorize(site_zones.reindex(sites).to_numpy(dtype=object))
+            # Missing site codes (-1) select the trailing unmapped slot
+            row_zones = np.append(zone_of_site, -1)[site_codes]
+            mapped = row_zones >= 0
+            zone = pd.Series(pd.Categorical.from_codes(row_zones, labels), index=df.index, name='zone')
+            
+            stats = df['ResultMeasureValue'].groupby(
+                [zone, df['CharacteristicName']], observed=True, sort=True
+            ).agg(['count', 'mean', 'median', 'min', 'max']).round(3)
+            stats_dict = stats.astype(object).where(stats.notna(), None).to_dict('index')
+            
+            records = np.bincount(row_zones[mapped], minlength=len(labels))
+            site_zone_codes = zone_of_site[observed_sites]
+            locations = np.bincount(site_zone_codes[site_zone_codes >= 0], minlength=len(labels))
+            
+            entries: Dict[str, Dict[str, Any]] = {}
+            for code in np.flatnonzero(records):
+                label = labels[code]
+                entry = entries[label] = {
+                    "records": int(records[code]),
+                    "locations": int(locations[code]),
+                    "parameters": {}
                 }
+                if level == 'grid' and grid_degrees:
+                    entry["bounds"] = grid_cell_bounds(label, grid_degrees)
+            for (label, characteristic), row in stats_dict.items():
+                entries[label]["parameters"][characteristic] = row
+            
+            levels[level] = {
+                "zone_count": len(entries),
+                "mapped_records": int(mapped.sum()),
+                "unmapped_records": int((~mapped).sum()),
+                "unmapped_locations": int((site_zone_codes < 0).sum()),
+                "zones": dict(sorted(entries.items()))
+            }
         
-        return trend_data
\ No newline at end of file
+        result: Dict[str, Any] = {"total_records": len(df), "levels": levels}
+        if grid_degrees and 'grid' in zones:
+            result["grid_degrees"] = grid_degrees
+        return result
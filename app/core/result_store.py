@@ -0,0 +1,326 @@
+"""
+Local columnar store of cleaned WQP results with incremental refresh
+"""
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from app.config import get_settings
+from app.core.cache import make_cache_key
+from app.core.data_processor import DataProcessor
+from app.core.rollups import ROLLUP_LEVELS, ROLLUP_SOURCE_COLUMNS, Rollup, month_index
+
+Interval = Tuple[date, date]
+
+DATE_PARAMS = ('startDateLo', 'startDateHi')
+
+
+class ResultStore:
+    """
+    Parquet store of cleaned WQP results, partitioned by filter and year
+
+    Each distinct set of non-date query filters (state, HUC, characteristic,
+    ...) gets its own directory holding one Parquet file per year of
+    ActivityStartDate and a coverage manifest listing the date intervals
+    already fetched. Queries only go upstream for the intervals that are
+    missing, plus the most recent refresh_days, which WQP may still revise.
+
+    With rollup_sketch_size set, every year file written also gets rollups
+    of its rows (see app.core.rollups) at each level of ROLLUP_LEVELS, which
+    summary and trend reports combine instead of reading the rows.
+    """
+
+    def __init__(self, root: Path, refresh_days: int = 0, rollup_sketch_size: Optional[int] = None):
+        self.root = Path(root)
+        self.refresh_days = refresh_days
+        self.rollup_sketch_size = rollup_sketch_size
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def split_query(query_params: Dict[str, Any]) -> Tuple[Dict[str, Any], date, date]:
+        """Separate query params into date-free filters and an inclusive date range"""
+        filter_params = {k: v for k, v in query_params.items() if k not in DATE_PARAMS}
+        start = datetime.strptime(query_params['startDateLo'], '%m-%d-%Y').date()
+        if 'startDateHi' in query_params:
+            end = datetime.strptime(query_params['startDateHi'], '%m-%d-%Y').date()
+        else:
+            end = date.today()
+        return filter_params, start, min(end, date.today())
+
+    @staticmethod
+    def supports(query_params: Dict[str, Any]) -> bool:
+        """Only queries with a lower date bound can be answered from the store"""
+        return 'startDateLo' in query_params
+
+    @staticmethod
+    def date_params(start: date, end: date) -> Dict[str, str]:
+        """WQP date params for an inclusive interval"""
+        return {
+            'startDateLo': start.strftime('%m-%d-%Y'),
+            'startDateHi': end.strftime('%m-%d-%Y')
+        }
+
+    def _lock(self, filter_params: Dict[str, Any]) -> threading.Lock:
+        """Per-filter lock serializing ingests into the same partition set"""
+        key = self._filter_key(filter_params)
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _filter_key(self, filter_params: Dict[str, Any]) -> str:
+        return make_cache_key(filter_params).split(':', 1)[1][:24]
+
+    def _filter_dir(self, filter_params: Dict[str, Any]) -> Path:
+        return self.root / self._filter_key(filter_params)
+
+    def _year_path(self, filter_params: Dict[str, Any], year: int) -> Path:
+        return self._filter_dir(filter_params) / f"year={year}.parquet"
+
+    def _rollup_paths(self, filter_params: Dict[str, Any], year: int, level: str) -> Tuple[Path, Path]:
+        filter_dir = self._filter_dir(filter_params)
+        return (
+            filter_dir / f"year={year}.{level}-cells.parquet",
+            filter_dir / f"year={year}.{level}-centroids.parquet"
+        )
+
+    def _manifest_path(self, filter_params: Dict[str, Any]) -> Path:
+        return self._filter_dir(filter_params) / "coverage.json"
+
+    @staticmethod
+    def _atomic_write(path: Path, write) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_name)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def coverage(self, filter_params: Dict[str, Any]) -> List[Interval]:
+        """Date intervals already stored for these filters"""
+        path = self._manifest_path(filter_params)
+        if not path.exists():
+            return []
+        manifest = json.loads(path.read_text())
+        return [
+            (date.fromisoformat(lo), date.fromisoformat(hi))
+            for lo, hi in manifest['intervals']
+        ]
+
+    def last_modified(self, filter_params: Dict[str, Any]) -> Optional[datetime]:
+        """When data was last ingested for these filters, from the manifest's mtime"""
+        path = self._manifest_path(filter_params)
+        if not path.exists():
+            return None
+        return datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+
+    @staticmethod
+    def _merge_intervals(intervals: List[Interval]) -> List[Interval]:
+        merged: List[Interval] = []
+        for lo, hi in sorted(intervals):
+            if merged and lo <= merged[-1][1] + timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((lo, hi))
+        return merged
+
+    def missing_intervals(self, filter_params: Dict[str, Any], start: date, end: date) -> List[Interval]:
+        """Sub-intervals of [start, end] that must be fetched from WQP"""
+        fresh_until = date.today() - timedelta(days=self.refresh_days)
+        gaps: List[Interval] = []
+        cursor = start
+        for lo, hi in self.coverage(filter_params):
+            hi = min(hi, fresh_until)
+            if hi < cursor or lo > end:
+                continue
+            if lo > cursor:
+                gaps.append((cursor, lo - timedelta(days=1)))
+            cursor = max(cursor, hi + timedelta(days=1))
+            if cursor > end:
+                break
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def ingest(self, filter_params: Dict[str, Any], df: pd.DataFrame, start: date, end: date) -> int:
+        """
+        Store freshly fetched rows for [start, end] and mark the interval covered
+
+        Rows already stored for the interval are replaced. Returns the
+        number of fetched rows stored.
+        """
+        with self._lock(filter_params):
+            return self._ingest(filter_params, df, start, end)
+
+    def _ingest(self, filter_params: Dict[str, Any], df: pd.DataFrame, start: date, end: date) -> int:
+        filter_dir = self._filter_dir(filter_params)
+        filter_dir.mkdir(parents=True, exist_ok=True)
+        (filter_dir / "filter.json").write_text(json.dumps(filter_params, sort_keys=True))
+
+        if not df.empty:
+            df = df[df['ActivityStartDate'].notna()]
+        years = df['ActivityStartDate'].dt.year if not df.empty else pd.Series(dtype='int64')
+        lo_ts, hi_ts = pd.Timestamp(start), pd.Timestamp(end)
+
+        for year in range(start.year, end.year + 1):
+            path = self._year_path(filter_params, year)
+            new_rows = df[years == year] if not df.empty else df
+            if path.exists():
+                existing = pd.read_parquet(path)
+                in_interval = existing['ActivityStartDate'].between(lo_ts, hi_ts)
+                new_rows = pd.concat([existing[~in_interval], new_rows], ignore_index=True)
+            if new_rows.empty:
+                continue
+            new_rows = DataProcessor.optimize_dtypes(new_rows.reset_index(drop=True))
+            self._atomic_write(path, lambda tmp: new_rows.to_parquet(tmp, index=False, compression='zstd'))
+            if self.rollup_sketch_size:
+                self._write_rollups(filter_params, year, new_rows)
+
+        intervals = self._merge_intervals(self.coverage(filter_params) + [(start, end)])
+        manifest = {'intervals': [[lo.isoformat(), hi.isoformat()] for lo, hi in intervals]}
+        self._atomic_write(
+            self._manifest_path(filter_params),
+            lambda tmp: Path(tmp).write_text(json.dumps(manifest))
+        )
+        return len(df)
+
+    def read(
+        self,
+        filter_params: Dict[str, Any],
+        start: date,
+        end: date,
+        columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """Read stored rows for [start, end], pushing the date filter into Parquet"""
+        paths = [
+            self._year_path(filter_params, year)
+            for year in range(start.year, end.year + 1)
+        ]
+        paths = [path for path in paths if path.exists()]
+        if not paths:
+            return pd.DataFrame()
+
+        filters = [
+            ('ActivityStartDate', '>=', pd.Timestamp(start)),
+            ('ActivityStartDate', '<=', pd.Timestamp(end)),
+        ]
+        frames = []
+        for path in paths:
+            path_columns = columns
+            if columns is not None:
+                schema_names = set(pq.read_schema(path).names)
+                path_columns = [col for col in columns if col in schema_names]
+            frames.append(pd.read_parquet(path, columns=path_columns, filters=filters))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        if len(frames) == 1:
+            return frames[0]
+        return DataProcessor.optimize_dtypes(pd.concat(frames, ignore_index=True))
+
+    def _write_rollups(self, filter_params: Dict[str, Any], year: int, rows: pd.DataFrame) -> Dict[str, Rollup]:
+        """Build and store each rollup level for a year's rows"""
+        site = Rollup.build(rows, self.rollup_sketch_size)
+        rollups = {
+            level: site if level == 'site' else site.coarsen(keys, self.rollup_sketch_size)
+            for level, keys in ROLLUP_LEVELS.items()
+        }
+        for level, rollup in rollups.items():
+            cells_path, centroids_path = self._rollup_paths(filter_params, year, level)
+            self._atomic_write(cells_path, lambda tmp: rollup.cells.to_parquet(tmp, index=False, compression='zstd'))
+            self._atomic_write(centroids_path, lambda tmp: rollup.centroids.to_parquet(tmp, index=False, compression='zstd'))
+        return rollups
+
+    def _ensure_rollups(self, filter_params: Dict[str, Any], year: int) -> None:
+        """Build a year's rollups from its stored rows if they are missing"""
+        with self._lock(filter_params):
+            if all(path.exists() for level in ROLLUP_LEVELS for path in self._rollup_paths(filter_params, year, level)):
+                return
+            year_path = self._year_path(filter_params, year)
+            if not year_path.exists():
+                return
+            schema_names = set(pq.read_schema(year_path).names)
+            rows = pd.read_parquet(year_path, columns=[col for col in ROLLUP_SOURCE_COLUMNS if col in schema_names])
+            self._write_rollups(filter_params, year, rows)
+
+    @staticmethod
+    def _read_tables(paths: List[Path], columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """Read several Parquet files in one call, unifying their dictionaries"""
+        paths = [str(path) for path in paths if path.exists()]
+        if not paths:
+            return None
+        return pq.read_table(paths, columns=columns).to_pandas()
+
+    @staticmethod
+    def _month_end(day: date) -> date:
+        next_month = day.replace(day=28) + timedelta(days=4)
+        return next_month - timedelta(days=next_month.day)
+
+    def read_rollup(
+        self,
+        filter_params: Dict[str, Any],
+        start: date,
+        end: date,
+        level: str = 'site',
+        centroids: bool = True,
+        columns: Optional[List[str]] = None
+    ) -> Rollup:
+        """
+        Rollup of stored rows for [start, end] at one level of ROLLUP_LEVELS
+
+        Whole months come from the per-year rollups, built from the stored
+        rows where missing; partial months at either end are aggregated
+        from the rows directly. columns limits the cell columns read, and
+        without centroids no sketches are read.
+        """
+        def from_rows(lo: date, hi: date) -> Rollup:
+            rows = self.read(filter_params, lo, hi, ROLLUP_SOURCE_COLUMNS)
+            rollup = Rollup.build(rows, self.rollup_sketch_size)
+            if level != 'site':
+                rollup = rollup.coarsen(ROLLUP_LEVELS[level], self.rollup_sketch_size)
+            return rollup
+
+        starts_mid_month = start.day > 1
+        ends_mid_month = end != self._month_end(end)
+        first = month_index(start.year, start.month) + starts_mid_month
+        last = month_index(end.year, end.month) - ends_mid_month
+        if first > last:
+            return from_rows(start, end)
+
+        years = range(first // 12, last // 12 + 1)
+        for year in years:
+            self._ensure_rollups(filter_params, year)
+        paths = [self._rollup_paths(filter_params, year, level) for year in years]
+        with self._lock(filter_params):
+            cells = self._read_tables([cells_path for cells_path, _ in paths], columns)
+            sketches = self._read_tables([centroids_path for _, centroids_path in paths]) if centroids else None
+        empty = Rollup.empty_rollup()
+        parts = [Rollup(
+            cells if cells is not None else empty.cells,
+            sketches if sketches is not None else empty.centroids
+        ).months(first, last)]
+        if starts_mid_month:
+            parts.append(from_rows(start, self._month_end(start)))
+        if ends_mid_month:
+            parts.append(from_rows(end.replace(day=1), end))
+        return Rollup.concat(parts)
+
+
+@lru_cache()
+def get_result_store() -> ResultStore:
+    settings = get_settings()
+    return ResultStore(
+        Path(settings.result_store_path),
+        settings.result_store_refresh_days,
+        rollup_sketch_size=settings.rollup_sketch_size if settings.rollups_enabled else None
+    )
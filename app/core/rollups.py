@@ -0,0 +1,209 @@
+"""
+Rollup tables: per site, characteristic, unit and month aggregates of results
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Cells are keyed by these columns plus year and month
+ROLLUP_KEYS = ['OrganizationIdentifier', 'MonitoringLocationIdentifier',
+               'CharacteristicName', 'ResultMeasureUnitCode']
+CELL_KEYS = ROLLUP_KEYS + ['year', 'month']
+
+# Keys of each stored rollup level: per site, and merged across sites
+ROLLUP_LEVELS = {
+    'site': ROLLUP_KEYS,
+    'region': ['CharacteristicName', 'ResultMeasureUnitCode']
+}
+
+# Rollup level each report section is combined from
+SECTION_LEVELS = {'summary': 'site', 'trend': 'region'}
+
+# Cell columns summary reports read
+SUMMARY_CELL_COLUMNS = ['OrganizationIdentifier', 'MonitoringLocationIdentifier', 'CharacteristicName',
+                        'year', 'month', 'records', 'first_date', 'last_date']
+
+# Raw columns a rollup is built from
+ROLLUP_SOURCE_COLUMNS = ROLLUP_KEYS + ['ActivityStartDate', 'ResultMeasureValue']
+
+CELL_COLUMNS = CELL_KEYS + ['records', 'count', 'sum', 'sum_sq', 'min', 'max', 'first_date', 'last_date']
+CENTROID_COLUMNS = CELL_KEYS + ['value', 'weight']
+
+# How each cell statistic combines when cells are merged
+CELL_AGGREGATIONS = {
+    'records': 'sum', 'count': 'sum', 'sum': 'sum', 'sum_sq': 'sum',
+    'min': 'min', 'max': 'max', 'first_date': 'min', 'last_date': 'max'
+}
+
+
+class Rollup:
+    """
+    Mergeable aggregates of cleaned results
+
+    cells holds one row per (organization, site, characteristic, unit,
+    year, month) with the record count and the count, sum, sum of squares,
+    min and max of measured values. centroids is a quantile sketch of the
+    values in each cell: up to sketch_size (value, weight) pairs, each the
+    mean of an equal-rank bucket. Cells with at most sketch_size values
+    keep every value, so their medians are exact. coarsen() merges cells
+    over fewer keys, recompressing their sketches.
+    """
+
+    def __init__(self, cells: pd.DataFrame, centroids: pd.DataFrame):
+        self.cells = cells
+        self.centroids = centroids
+
+    @property
+    def empty(self) -> bool:
+        return self.cells.empty
+
+    @property
+    def records(self) -> int:
+        return int(self.cells['records'].sum()) if not self.cells.empty else 0
+
+    @staticmethod
+    def empty_rollup() -> 'Rollup':
+        return Rollup(pd.DataFrame(columns=CELL_COLUMNS), pd.DataFrame(columns=CENTROID_COLUMNS))
+
+    @staticmethod
+    def build(df: pd.DataFrame, sketch_size: int) -> 'Rollup':
+        """Aggregate cleaned result rows; rows without a date are skipped"""
+        if df.empty or 'ActivityStartDate' not in df.columns:
+            return Rollup.empty_rollup()
+        df = df[df['ActivityStartDate'].notna()]
+
+        dates = df['ActivityStartDate']
+        values = (
+            df['ResultMeasureValue'].astype('float64')
+            if 'ResultMeasureValue' in df.columns
+            else pd.Series(np.nan, index=df.index)
+        )
+        frame = pd.DataFrame({
+            **{key: df[key] if key in df.columns else pd.Series(np.nan, index=df.index) for key in ROLLUP_KEYS},
+            'year': dates.dt.year.astype('int16'),
+            'month': dates.dt.month.astype('int8'),
+            'value': values,
+            'value_sq': values * values,
+            'date': dates
+        })
+
+        grouped = frame.groupby(CELL_KEYS, observed=True, dropna=False, sort=True)
+        cells = grouped.agg(
+            records=('date', 'size'),
+            count=('value', 'count'),
+            sum=('value', 'sum'),
+            sum_sq=('value_sq', 'sum'),
+            min=('value', 'min'),
+            max=('value', 'max'),
+            first_date=('date', 'min'),
+            last_date=('date', 'max')
+        ).reset_index()
+
+        measured = frame.loc[frame['value'].notna(), CELL_KEYS + ['value']].assign(weight=1.0)
+        return Rollup(cells, Rollup._compress(measured, CELL_KEYS, sketch_size))
+
+    @staticmethod
+    def _compress(centroids: pd.DataFrame, keys: List[str], sketch_size: int) -> pd.DataFrame:
+        """Merge each group's weighted values into at most sketch_size equal-rank centroids"""
+        if centroids.empty:
+            return pd.DataFrame(columns=keys + ['value', 'weight'])
+        codes = centroids.groupby(keys, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        values = centroids['value'].to_numpy(dtype='float64')
+        order = np.lexsort((values, codes))
+        centroids, codes, values = centroids.iloc[order], codes[order], values[order]
+        weights = centroids['weight'].to_numpy(dtype='float64')
+
+        totals = np.bincount(codes, weights=weights)
+        sizes = np.bincount(codes)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        cumulative = np.cumsum(weights)
+        # Weight ranked below each centroid within its group
+        below = cumulative - weights - (cumulative[starts] - weights[starts])[codes]
+        buckets = (below * sketch_size // totals[codes]).astype('int64')
+
+        merged = centroids[keys].assign(
+            bucket=buckets, weighted=values * weights, weight=weights
+        ).groupby(keys + ['bucket'], observed=True, dropna=False, sort=False).agg(
+            weighted=('weighted', 'sum'),
+            weight=('weight', 'sum')
+        ).reset_index()
+        return merged.assign(value=merged['weighted'] / merged['weight'])[keys + ['value', 'weight']]
+
+    def coarsen(self, keys: List[str], sketch_size: int) -> 'Rollup':
+        """Merge cells that share keys, year and month"""
+        cell_keys = keys + ['year', 'month']
+        if self.empty:
+            return Rollup(
+                pd.DataFrame(columns=cell_keys + list(CELL_AGGREGATIONS)),
+                pd.DataFrame(columns=cell_keys + ['value', 'weight'])
+            )
+        cells = self.cells.groupby(
+            cell_keys, observed=True, dropna=False, sort=True
+        ).agg(CELL_AGGREGATIONS).reset_index()
+        centroids = Rollup._compress(self.centroids[cell_keys + ['value', 'weight']], cell_keys, sketch_size)
+        return Rollup(cells, centroids)
+
+    @staticmethod
+    def concat(rollups: List['Rollup']) -> 'Rollup':
+        rollups = [rollup for rollup in rollups if not rollup.empty]
+        if not rollups:
+            return Rollup.empty_rollup()
+        if len(rollups) == 1:
+            return rollups[0]
+        sketches = [rollup.centroids for rollup in rollups if not rollup.centroids.empty]
+        return Rollup(
+            pd.concat([rollup.cells for rollup in rollups], ignore_index=True),
+            pd.concat(sketches, ignore_index=True) if sketches else rollups[0].centroids
+        )
+
+    def months(self, first: int, last: int) -> 'Rollup':
+        """Cells for months first..last inclusive, as year * 12 + month - 1"""
+        def select(frame: pd.DataFrame) -> pd.DataFrame:
+            month_index = frame['year'].astype('int32') * 12 + frame['month'].astype('int32') - 1
+            return frame[(month_index >= first) & (month_index <= last)]
+        return Rollup(select(self.cells), select(self.centroids))
+
+    @staticmethod
+    def weighted_medians(centroids: pd.DataFrame, keys: List) -> pd.Series:
+        """
+        Median of the centroids in each group of keys (column names or arrays)
+
+        Unit-weight centroids give the exact median, averaging the middle
+        pair for even counts.
+        """
+        grouped = centroids.groupby(keys, observed=True, sort=True)
+        index = grouped.size().index
+        if centroids.empty:
+            return pd.Series(dtype='float64', index=index)
+        codes = grouped.ngroup().to_numpy()
+        values = centroids['value'].to_numpy(dtype='float64')
+        weights = centroids['weight'].to_numpy(dtype='float64')
+
+        order = np.lexsort((values, codes))
+        codes, values, weights = codes[order], values[order], weights[order]
+        totals = np.bincount(codes, weights=weights)
+        sizes = np.bincount(codes)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        cumulative = np.cumsum(weights)
+        within = cumulative - (cumulative[starts] - weights[starts])[codes]
+
+        below = np.bincount(codes, weights=within < totals[codes] / 2).astype('int64')
+        middle = starts + below
+        medians = values[middle]
+        # An exact half means the median falls between two centroids
+        ends = starts + sizes - 1
+        split = (within[middle] == totals / 2) & (middle < ends)
+        medians[split] = (values[middle[split]] + values[middle[split] + 1]) / 2
+        return pd.Series(medians, index=index)
+
+
+def unknown_units(units: pd.Series) -> pd.Series:
+    """Units with missing values labelled 'unknown', as trend reports group them"""
+    if isinstance(units.dtype, pd.CategoricalDtype) and 'unknown' not in units.cat.categories:
+        units = units.cat.add_categories('unknown')
+    return units.fillna('unknown')
+
+
+def month_index(year: int, month: int) -> int:
+    return year * 12 + month - 1
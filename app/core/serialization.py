@@ -0,0 +1,33 @@
+"""
+JSON encoding for report responses
+"""
+from datetime import date, datetime
+from typing import Any
+
+import numpy as np
+import orjson
+import pandas as pd
+
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value: Any) -> Any:
+    """Encode the pandas/numpy values orjson does not handle natively"""
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize a response body straight to JSON bytes
+
+    Produces the same JSON as FastAPI's response_model path for report
+    content (non-string keys as strings, NaN as null, ISO datetimes) without
+    validating and re-encoding every record.
+    """
+    return orjson.dumps(content, default=_default, option=JSON_OPTIONS)
@@ -0,0 +1,202 @@
+"""
+State shared by the worker processes of the multi-worker server
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    """
+    Expiring LRU of cache blobs, plus load claims and small records
+
+    Lives in the manager process started by `python -m app.server`, whose
+    connection threads call it concurrently, so all state is locked.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._blobs: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._claims: Dict[str, Tuple[float, str]] = {}
+        self._records: Dict[str, Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._blobs.get(key)
+            if item is not None and item[0] < time.monotonic():
+                self._discard(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._blobs.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: str, blob: bytes, ttl: float) -> None:
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._blobs:
+                self._discard(key)
+            self._blobs[key] = (time.monotonic() + ttl, blob)
+            self._bytes += len(blob)
+            while len(self._blobs) > self.max_entries or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._blobs)))
+                self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        _, blob = self._blobs.pop(key)
+        self._bytes -= len(blob)
+
+    def claim(self, key: str, owner: str, lease: float) -> bool:
+        """Claim the load of key for owner, unless another owner holds an unexpired claim"""
+        now = time.monotonic()
+        with self._lock:
+            held = self._claims.get(key)
+            if held is not None and held[0] > now and held[1] != owner:
+                return False
+            self._claims[key] = (now + lease, owner)
+            return True
+
+    def release(self, key: str, owner: str) -> None:
+        with self._lock:
+            held = self._claims.get(key)
+            if held is not None and held[1] == owner:
+                del self._claims[key]
+
+    def put_record(self, key: str, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for expired in [k for k, (expires_at, _) in self._records.items() if expires_at < now]:
+                del self._records[expired]
+            self._records[key] = (now + ttl, value)
+
+    def get_record(self, key: str) -> Any:
+        with self._lock:
+            item = self._records.get(key)
+            return item[1] if item is not None and item[0] >= time.monotonic() else None
+
+    def pop_record(self, key: str) -> Any:
+        with self._lock:
+            item = self._records.pop(key, None)
+            return item[1] if item is not None and item[0] >= time.monotonic() else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._blobs),
+                "bytes": self._bytes,
+                "claims": len(self._claims),
+                "records": len(self._records)
+            }
+
+
+_store: Optional[SharedStore] = None
+
+
+def _init_store(max_entries: int, max_bytes: int) -> None:
+    global _store
+    _store = SharedStore(max_entries, max_bytes)
+
+
+def _get_store() -> SharedStore:
+    return _store
+
+
+class SharedStateManager(BaseManager):
+    """Serves the SharedStore to the workers over a local socket"""
+
+
+SharedStateManager.register('store', callable=_get_store)
+
+
+def start_shared_state(address: str, max_entries: int, max_bytes: int) -> SharedStateManager:
+    """Start the manager process; workers forked afterwards inherit its authkey"""
+    manager = SharedStateManager(address=address)
+    manager.start(_init_store, (max_entries, max_bytes))
+    return manager
+
+
+class SharedStateClient:
+    """
+    A worker's connection to the SharedStore
+
+    Calls fail soft: while the manager is unreachable, reads miss and
+    claims succeed, so the worker falls back to caching and loading on
+    its own. Blob calls block on socket I/O; callers on the event loop
+    should run them in a thread.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.errors = 0
+        self._store = None
+        self._lock = threading.Lock()
+
+    def _call(self, method: str, default: Any, *args: Any) -> Any:
+        try:
+            with self._lock:
+                if self._store is None:
+                    manager = SharedStateManager(address=self.address)
+                    manager.connect()
+                    self._store = manager.store()
+                store = self._store
+            # Proxies open a connection per thread, so calls need no lock
+            return getattr(store, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            self._store = None
+            logger.warning("Shared state %s failed: %s", method, e)
+            return default
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._call('get', None, key)
+
+    def set(self, key: str, blob: bytes, ttl: float) -> None:
+        self._call('set', None, key, blob, ttl)
+
+    def claim(self, key: str, lease: float) -> bool:
+        return self._call('claim', True, key, self.owner, lease)
+
+    def release(self, key: str) -> None:
+        self._call('release', None, key, self.owner)
+
+    def put_record(self, key: str, value: Any, ttl: float) -> None:
+        self._call('put_record', None, key, value, ttl)
+
+    def get_record(self, key: str) -> Any:
+        return self._call('get_record', None, key)
+
+    def pop_record(self, key: str) -> Any:
+        return self._call('pop_record', None, key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**(self._call('stats', None) or {}), "errors": self.errors}
+
+
+@lru_cache()
+def get_shared_state() -> Optional[SharedStateClient]:
+    """Client for the server's shared state, or None when running as a single process"""
+    address = get_settings().shared_state_socket
+    return SharedStateClient(address) if address else None
@@ -0,0 +1,289 @@
+"""
+In-memory monitoring site catalog with spatial lookups
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.config import get_settings
+from app.core.data_fetcher import USGSDataFetcher, SITE_TYPE_CODES
+from app.core.executor import get_executor
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Zones SiteIndex.zones maps sites to: HUC prefixes by digits, or lat/lon grid cells
+SPATIAL_LEVELS = ('huc2', 'huc4', 'huc6', 'huc8', 'huc10', 'huc12', 'grid')
+
+
+def grid_cell_label(lat: np.ndarray, lon: np.ndarray, degrees: float) -> pd.Series:
+    """Label each point's grid cell by its south-west corner as 'lat,lon'"""
+    south = pd.Series(np.round(np.floor(lat / degrees) * degrees, 6))
+    west = pd.Series(np.round(np.floor(lon / degrees) * degrees, 6))
+    labels = south.astype(str) + ',' + west.astype(str)
+    return labels.where(south.notna() & west.notna())
+
+
+def grid_cell_bounds(label: str, degrees: float) -> List[float]:
+    """[minx, miny, maxx, maxy] of a cell labelled by grid_cell_label"""
+    south, west = map(float, label.split(','))
+    return [west, south, round(west + degrees, 6), round(south + degrees, 6)]
+
+
+class SiteIndex:
+    """
+    Grid index over a frame of NWIS site metadata
+
+    Sites are bucketed into square lat/lon cells of cell_size degrees, so a
+    bbox or radius lookup only tests the sites in overlapping cells. HUC
+    codes are kept sorted for prefix lookups by binary search.
+    """
+
+    def __init__(self, sites_df: pd.DataFrame, cell_size: float = 0.25):
+        self.df = sites_df.reset_index(drop=True)
+        self.cell_size = cell_size
+        self.built_at = datetime.now(timezone.utc)
+        self.records: List[Dict[str, Any]] = (
+            self.df.astype(object).where(self.df.notna(), None).to_dict('records')
+        )
+
+        self.lat = self._numeric('dec_lat_va')
+        self.lon = self._numeric('dec_long_va')
+
+        located = np.flatnonzero(~np.isnan(self.lat) & ~np.isnan(self.lon))
+        cells_x = np.floor(self.lon[located] / cell_size).astype('int64')
+        cells_y = np.floor(self.lat[located] / cell_size).astype('int64')
+        self.grid: Dict[tuple, np.ndarray] = {}
+        if len(located):
+            cell_frame = pd.DataFrame({'x': cells_x, 'y': cells_y, 'pos': located})
+            for (x, y), group in cell_frame.groupby(['x', 'y'])['pos']:
+                self.grid[(x, y)] = group.to_numpy()
+
+        huc = self._huc_codes()
+        self.huc_order = np.argsort(huc, kind='stable')
+        self.huc_sorted = huc[self.huc_order]
+        self.site_types = self._codes('site_tp_cd')
+        self._zones: Dict[tuple, pd.Series] = {}
+        self._counties: Optional[List[str]] = None
+
+    def _numeric(self, column: str) -> np.ndarray:
+        if column not in self.df.columns:
+            return np.full(len(self.df), np.nan)
+        return pd.to_numeric(self.df[column], errors='coerce').to_numpy(dtype='float64')
+
+    def _codes(self, column: str) -> np.ndarray:
+        """A code column as strings, with missing values as ''"""
+        if column not in self.df.columns:
+            return np.full(len(self.df), '', dtype=object)
+        values = self.df[column]
+        if pd.api.types.is_numeric_dtype(values):
+            # Codes parsed as numbers (e.g. HUCs) lose nothing as Int64
+            values = values.astype('Int64')
+        return values.astype(str).where(values.notna(), '').to_numpy(dtype=object)
+
+    def _huc_codes(self) -> np.ndarray:
+        """HUC codes as strings, restoring leading zeros lost to numeric parsing"""
+        huc = pd.Series(self._codes('huc_cd'))
+        # HUCs have an even number of digits (two per level)
+        odd = huc.str.len() % 2 == 1
+        huc[odd] = '0' + huc[odd]
+        return huc.to_numpy(dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def all(self) -> np.ndarray:
+        return np.arange(len(self.df))
+
+    def bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> np.ndarray:
+        """Positions of sites inside a [minx, miny, maxx, maxy] bounding box"""
+        x0, x1 = int(np.floor(min_lon / self.cell_size)), int(np.floor(max_lon / self.cell_size))
+        y0, y1 = int(np.floor(min_lat / self.cell_size)), int(np.floor(max_lat / self.cell_size))
+        buckets = [
+            self.grid[(x, y)]
+            for x in range(x0, x1 + 1)
+            for y in range(y0, y1 + 1)
+            if (x, y) in self.grid
+        ]
+        if not buckets:
+            return np.array([], dtype='int64')
+        candidates = np.sort(np.concatenate(buckets))
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return candidates[inside]
+
+    def radius(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """Positions of sites within radius_km (great-circle) of a point"""
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(np.cos(np.radians(latitude)), 1e-6)
+        candidates = self.bbox(longitude - dlon, latitude - dlat, longitude + dlon, latitude + dlat)
+        if not len(candidates):
+            return candidates
+
+        lat1, lon1 = np.radians(latitude), np.radians(longitude)
+        lat2, lon2 = np.radians(self.lat[candidates]), np.radians(self.lon[candidates])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+        return candidates[distance <= radius_km]
+
+    def huc_prefix(self, prefix: str) -> np.ndarray:
+        """Positions of sites whose HUC code starts with prefix"""
+        lo = np.searchsorted(self.huc_sorted, prefix, side='left')
+        hi = np.searchsorted(self.huc_sorted, prefix + '\uffff', side='left')
+        return np.sort(self.huc_order[lo:hi])
+
+    def with_site_types(self, positions: np.ndarray, codes: Sequence[str]) -> np.ndarray:
+        """Restrict positions to sites whose site_tp_cd is one of codes"""
+        return positions[np.isin(self.site_types[positions], list(codes))]
+
+    def search(
+        self,
+        site_types: Optional[Sequence[str]] = None,
+        bbox: Optional[Sequence[float]] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        huc: Optional[str] = None
+    ) -> np.ndarray:
+        """Positions of sites matching every given filter"""
+        positions = self.all()
+        if bbox:
+            positions = np.intersect1d(positions, self.bbox(*bbox), assume_unique=True)
+        if latitude is not None and longitude is not None and radius_km is not None:
+            positions = np.intersect1d(positions, self.radius(latitude, longitude, radius_km), assume_unique=True)
+        if huc:
+            positions = np.intersect1d(positions, self.huc_prefix(huc), assume_unique=True)
+        if site_types:
+            positions = self.with_site_types(positions, site_types)
+        return positions
+
+    def records_at(self, positions: np.ndarray) -> List[Dict[str, Any]]:
+        """JSON-ready site records for positions"""
+        return [self.records[i] for i in positions]
+
+    def wqp_site_ids(self, positions: np.ndarray) -> List[str]:
+        """WQP MonitoringLocationIdentifier values (AGENCY-site_no) for positions"""
+        agency = self._codes('agency_cd')
+        site_no = self._codes('site_no')
+        return [f"{agency[i] or 'USGS'}-{site_no[i]}" for i in positions]
+
+
+    def county_codes(self) -> List[str]:
+        """Sorted WQP countycode values (US:SS:CCC) of the counties with catalogued sites"""
+        if self._counties is None:
+            # Codes parsed as numbers lose their leading zeros
+            state = pd.Series(self._codes('state_cd')).str.zfill(2)
+            county = pd.Series(self._codes('county_cd')).str.zfill(3)
+            known = (state != '00') & (county != '000')
+            self._counties = sorted(set('US:' + state[known] + ':' + county[known]))
+        return self._counties
+
+    def zones(self, level: str, grid_degrees: float = 0.25) -> pd.Series:
+        """
+        Zone of every site, keyed by WQP site id, for a level in SPATIAL_LEVELS
+
+        A HUC zone is the site's HUC truncated to the level's digits (missing
+        when the site's HUC is coarser); a grid zone is the cell label from
+        grid_cell_label. Each mapping is computed once per index.
+        """
+        key = (level, grid_degrees if level == 'grid' else None)
+        zones = self._zones.get(key)
+        if zones is None:
+            if level == 'grid':
+                labels = grid_cell_label(self.lat, self.lon, grid_degrees)
+            elif level in SPATIAL_LEVELS:
+                digits = int(level[3:])
+                huc = pd.Series(self._huc_codes())
+                labels = huc.str[:digits].where(huc.str.len() >= digits)
+            else:
+                raise ValueError(f"Unsupported spatial level: {level}")
+            zones = pd.Series(labels.to_numpy(dtype=object), index=self.wqp_site_ids(self.all()))
+            zones = self._zones[key] = zones[~zones.index.duplicated()]
+        return zones
+
+
+class SiteCatalog:
+    """Per-state SiteIndex cache, refreshed periodically from NWIS"""
+
+    def __init__(self, site_types: List[str], max_age: int, cell_size: float):
+        self.site_types = site_types
+        self.max_age = max_age
+        self.cell_size = cell_size
+        self._indexes: Dict[str, SiteIndex] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def site_type_codes(self) -> List[str]:
+        return [SITE_TYPE_CODES.get(st, st) for st in self.site_types]
+
+    def covers(self, site_types: Sequence[str]) -> bool:
+        """Whether the catalog holds every requested site type"""
+        codes = set(self.site_type_codes)
+        return all(SITE_TYPE_CODES.get(st, st) in codes for st in site_types)
+
+    def loaded(self, state_cd: str) -> Optional[SiteIndex]:
+        """The index for a state if it has been loaded, without fetching"""
+        return self._indexes.get(state_cd.upper())
+
+    def _load(self, state_cd: str) -> SiteIndex:
+        sites_df = USGSDataFetcher.fetch_site_info([state_cd], self.site_types)
+        return SiteIndex(sites_df, self.cell_size)
+
+    def _fresh(self, state_cd: str) -> Optional[SiteIndex]:
+        index = self._indexes.get(state_cd)
+        if index is not None and time.monotonic() - self._loaded_at[state_cd] < self.max_age:
+            return index
+        return None
+
+    async def _swap_in(self, state_cd: str) -> SiteIndex:
+        """Fetch and store a new index (state lock held)"""
+        index = await get_executor().run(self._load, state_cd)
+        self._indexes[state_cd] = index
+        self._loaded_at[state_cd] = time.monotonic()
+        return index
+
+    async def refresh(self, state_cd: str) -> SiteIndex:
+        """Fetch a state's sites from NWIS and swap in a new index"""
+        state_cd = state_cd.upper()
+        async with self._locks.setdefault(state_cd, asyncio.Lock()):
+            return await self._swap_in(state_cd)
+
+    async def get(self, state_cd: str) -> SiteIndex:
+        """Index for a state, loading it on first use or once it is stale"""
+        state_cd = state_cd.upper()
+        index = self._fresh(state_cd)
+        if index is not None:
+            return index
+        lock = self._locks.setdefault(state_cd, asyncio.Lock())
+        if lock.locked() and state_cd in self._indexes:
+            # Another request is already refreshing; serve the current index
+            return self._indexes[state_cd]
+        async with lock:
+            # Callers queued behind a cold-start load use the index it produced
+            return self._fresh(state_cd) or await self._swap_in(state_cd)
+
+    async def run_refresher(self, states: List[str], interval: int) -> None:
+        """Keep the configured states loaded, refreshing every interval seconds"""
+        while True:
+            for state_cd in states:
+                try:
+                    await self.refresh(state_cd)
+                except Exception:
+                    # Keep serving the previous index; retry on the next cycle
+                    pass
+            await asyncio.sleep(interval)
+
+
+@lru_cache()
+def get_site_catalog() -> SiteCatalog:
+    settings = get_settings()
+    return SiteCatalog(
+        site_types=settings.site_catalog_site_types,
+        max_age=settings.site_catalog_refresh_seconds,
+        cell_size=settings.site_catalog_cell_degrees
+    )
@@ -0,0 +1,164 @@
+"""
+Startup profiling, background warm-up of heavy modules and readiness
+"""
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Loaded by the warm-up in this order, so each module's time excludes those before it
+HEAVY_MODULES = [
+    'numpy',
+    'pandas',
+    'pyarrow',
+    'pyarrow.parquet',
+    'requests',
+    'app.core.data_processor',
+    'app.core.report_generator',
+    'app.core.site_catalog',
+    'app.core.result_store',
+    'app.api.water_quality'
+]
+
+# Paths whose routes only exist once the warm-up has finished
+WARM_UP_PATHS = ('/water-quality', '/openapi.json', '/docs', '/redoc')
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started, where /proc is available"""
+    try:
+        with open('/proc/self/stat') as stat:
+            # Fields after the parenthesised command name; starttime is field 22
+            started_ticks = int(stat.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime:
+            booted_seconds = float(uptime.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return booted_seconds - started_ticks / os.sysconf('SC_CLK_TCK')
+
+
+class Startup:
+    """
+    Readiness state and a timed record of each startup step
+
+    Steps are imports (timed per module, excluding modules already loaded)
+    and initialization of clients and background tasks.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict[str, Any]] = []
+        self.ready = False
+        self.error: Optional[str] = None
+        self.ready_after: Optional[float] = None
+        self._lock = threading.Lock()
+        self._event: Optional[asyncio.Event] = None
+
+    def record(self, kind: str, name: str, seconds: float) -> None:
+        with self._lock:
+            self.steps.append({"kind": kind, "name": name, "seconds": round(seconds, 4)})
+
+    @contextmanager
+    def step(self, name: str, kind: str = "init") -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.perf_counter() - started)
+
+    def import_modules(self, names: Sequence[str]) -> None:
+        """Import modules in order, recording those not already loaded"""
+        for name in names:
+            if name in sys.modules:
+                continue
+            with self.step(name, kind="import"):
+                importlib.import_module(name)
+
+    def _ready_event(self) -> asyncio.Event:
+        if self._event is None:
+            self._event = asyncio.Event()
+            if self.ready or self.error:
+                self._event.set()
+        return self._event
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.ready_after = process_age()
+        self._ready_event().set()
+        logger.info("Startup complete: %s", json.dumps(self.report()))
+
+    def mark_failed(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        self._ready_event().set()
+        logger.error("Startup failed: %s", self.error)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for the warm-up to finish; False if it failed or timed out"""
+        try:
+            await asyncio.wait_for(self._ready_event().wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.ready
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = sorted(self.steps, key=lambda step: step["seconds"], reverse=True)
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "process_age_at_ready": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "import_seconds": round(sum(s["seconds"] for s in steps if s["kind"] == "import"), 4),
+            "init_seconds": round(sum(s["seconds"] for s in steps if s["kind"] == "init"), 4),
+            "steps": steps
+        }
+
+
+class WarmUpMiddleware:
+    """Hold requests for routes added by the warm-up until it has finished"""
+
+    def __init__(self, app, timeout: float):
+        self.app = app
+        self.timeout = timeout
+
+    async def __call__(self, scope, receive, send):
+        startup = get_startup()
+        if scope["type"] == "http" and not startup.ready and scope["path"].startswith(WARM_UP_PATHS):
+            if not await startup.wait(self.timeout):
+                body = json.dumps({"detail": "Service is starting, please retry shortly"}).encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", b"5")
+                    ]
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
+
+
+@lru_cache()
+def get_startup() -> Startup:
+    return Startup()
+
+
+def main() -> None:
+    """Print the startup report of a cold import and warm-up, without serving"""
+    importlib.import_module('app.main')
+    startup = get_startup()
+    startup.import_modules(HEAVY_MODULES)
+    print(json.dumps(startup.report(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
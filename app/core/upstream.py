@@ -0,0 +1,217 @@
+"""
+Shared, connection-pooled async HTTP client for WQP and NWIS
+"""
+import asyncio
+from functools import lru_cache
+from typing import Any, AsyncIterator, Coroutine, Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import get_settings
+from app.core.metrics import observe_upstream
+
+try:
+    import h2  # noqa: F401  (lets httpx negotiate HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:  # h2 is an optional dependency
+    HTTP2_AVAILABLE = False
+
+# Marks the end of an async generator driven by iter_blocking
+_DONE = object()
+
+
+def upstream_headers() -> Dict[str, str]:
+    """Headers sent with every WQP and NWIS request, naming this app and its version"""
+    return {
+        'User-Agent': f"usgs-water-quality-api/{get_settings().version}",
+        'Accept-Encoding': 'gzip'
+    }
+
+
+class UpstreamClient:
+    """
+    Keep-alive httpx client shared by every request, with per-host limits
+
+    The client lives on the app's event loop, between start() and close()
+    in the lifespan. Fetch code running on the worker pool drives it through
+    iter_blocking() and call_blocking(), so connections, DNS lookups and TLS
+    sessions are reused across API requests.
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        max_connections: int,
+        max_connections_per_host: int,
+        http2: bool = True
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._client is not None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ),
+            headers=upstream_headers(),
+            http2=self.http2
+        )
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_limits[host]
+
+    @staticmethod
+    def _check_status(response: httpx.Response) -> None:
+        if response.status_code in (400, 404):
+            raise ValueError(f"Upstream returned {response.status_code} for {response.url}")
+        response.raise_for_status()
+
+    async def get_text(self, url: str, params: Dict[str, Any], empty_on_404: bool = False) -> str:
+        """GET a text response; with empty_on_404, 'no matches' 404s return ''"""
+        async with self._host_limit(url):
+            response = await self._client.get(url, params=params)
+            if empty_on_404 and response.status_code == 404:
+                return ''
+            self._check_status(response)
+            return response.text
+
+    async def stream_csv_blocks(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        block_rows: int,
+        stream_info: Optional[Dict[str, Any]] = None,
+        source: str = 'wqp'
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream a CSV response as self-contained blocks of at least block_rows rows
+
+        Each block repeats the header line and is cut at a row boundary (a
+        newline outside quotes), so it parses on its own. Closing the
+        generator closes the response and releases the connection.
+        """
+        async with self._host_limit(url):
+            async with self._client.stream('GET', url, params=params) as response:
+                try:
+                    self._check_status(response)
+                    async for block in self._csv_blocks(response, block_rows, stream_info):
+                        yield block
+                finally:
+                    # Bytes read off the wire, before gzip decoding
+                    observe_upstream(source, 0, response.num_bytes_downloaded)
+
+    @staticmethod
+    async def _csv_blocks(
+        response: httpx.Response,
+        block_rows: int,
+        stream_info: Optional[Dict[str, Any]]
+    ) -> AsyncIterator[bytes]:
+        if stream_info is not None:
+            stream_info['url'] = str(response.url)
+            stream_info['header'] = dict(response.headers)
+            stream_info['http_version'] = response.http_version
+
+        header = b''
+        pieces = []
+        pending_rows = 0
+        async for data in response.aiter_bytes():
+            if not header:
+                pieces.append(data)
+                buffer = b''.join(pieces)
+                header_end = buffer.find(b'\n')
+                if header_end < 0:
+                    continue
+                header, data, pieces = buffer[:header_end + 1], buffer[header_end + 1:], []
+            pieces.append(data)
+            pending_rows += data.count(b'\n')
+            if pending_rows < block_rows:
+                continue
+            buffer = b''.join(pieces)
+            cut = UpstreamClient._row_boundary(buffer)
+            if cut:
+                yield header + buffer[:cut]
+                buffer = buffer[cut:]
+            pieces, pending_rows = [buffer], buffer.count(b'\n')
+        buffer = b''.join(pieces)
+
+        if stream_info is not None:
+            stream_info['query_time_seconds'] = response.elapsed.total_seconds()
+        if header and buffer.strip():
+            yield header + buffer
+
+    @staticmethod
+    def _row_boundary(buffer: bytes) -> int:
+        """Offset just past the last newline that is not inside a quoted field"""
+        cut = buffer.rfind(b'\n')
+        while cut >= 0 and buffer.count(b'"', 0, cut) % 2:
+            cut = buffer.rfind(b'\n', 0, cut)
+        return cut + 1
+
+    def call_blocking(self, coro: Coroutine) -> Any:
+        """Run a coroutine on the client's loop from a worker thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @staticmethod
+    async def _pump(agen: AsyncIterator[Any], queue: asyncio.Queue) -> None:
+        try:
+            async for item in agen:
+                await queue.put((item, None))
+            await queue.put((_DONE, None))
+        except Exception as exc:
+            await queue.put((None, exc))
+
+    async def _spawn_pump(self, agen: AsyncIterator[Any], queue: asyncio.Queue) -> asyncio.Task:
+        return asyncio.ensure_future(self._pump(agen, queue))
+
+    def iter_blocking(self, agen: AsyncIterator[Any], prefetch: int = 2) -> Iterator[Any]:
+        """
+        Iterate an async generator on the client's loop from a worker thread
+
+        A single task drives the generator (so its response is opened and
+        closed in one task), reading at most prefetch items ahead of the
+        consumer. Closing the iterator cancels the task.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+        task = self.call_blocking(self._spawn_pump(agen, queue))
+        try:
+            while True:
+                item, exc = self.call_blocking(queue.get())
+                if exc is not None:
+                    raise exc
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            self._loop.call_soon_threadsafe(task.cancel)
+
+
+@lru_cache()
+def get_upstream_client() -> UpstreamClient:
+    settings = get_settings()
+    return UpstreamClient(
+        timeout=settings.request_timeout,
+        max_connections=settings.upstream_max_connections,
+        max_connections_per_host=settings.upstream_max_connections_per_host,
+        http2=settings.upstream_http2
+    )
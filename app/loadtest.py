@@ -0,0 +1,355 @@
+"""
+Load test and capacity profile of a running instance
+
+Replays a mix of requests against the API at increasing concurrency, for
+each dataset size (rows per WQP response from the local stand-in,
+benchmarks.standin). The default synthetic mix is one /water-quality/query
+per report type plus /sites and /parameters; --mix replays recorded
+requests instead, one JSON object per line:
+  {"method": "POST", "path": "/water-quality/query", "json": {...}, "weight": 2}
+  {"method": "GET", "path": "/water-quality/sites", "params": {"state_cd": ["CA"]}}
+
+Each step reports throughput, latency percentiles (overall and per request
+kind), mean time per query stage and peak RSS per worker, the last two
+scraped from /metrics. Per dataset size it reports the saturation point (the
+lowest concurrency reaching 95% of the best throughput) and the
+memory-per-request curve: peak worker RSS against in-flight requests per
+worker, with a fitted slope.
+
+With --spawn the stand-in and a multi-worker server (app.server) are started
+locally, without a query cache, and the server is restarted for each dataset
+size so peak RSS is measured per size. Against an existing instance, point
+its upstream at the stand-in (e.g. benchmarks.serve_app) and disable its
+query cache, or repeated queries are cache hits; peak RSS is then the
+high-water mark since each worker started.
+
+Usage: python -m app.loadtest --spawn [--workers 2] [--sizes 10000 100000] [--concurrency 1 4 16]
+       python -m app.loadtest --url http://127.0.0.1:8000 --standin http://127.0.0.1:8765
+           [--mix recorded.jsonl] [--duration 20] [--output profile.json]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.models.requests import ReportType
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Throughput within this fraction of a size's best counts as saturated
+SATURATION_FRACTION = 0.95
+
+
+def synthetic_mix(rows: int) -> List[Dict[str, Any]]:
+    """One query per report type returning up to rows records, plus /sites and /parameters"""
+    mix = [
+        {
+            'name': f"query_{report_type.value}",
+            'method': 'POST',
+            'path': '/water-quality/query',
+            'json': {
+                'query': {'state_cd': ['CA']},
+                'config': {'report_type': report_type.value, 'max_records': rows}
+            }
+        }
+        for report_type in ReportType
+    ]
+    mix.append({'name': 'sites', 'method': 'GET', 'path': '/water-quality/sites', 'params': {'state_cd': ['CA']}})
+    mix.append({'name': 'parameters', 'method': 'GET', 'path': '/water-quality/parameters'})
+    return mix
+
+
+def load_mix(path: Path) -> List[Dict[str, Any]]:
+    """Recorded requests, one JSON object per line"""
+    mix = []
+    for number, line in enumerate(path.read_text().splitlines(), 1):
+        if line.strip():
+            entry = json.loads(line)
+            entry.setdefault('method', 'GET')
+            entry.setdefault('name', f"{entry['method']} {entry['path']}#{number}")
+            mix.append(entry)
+    return mix
+
+
+def schedule(mix: List[Dict[str, Any]], seed: int) -> List[Dict[str, Any]]:
+    """Mix entries repeated by weight, in a seeded random order"""
+    entries = [entry for entry in mix for _ in range(int(entry.get('weight', 1)))]
+    random.Random(seed).shuffle(entries)
+    return entries
+
+
+def scrape(url: str) -> Dict[str, Any]:
+    """Query stage totals and worker peak RSS from /metrics"""
+    stages: Dict[str, Dict[str, float]] = {}
+    peak_rss: Dict[str, float] = {}
+    try:
+        text = requests.get(f"{url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return {'stages': stages, 'peak_rss': peak_rss}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name in ('wqp_stage_duration_seconds_sum', 'wqp_stage_duration_seconds_count'):
+                kind = sample.name.rsplit('_', 1)[1]
+                stages.setdefault(sample.labels['stage'], {})[kind] = sample.value
+            elif sample.name == 'wqp_worker_peak_rss_bytes' and sample.value > 0:
+                # Processes that have not served a request (e.g. the gunicorn master) report 0
+                peak_rss[sample.labels.get('pid', 'server')] = sample.value
+    return {'stages': stages, 'peak_rss': peak_rss}
+
+
+def stage_means(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Calls and mean seconds per stage between two scrapes"""
+    means = {}
+    for stage, totals in after['stages'].items():
+        earlier = before['stages'].get(stage, {})
+        count = totals.get('count', 0) - earlier.get('count', 0)
+        if count > 0:
+            seconds = totals.get('sum', 0) - earlier.get('sum', 0)
+            means[stage] = {'count': int(count), 'mean_seconds': seconds / count}
+    return means
+
+
+def latency_summary(latencies: List[float], statuses: List[int], elapsed: float) -> Dict[str, Any]:
+    ok = [latency for latency, status in zip(latencies, statuses) if 200 <= status < 400]
+    summary: Dict[str, Any] = {
+        'requests': len(statuses),
+        'errors': len(statuses) - len(ok),
+        'status_counts': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+        'throughput_rps': len(ok) / elapsed if elapsed else None,
+    }
+    if ok:
+        p50, p90, p99 = np.percentile(ok, [50, 90, 99])
+        summary.update({
+            'p50_seconds': float(p50),
+            'p90_seconds': float(p90),
+            'p99_seconds': float(p99),
+            'max_seconds': float(np.max(ok)),
+        })
+    return summary
+
+
+def run_step(url: str, entries: List[Dict[str, Any]], concurrency: int, duration: float) -> Dict[str, Any]:
+    """Send entries in turn from concurrency threads for duration seconds (closed loop)"""
+    lock = threading.Lock()
+    results: List[tuple] = []
+    next_entry = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + duration
+
+    def worker(_: int) -> None:
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            with lock:
+                entry = entries[next(next_entry) % len(entries)]
+            start = time.perf_counter()
+            try:
+                response = session.request(
+                    entry['method'], url + entry['path'],
+                    json=entry.get('json'), params=entry.get('params'), timeout=600
+                )
+                status = response.status_code
+            except requests.RequestException:
+                status = 0
+            with lock:
+                results.append((entry['name'], time.perf_counter() - start, status))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    step = latency_summary([r[1] for r in results], [r[2] for r in results], elapsed)
+    step['elapsed_seconds'] = elapsed
+    step['by_request'] = {
+        name: latency_summary(
+            [r[1] for r in results if r[0] == name], [r[2] for r in results if r[0] == name], elapsed
+        )
+        for name in sorted({r[0] for r in results})
+    }
+    return step
+
+
+def capacity(steps: List[Dict[str, Any]], workers: int) -> Dict[str, Any]:
+    """Saturation point and memory-per-request curve of one dataset size"""
+    best = max((step['throughput_rps'] or 0 for step in steps), default=0)
+    saturated = [step for step in steps if best and (step['throughput_rps'] or 0) >= SATURATION_FRACTION * best]
+    curve = [
+        {
+            'in_flight_per_worker': step['concurrency'] / workers,
+            'peak_rss_bytes': max(step['peak_rss_bytes'].values(), default=None)
+        }
+        for step in steps
+    ]
+    points = [point for point in curve if point['peak_rss_bytes'] is not None]
+    result: Dict[str, Any] = {
+        'max_throughput_rps': best,
+        'saturation_concurrency': saturated[0]['concurrency'] if saturated else None,
+        'memory_curve': curve,
+    }
+    if len({point['in_flight_per_worker'] for point in points}) > 1:
+        slope, intercept = np.polyfit(
+            [point['in_flight_per_worker'] for point in points],
+            [point['peak_rss_bytes'] for point in points],
+            1
+        )
+        result['memory_per_request_bytes'] = float(slope)
+        result['baseline_rss_bytes'] = float(intercept)
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 120) -> None:
+    """Wait until url answers 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not become ready within {timeout}s")
+
+
+def start_process(module: str, args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, '-m', module, *args],
+        cwd=ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL
+    )
+
+
+def stop_process(process: Optional[subprocess.Popen]) -> None:
+    if process is not None:
+        process.terminate()
+        process.wait()
+
+
+@contextmanager
+def spawned_server(standin_url: str, port: int, workers: int) -> Iterator[str]:
+    """A multi-worker server with its upstream pointed at the stand-in and no query cache"""
+    url = f"http://127.0.0.1:{port}"
+    server = start_process('app.server', ['--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)], env={
+        'USGS_BASE_URL': standin_url,
+        'NWIS_BASE_URL': f"{standin_url}/nwis",
+        'CACHE_ENABLED': 'false',
+        'ENABLE_METRICS': 'true',
+    })
+    try:
+        wait_for(f"{url}/ready", server)
+        yield url
+    finally:
+        stop_process(server)
+
+
+def profile_size(
+    url: str,
+    mix: List[Dict[str, Any]],
+    concurrency: List[int],
+    args: argparse.Namespace
+) -> List[Dict[str, Any]]:
+    """Run every concurrency step at the current dataset size"""
+    entries = schedule(mix, args.seed)
+    # Warm-up: each request kind once, so first-use costs are excluded
+    for entry in {entry['name']: entry for entry in entries}.values():
+        requests.request(entry['method'], url + entry['path'], json=entry.get('json'),
+                         params=entry.get('params'), timeout=600)
+
+    steps = []
+    for level in concurrency:
+        before = scrape(url)
+        step = run_step(url, entries, level, args.duration)
+        after = scrape(url)
+        step.update({
+            'concurrency': level,
+            'stages': stage_means(before, after),
+            'peak_rss_bytes': after['peak_rss'],
+        })
+        steps.append(step)
+        peak = max(after['peak_rss'].values(), default=0)
+        print(
+            f"  concurrency {level:>4}: {step['throughput_rps'] or 0:8.2f} req/s "
+            f"p50 {step.get('p50_seconds', math.nan):.3f}s p99 {step.get('p99_seconds', math.nan):.3f}s "
+            f"errors {step['errors']} peak RSS {peak / 2**20:.0f} MB",
+            file=sys.stderr
+        )
+    return steps
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    standin = None
+    standin_url = args.standin
+    if args.spawn and standin_url is None:
+        standin_url = f"http://127.0.0.1:{free_port()}"
+        standin = start_process('benchmarks.standin', [
+            '--port', standin_url.rsplit(':', 1)[1], '--latency', str(args.latency)
+        ])
+    try:
+        if standin_url:
+            wait_for(f"{standin_url}/_settings", standin)
+        report: Dict[str, Any] = {'settings': {key: str(value) for key, value in vars(args).items()}, 'sizes': {}}
+        for rows in args.sizes:
+            print(f"dataset size {rows} rows", file=sys.stderr)
+            if standin_url:
+                requests.get(f"{standin_url}/_settings", params={'rows': rows}, timeout=10).raise_for_status()
+            mix = load_mix(args.mix) if args.mix else synthetic_mix(rows)
+            if args.spawn:
+                with spawned_server(standin_url, free_port(), args.workers) as url:
+                    steps = profile_size(url, mix, args.concurrency, args)
+            else:
+                steps = profile_size(args.url, mix, args.concurrency, args)
+            workers = max((len(step['peak_rss_bytes']) for step in steps), default=0) or args.workers or 1
+            report['sizes'][str(rows)] = {'workers': workers, 'steps': steps, 'capacity': capacity(steps, workers)}
+        return report
+    finally:
+        stop_process(standin)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Instance to load (ignored with --spawn)')
+    parser.add_argument('--standin', default=None, help='Base URL of benchmarks.standin, to set dataset sizes')
+    parser.add_argument('--spawn', action='store_true', help='Start the stand-in and server locally')
+    parser.add_argument('--workers', type=int, default=2, help='Server workers with --spawn')
+    parser.add_argument('--latency', type=float, default=0.1, help='Spawned stand-in time to first byte (seconds)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000], help='Rows per WQP response')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per step')
+    parser.add_argument('--mix', type=Path, default=None, help='Recorded requests (JSON lines)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, default=None, help='Report file (default: stdout)')
+    args = parser.parse_args()
+    args.concurrency = sorted(args.concurrency)
+
+    report = run(args)
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        args.output.write_text(text)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,76 @@
 """
 Main FastAPI application entry point
+
+Only light modules are imported here, so the server starts accepting
+connections quickly. pandas, pyarrow and the water quality routes are
+loaded by a warm-up task after startup; /ready reports when it has finished.
 """
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import HTMLResponse
 
-from app.api import health, water_quality
+from app.api import health, metrics
+from app.core.compression import GZipMiddleware
 from app.config import get_settings
+from app.core.executor import get_executor
+from app.core.jobs import get_job_manager
+from app.core.metrics import MetricsMiddleware, ProfilerMiddleware
+from app.core.startup import HEAVY_MODULES, WarmUpMiddleware, get_startup
+from app.core.upstream import get_upstream_client
+
+logger = logging.getLogger(__name__)
 
 # Initialize settings
 settings = get_settings()
+startup = get_startup()
+startup.record("import", "app.main", time.perf_counter() - _import_started)
+
+async def warm_up(app: FastAPI, tasks: list) -> None:
+    """Load heavy modules off the event loop, then add the water quality routes and site catalog refresher"""
+    try:
+        await asyncio.to_thread(startup.import_modules, HEAVY_MODULES)
+        from app.api import water_quality
+        from app.core.site_catalog import get_site_catalog
+        
+        with startup.step("water quality routes"):
+            app.include_router(water_quality.router, prefix="/water-quality", tags=["water-quality"])
+            # Regenerate the schema with the new routes
+            app.openapi_schema = None
+        tasks.append(asyncio.create_task(
+            get_site_catalog().run_refresher(
+                settings.site_catalog_states,
+                settings.site_catalog_refresh_seconds
+            )
+        ))
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        startup.mark_failed(e)
+        return
+    startup.mark_ready()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the upstream client and start the warm-up; stop background tasks and report jobs and release clients on shutdown"""
+    upstream = get_upstream_client()
+    if settings.upstream_client_enabled:
+        with startup.step("upstream client"):
+            await upstream.start()
+    tasks: list = []
+    tasks.append(asyncio.create_task(warm_up(app, tasks)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await get_job_manager().stop()
+    await upstream.close()
+    get_executor().shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -19,13 +78,17 @@ app = FastAPI(
     description="API for querying USGS Water Quality Portal data and generating reports",
     version=settings.version,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Add middleware
+# Add middleware (the last one added runs first)
+if settings.enable_metrics:
+    # Inside GZip so response sizes are uncompressed and send time includes compression
+    app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Configure properly for production
@@ -33,11 +96,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Arrow and Parquet reports are compressed by their writers
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=1000,
+    excluded_media_types=("application/vnd.apache.arrow", "application/vnd.apache.parquet")
+)
+app.add_middleware(WarmUpMiddleware, timeout=settings.request_timeout)
+if settings.profiling_enabled:
+    app.add_middleware(ProfilerMiddleware, interval=settings.profiling_interval)
 
 # Include routers
 app.include_router(health.router, tags=["health"])
-app.include_router(water_quality.router, prefix="/water-quality", tags=["water-quality"])
+if settings.enable_metrics:
+    app.include_router(metrics.router, tags=["metrics"])
+# Water quality routes are included by warm_up() once their modules are loaded
 # Route included in water quality definition
 # app.include_router(sites.router, prefix="/sites", tags=["sites"])
 
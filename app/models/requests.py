@@ -1,14 +1,17 @@
 """
 Pydantic models for API requests
 """
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, Dict, Optional, List
 from datetime import date
 from enum import Enum
 
 class ReportFormat(str, Enum):
     json = "json"
     csv = "csv"
+    ndjson = "ndjson"
+    arrow = "arrow"
+    parquet = "parquet"
     html = "html"
 
 class ReportType(str, Enum):
@@ -16,6 +19,28 @@ class ReportType(str, Enum):
     detailed = "detailed"
     trend = "trend"
     comparison = "comparison"
+    spatial = "spatial"
+
+class ReportSection(str, Enum):
+    summary = "summary"
+    trend = "trend"
+    comparison = "comparison"
+    spatial = "spatial"
+    detailed = "detailed"
+
+class TrendGranularity(str, Enum):
+    yearly = "yearly"
+    monthly = "monthly"
+    seasonal = "seasonal"
+
+class SpatialLevel(str, Enum):
+    huc2 = "huc2"
+    huc4 = "huc4"
+    huc6 = "huc6"
+    huc8 = "huc8"
+    huc10 = "huc10"
+    huc12 = "huc12"
+    grid = "grid"
 
 class WaterQualityQuery(BaseModel):
     """Model for water quality query parameters"""
@@ -30,9 +55,44 @@ class WaterQualityQuery(BaseModel):
     sample_media: Optional[List[str]] = Field(["Water"], description="Sample media types")
     organization: Optional[List[str]] = Field(None, description="Organization identifiers")
 
+class ComparisonThreshold(BaseModel):
+    """Limits a characteristic's results are compared against"""
+    min: Optional[float] = Field(None, description="Results below this value are exceedances")
+    max: Optional[float] = Field(None, description="Results above this value are exceedances")
+    unit: Optional[str] = Field(None, description="Only compare results reported in this unit")
+
+    @model_validator(mode="after")
+    def check_limits(self):
+        if self.min is None and self.max is None:
+            raise ValueError("A threshold needs a min or a max")
+        if self.min is not None and self.max is not None and self.min > self.max:
+            raise ValueError("Threshold min is greater than max")
+        return self
+
 class ReportConfig(BaseModel):
     """Configuration for report generation"""
     report_type: ReportType = Field(ReportType.summary, description="Type of report to generate")
     format: ReportFormat = Field(ReportFormat.json, description="Output format")
     include_metadata: bool = Field(True, description="Include metadata in report")
-    max_records: int = Field(10000, description="Maximum records to process")
\ No newline at end of file
+    max_records: int = Field(10000, description="Maximum records to process")
+    sample_size: Optional[int] = Field(None, gt=0, description="Summary reports only: estimate from a uniform random sample of this many records")
+    trend_granularity: TrendGranularity = Field(TrendGranularity.yearly, description="Time period used to group trend reports")
+    trend_by_unit: bool = Field(False, description="Group trend statistics by measurement unit")
+    trend_statistics: bool = Field(False, description="Include Mann-Kendall and Sen's slope trend statistics")
+    sections: Optional[List[ReportSection]] = Field(None, min_length=1, description="Generate these sections together from one fetch, keyed by section in data_summary; overrides report_type")
+    detail_limit: Optional[int] = Field(None, gt=0, description="Maximum detailed rows returned (default: all processed records, 100 for comparison reports)")
+    comparison_percentiles: List[Annotated[float, Field(ge=0, le=100)]] = Field([10, 25, 75, 90], description="Percentiles of each site's results included in comparison reports")
+    comparison_thresholds: Optional[Dict[str, ComparisonThreshold]] = Field(None, description="Limits by characteristic name; comparison reports count the results of each site outside them")
+    comparison_by_unit: bool = Field(False, description="Compare sites separately for each measurement unit")
+    spatial_levels: List[SpatialLevel] = Field([SpatialLevel.huc8], min_length=1, description="Spatial reports only: aggregate by these HUC levels and/or lat/lon grid cells")
+    grid_degrees: float = Field(0.25, gt=0, le=10, description="Size in degrees of the grid cells used by the grid spatial level")
+
+class BatchQuery(BaseModel):
+    """One query and report of a batch"""
+    id: Optional[str] = Field(None, description="Caller's identifier, echoed with the result")
+    query: WaterQualityQuery
+    config: ReportConfig = ReportConfig()
+
+class BatchRequest(BaseModel):
+    """Model for a batch of water quality queries"""
+    queries: List[BatchQuery] = Field(..., min_length=1, description="Queries answered together, sharing upstream fetches where they overlap")
@@ -25,4 +25,18 @@ class ParametersResponse(BaseModel):
     """Model for parameters endpoint response"""
     parameters: Dict[str, List[str]]
     total_categories: int
-    usage_note: str
\ No newline at end of file
+    usage_note: str
+
+class JobResponse(BaseModel):
+    """Model for background report job status"""
+    job_id: str
+    status: str
+    priority: int
+    stage: str
+    progress: float
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result_url: Optional[str] = None
@@ -0,0 +1,142 @@
+"""
+Multi-worker production server: gunicorn with preloaded uvicorn workers
+
+The app, and with it pandas and pyarrow, is imported once in the
+gunicorn master and forked into the workers. Before that, a manager process
+is started on a local socket to hold the query cache and in-flight load
+claims that all workers share. A worker whose RSS exceeds the configured
+limit shuts down gracefully and gunicorn starts a fresh one.
+
+Usage: python -m app.server [--workers 4] [--port 8000]
+"""
+import argparse
+import logging
+import os
+import resource
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from typing import Any, Dict
+
+from gunicorn.app.base import BaseApplication
+
+from app.config import get_settings
+from app.core.shared_state import SharedStateManager, start_shared_state
+from app.core.startup import HEAVY_MODULES, get_startup
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count(configured: int) -> int:
+    """Configured worker count, or one per CPU this process may run on"""
+    if configured > 0:
+        return configured
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def watch_memory(limit_bytes: int, interval: float) -> None:
+    """Gracefully stop this worker once its RSS exceeds limit_bytes"""
+    def watch():
+        while True:
+            time.sleep(interval)
+            rss = rss_bytes()
+            if rss > limit_bytes:
+                logger.warning(
+                    "Worker %s RSS %.0f MB exceeds %.0f MB, restarting",
+                    os.getpid(), rss / 2**20, limit_bytes / 2**20
+                )
+                # uvicorn finishes in-flight requests; gunicorn forks a replacement
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+    threading.Thread(target=watch, name='memory-watchdog', daemon=True).start()
+
+
+def start_worker_shared_state(runtime_dir: str) -> SharedStateManager:
+    """
+    Start the shared-state manager and export its socket as SHARED_STATE_SOCKET
+
+    Called before the app is imported, so the manager process stays small.
+    The app is then preloaded and forked into the workers, so settings
+    read after this point (the cached ones are dropped) point at the
+    manager without any settings object being modified.
+    """
+    settings = get_settings()
+    socket_path = settings.shared_state_socket or os.path.join(runtime_dir, 'shared.sock')
+    manager = start_shared_state(socket_path, settings.cache_max_entries, settings.cache_max_bytes)
+    os.environ['SHARED_STATE_SOCKET'] = socket_path
+    get_settings.cache_clear()
+    return manager
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options: Dict[str, Any]):
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app.main import app
+        # Loaded before fork, so each worker's warm-up finds them imported
+        get_startup().import_modules(HEAVY_MODULES)
+        return app
+
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default=settings.server_host)
+    parser.add_argument('--port', type=int, default=settings.server_port)
+    parser.add_argument('--workers', type=int, default=settings.server_workers, help='0 starts one per CPU')
+    args = parser.parse_args()
+
+    # Must be set before prometheus_client is first imported by the app
+    runtime_dir = tempfile.mkdtemp(prefix='water-quality-')
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(runtime_dir, 'metrics'))
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+    manager = start_worker_shared_state(runtime_dir)
+
+    def post_worker_init(worker):
+        if settings.server_worker_max_memory_mb > 0:
+            watch_memory(settings.server_worker_max_memory_mb * 2**20, settings.server_memory_check_seconds)
+
+    def child_exit(server, worker):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+    def on_exit(server):
+        manager.shutdown()
+        shutil.rmtree(runtime_dir, ignore_errors=True)
+
+    ProductionServer({
+        'bind': f"{args.host}:{args.port}",
+        'workers': worker_count(args.workers),
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'preload_app': True,
+        'graceful_timeout': settings.server_graceful_timeout,
+        'loglevel': settings.log_level.lower(),
+        'post_worker_init': post_worker_init,
+        'child_exit': child_exit,
+        'on_exit': on_exit,
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Memory and time of DataProcessor.clean_and_validate_data with and without projection
+
+Usage: python -m benchmarks.bench_data_processor [--rows 1000000]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+import pandas as pd
+
+from app.core.data_processor import DataProcessor
+from app.models.requests import ReportType
+from benchmarks.synthetic import generate_wqp_results
+
+
+def legacy_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """The per-column implementation that clean_and_validate_data replaced"""
+    essential_cols = ['OrganizationIdentifier', 'MonitoringLocationIdentifier',
+                      'ActivityStartDate', 'CharacteristicName']
+    for col in essential_cols:
+        if col in df.columns:
+            df = df.dropna(subset=[col])
+    for col in ['ResultMeasureValue', 'DetectionQuantitationLimitMeasureValue']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    for col in ['ActivityStartDate', 'ActivityEndDate']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+def measure(func: Callable[[], pd.DataFrame]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        'seconds': round(elapsed, 3),
+        'peak_allocated_mb': round(peak / 1e6, 1),
+        'result_mb': round(DataProcessor.memory_usage(result) / 1e6, 1)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    raw = generate_wqp_results(args.rows)
+    columns = DataProcessor.columns_for_reports(rt.value for rt in ReportType)
+
+    _, legacy = measure(lambda: legacy_clean(raw))
+    _, unprojected = measure(lambda: DataProcessor.clean_and_validate_data(raw))
+    _, projected = measure(lambda: DataProcessor.clean_and_validate_data(raw, columns=columns))
+
+    stages: Dict[str, int] = {}
+    DataProcessor.clean_and_validate_data(raw, columns=columns, memory_report=stages)
+
+    print(json.dumps({
+        'rows': args.rows,
+        'legacy': legacy,
+        'compact_all_columns': unprojected,
+        'compact_projected': projected,
+        'projected_stage_mb': {stage: round(size / 1e6, 1) for stage, size in stages.items()}
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
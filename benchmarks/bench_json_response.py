@@ -0,0 +1,103 @@
+"""
+Benchmark direct JSON serialization of reports against the response_model path
+
+Usage: python -m benchmarks.bench_json_response [--rows 10000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+
+import pandas as pd
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.core import serialization
+from app.core.data_processor import DataProcessor
+from app.core.report_generator import DETAIL_COLUMNS, ReportGenerator
+from app.models.responses import WaterQualityReport
+from benchmarks.bench_trend_report import best_of
+from benchmarks.synthetic import generate_wqp_results
+
+RESPONSE_FIELD = create_model_field(
+    name='Response_query', type_=WaterQualityReport, mode='serialization'
+)
+
+
+def legacy_detailed_report(df: pd.DataFrame, query_info: Dict) -> List[Dict[str, Any]]:
+    """The per-value cleanup loop that generate_detailed_report replaced"""
+    if df.empty:
+        return []
+
+    available_cols = [col for col in DETAIL_COLUMNS if col in df.columns]
+    records = df[available_cols].copy().to_dict('records')
+
+    for record in records:
+        for key, value in record.items():
+            if pd.isna(value):
+                record[key] = None
+            elif isinstance(value, pd.Timestamp):
+                record[key] = value.isoformat()
+
+    return records
+
+
+def report_body(df: pd.DataFrame, report_type: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = ReportGenerator.generate_summary_report(df, {}) if report_type == 'comparison' else {}
+    return dict(
+        query_info={'statecode': ['US:06']},
+        report_type=report_type,
+        generated_at=datetime(2024, 1, 1),
+        data_summary=summary,
+        records_processed=len(df),
+        data=records,
+        metadata=None
+    )
+
+
+def legacy_response(df: pd.DataFrame, report_type: str) -> bytes:
+    """Per-record dicts, response_model validation, then FastAPI's JSON encoding"""
+    records = legacy_detailed_report(df, {})
+    if report_type == 'comparison':
+        records = records[:100]
+    report = WaterQualityReport(**report_body(df, report_type, records))
+    content = asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=report))
+    return JSONResponse(content).body
+
+
+def fast_response(df: pd.DataFrame, report_type: str) -> bytes:
+    """Column-wise records serialized straight to bytes"""
+    records_df = df.head(100) if report_type == 'comparison' else df
+    records = ReportGenerator.generate_detailed_report(records_df, {})
+    return serialization.dumps(report_body(df, report_type, records))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = DataProcessor.clean_and_validate_data(generate_wqp_results(args.rows))
+
+    results: Dict[str, Any] = {'rows': len(df)}
+    for report_type in ('detailed', 'comparison'):
+        legacy = json.loads(legacy_response(df, report_type))
+        fast = json.loads(fast_response(df, report_type))
+        assert legacy == fast, report_type
+
+        legacy_seconds = best_of(args.repeat, lambda: legacy_response(df, report_type))
+        fast_seconds = best_of(args.repeat, lambda: fast_response(df, report_type))
+        results[report_type] = {
+            'legacy_seconds': legacy_seconds,
+            'fast_seconds': fast_seconds,
+            'speedup': legacy_seconds / fast_seconds,
+            'response_bytes': len(fast_response(df, report_type))
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
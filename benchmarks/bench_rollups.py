@@ -0,0 +1,89 @@
+"""
+Benchmark summary and trend reports from stored rollups against stored rows
+
+Usage: python -m benchmarks.bench_rollups [--rows 1000000] [--sites 200] [--repeat 3]
+"""
+import argparse
+import json
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from app.core.data_processor import DataProcessor, ALL_REPORT_COLUMNS
+from app.core.report_generator import ReportGenerator
+from app.core.result_store import ResultStore
+from app.core.rollups import SUMMARY_CELL_COLUMNS
+from benchmarks.bench_trend_report import best_of
+from benchmarks.synthetic import generate_wqp_results
+
+FILTER_PARAMS = {'statecode': ['US:06']}
+SECTIONS = ['summary', 'trend']
+
+
+def median_errors(rows_report, rollup_report):
+    """Relative error of each rollup yearly median against the exact one"""
+    errors = []
+    for param, entry in rows_report.items():
+        for year, stats in entry['yearly_statistics'].items():
+            exact = stats['median']
+            estimate = rollup_report[param]['yearly_statistics'][year]['median']
+            if exact:
+                errors.append(abs(estimate - exact) / abs(exact))
+    return np.array(errors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--sites', type=int, default=200, help='Fewer sites give denser rollup cells')
+    parser.add_argument('--sketch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = DataProcessor.clean_and_validate_data(
+        generate_wqp_results(args.rows, n_sites=args.sites), columns=ALL_REPORT_COLUMNS
+    )
+    start, end = date(2000, 1, 1), date(2023, 12, 31)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ResultStore(Path(root), rollup_sketch_size=args.sketch_size)
+        store.ingest(FILTER_PARAMS, df, start, end)
+
+        def from_rows():
+            rows = store.read(FILTER_PARAMS, start, end, ALL_REPORT_COLUMNS)
+            return ReportGenerator.generate_sections(rows, {}, SECTIONS)
+
+        def from_rollups():
+            rollups = {
+                'site': store.read_rollup(
+                    FILTER_PARAMS, start, end, 'site', centroids=False, columns=SUMMARY_CELL_COLUMNS
+                ),
+                'region': store.read_rollup(FILTER_PARAMS, start, end, 'region'),
+            }
+            return ReportGenerator.generate_rollup_sections(rollups, {}, SECTIONS)
+
+        rows_report, rollup_report = from_rows(), from_rollups()
+        assert rows_report['summary'] == rollup_report['summary']
+        errors = median_errors(rows_report['trend'], rollup_report['trend'])
+
+        site = store.read_rollup(FILTER_PARAMS, start, end, 'site')
+        region = store.read_rollup(FILTER_PARAMS, start, end, 'region')
+        results = {
+            'rows': len(df),
+            'site_cells': len(site.cells),
+            'site_centroids': len(site.centroids),
+            'region_cells': len(region.cells),
+            'region_centroids': len(region.centroids),
+            'rows_seconds': best_of(args.repeat, from_rows),
+            'rollups_seconds': best_of(args.repeat, from_rollups),
+            'median_relative_error_mean': float(errors.mean()) if len(errors) else None,
+            'median_relative_error_max': float(errors.max()) if len(errors) else None,
+        }
+    results['speedup'] = results['rows_seconds'] / results['rollups_seconds']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark the single-pass trend report engine against the per-parameter loop
+
+Usage: python -m benchmarks.bench_trend_report [--rows 1000000] [--repeat 3]
+"""
+import argparse
+import json
+import math
+import time
+from typing import Any, Callable, Dict
+
+import pandas as pd
+
+from app.core.data_processor import DataProcessor
+from app.core.report_generator import ReportGenerator
+from benchmarks.synthetic import generate_wqp_results
+
+
+def legacy_trend_report(df: pd.DataFrame, query_info: Dict) -> Dict[str, Any]:
+    """The per-parameter implementation that generate_trend_report replaced"""
+    if df.empty or 'ActivityStartDate' not in df.columns:
+        return {"error": "Insufficient data for trend analysis"}
+
+    df['Year'] = df['ActivityStartDate'].dt.year
+
+    trend_data = {}
+    for param in df['CharacteristicName'].unique():
+        if pd.isna(param):
+            continue
+
+        param_data = df[df['CharacteristicName'] == param]
+        if 'ResultMeasureValue' in param_data.columns:
+            yearly_stats = param_data.groupby('Year')['ResultMeasureValue'].agg([
+                'count', 'mean', 'median', 'std', 'min', 'max'
+            ]).round(3)
+
+            trend_data[param] = {
+                'yearly_statistics': yearly_stats.to_dict('index'),
+                'total_samples': len(param_data),
+                'years_covered': len(yearly_stats)
+            }
+
+    return trend_data
+
+
+def _same_value(expected: Any, actual: Any, tolerance: float) -> bool:
+    """Equal, or both missing, or floats within tolerance (outputs are rounded to 3 places)"""
+    missing = lambda value: value is None or (isinstance(value, float) and math.isnan(value))
+    if missing(expected) or missing(actual):
+        return missing(expected) and missing(actual)
+    return math.isclose(float(expected), float(actual), rel_tol=0, abs_tol=tolerance)
+
+
+def assert_equivalent(legacy: Dict[str, Any], current: Dict[str, Any], tolerance: float = 1e-3) -> None:
+    """Assert both reports have the same characteristics, years and yearly statistics"""
+    assert set(legacy) == set(current), set(legacy) ^ set(current)
+    for param, entry in legacy.items():
+        produced = current[param]
+        assert entry['total_samples'] == produced['total_samples'], param
+        assert entry['years_covered'] == produced['years_covered'], param
+        expected_years = {str(year): stats for year, stats in entry['yearly_statistics'].items()}
+        actual_years = {str(year): stats for year, stats in produced['yearly_statistics'].items()}
+        assert set(expected_years) == set(actual_years), (param, set(expected_years) ^ set(actual_years))
+        for year, stats in expected_years.items():
+            for name, value in stats.items():
+                assert _same_value(value, actual_years[year].get(name), tolerance), (
+                    param, year, name, value, actual_years[year].get(name)
+                )
+
+
+def best_of(repeat: int, func: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = DataProcessor.clean_and_validate_data(generate_wqp_results(args.rows))
+
+    # The legacy report adds a Year column, so it gets its own copy
+    legacy_df = df.copy()
+    legacy = legacy_trend_report(legacy_df, {})
+    current = ReportGenerator.generate_trend_report(df, {})
+    assert_equivalent(legacy, current)
+
+    results = {
+        'rows': len(df),
+        'legacy_seconds': best_of(args.repeat, lambda: legacy_trend_report(legacy_df, {})),
+        'yearly_seconds': best_of(args.repeat, lambda: ReportGenerator.generate_trend_report(df, {})),
+        'monthly_with_statistics_seconds': best_of(
+            args.repeat,
+            lambda: ReportGenerator.generate_trend_report(
+                df, {}, granularity='monthly', trend_statistics=True
+            )
+        ),
+    }
+    results['speedup'] = results['legacy_seconds'] / results['yearly_seconds']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
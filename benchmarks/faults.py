@@ -0,0 +1,130 @@
+"""
+Fault-injection run: upstream outage and recovery against a local stand-in
+
+Starts benchmarks.standin and the API (benchmarks.serve_app) with a short
+cache TTL and a fast-resetting circuit breaker, then goes through three
+phases:
+  healthy   warm the cache with one query
+  outage    the stand-in fails every data response; the cached query should
+            be answered stale (Warning: 110) and an uncached one refused
+            quickly with 503 once the breaker opens
+  recovery  the stand-in is healthy again; time until the breaker closes
+            and the uncached query succeeds
+
+Prints a JSON report of status counts, latencies and breaker states.
+
+Usage: python -m benchmarks.faults [--requests 20] [--reset-seconds 3]
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks.harness import free_port, latency_summary, start_process, wait_for
+
+CACHED_QUERY = {'query': {'state_cd': ['CA']}, 'config': {'report_type': 'summary', 'max_records': 5000}}
+UNCACHED_QUERY = {'query': {'state_cd': ['OR']}, 'config': {'report_type': 'summary', 'max_records': 5000}}
+
+
+def send_all(url: str, body: Dict[str, Any], n_requests: int) -> Dict[str, Any]:
+    """Send n_requests POSTs one at a time; summarize statuses, latencies and stale answers"""
+    latencies: List[float] = []
+    statuses: List[int] = []
+    stale = 0
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        sent = time.perf_counter()
+        try:
+            response = requests.post(url, json=body, timeout=120)
+            statuses.append(response.status_code)
+            stale += 'Warning' in response.headers
+        except requests.RequestException:
+            statuses.append(0)
+        latencies.append(time.perf_counter() - sent)
+    summary = latency_summary(latencies, statuses, time.perf_counter() - start)
+    summary['stale_responses'] = stale
+    summary['max_seconds_any_status'] = max(latencies)
+    return summary
+
+
+def breaker_states(app_url: str) -> Dict[str, Any]:
+    return requests.get(f"{app_url}/health", timeout=5).json().get('upstream', {})
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    standin_port, app_port = free_port(), free_port()
+    standin_url = f"http://127.0.0.1:{standin_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    query_url = f"{app_url}/water-quality/query"
+
+    standin = start_process('benchmarks.standin', [
+        '--port', str(standin_port), '--rows', str(args.rows), '--block-rows', str(args.rows)
+    ])
+    app = None
+    try:
+        wait_for(f"{standin_url}/_settings", standin)
+        app = start_process(
+            'benchmarks.serve_app',
+            ['--standin', standin_url, '--port', str(app_port)],
+            env={
+                'CACHE_ENABLED': 'true',
+                'CACHE_TTL': str(args.cache_ttl),
+                'UPSTREAM_BREAKER_FAILURES': str(args.breaker_failures),
+                'UPSTREAM_BREAKER_RESET_SECONDS': str(args.reset_seconds),
+                'SITE_CATALOG_STATES': '[]',
+            }
+        )
+        wait_for(f"{app_url}/health", app)
+        wait_for(f"{app_url}/ready", app)
+        while requests.get(f"{app_url}/ready", timeout=5).status_code != 200:
+            time.sleep(0.2)
+
+        report: Dict[str, Any] = {}
+        report['healthy'] = send_all(query_url, CACHED_QUERY, 1)
+        # Let the cached result expire so outage answers are stale
+        time.sleep(args.cache_ttl + 0.5)
+
+        requests.get(f"{standin_url}/_settings", params={'error_rate': 1}, timeout=5)
+        report['outage_cached'] = send_all(query_url, CACHED_QUERY, args.requests)
+        report['outage_uncached'] = send_all(query_url, UNCACHED_QUERY, args.requests)
+        report['outage_breakers'] = breaker_states(app_url)
+
+        requests.get(f"{standin_url}/_settings", params={'error_rate': 0}, timeout=5)
+        recovery_started = time.perf_counter()
+        statuses = []
+        while time.perf_counter() - recovery_started < args.reset_seconds * 10:
+            status = requests.post(query_url, json=UNCACHED_QUERY, timeout=120).status_code
+            statuses.append(status)
+            if status == 200:
+                break
+            time.sleep(0.25)
+        report['recovery'] = {
+            'seconds_to_success': time.perf_counter() - recovery_started if statuses[-1] == 200 else None,
+            'status_counts': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+            'breakers': breaker_states(app_url),
+        }
+        return report
+    finally:
+        for process in (app, standin):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5_000, help='Rows per stand-in WQP response')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per outage phase')
+    parser.add_argument('--cache-ttl', type=int, default=2)
+    parser.add_argument('--breaker-failures', type=int, default=3)
+    parser.add_argument('--reset-seconds', type=int, default=3)
+    args = parser.parse_args()
+    json.dump(run(args), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+Benchmark suite: per-stage timings and end-to-end load against a local stand-in
+
+Stage benchmarks time DataProcessor.clean_and_validate_data and each
+ReportGenerator method on synthetic WQP results of each size. End-to-end
+benchmarks start benchmarks.standin and the API (benchmarks.serve_app) as
+subprocesses and measure /water-quality/query throughput and latency
+percentiles under concurrent load. Results are written as JSON, keyed by
+the current commit, and can be compared against an earlier run.
+
+Usage: python -m benchmarks.harness [--sizes 10000 100000 1000000]
+           [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+
+from app.core import serialization
+from app.core.data_processor import DataProcessor, ALL_REPORT_COLUMNS
+from app.core.report_generator import ReportGenerator
+from app.core.site_catalog import SiteIndex
+from benchmarks.synthetic import generate_nwis_sites, generate_wqp_results
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+
+# name -> (query, config) posted to /water-quality/query
+SCENARIOS = {
+    'summary_streamed': ({'state_cd': ['CA']}, {'report_type': 'summary', 'max_records': 10000}),
+    'detailed_streamed': ({'state_cd': ['CA']}, {'report_type': 'detailed', 'max_records': 10000}),
+    'summary_full': ({'state_cd': ['CA']}, {'report_type': 'summary', 'max_records': 1000000}),
+    'trend_full': ({'state_cd': ['CA']}, {'report_type': 'trend', 'max_records': 1000000}),
+}
+
+
+def best_of(repeat: int, func: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def stage_benchmarks(n_rows: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Best-of-repeat seconds for each processing stage on n_rows raw rows"""
+    raw = generate_wqp_results(n_rows)
+    df = DataProcessor.clean_and_validate_data(raw, columns=ALL_REPORT_COLUMNS)
+    sample = df.sample(min(len(df), 10_000), random_state=0)
+    detailed = ReportGenerator.generate_detailed_report(df, {})
+    sites = SiteIndex(generate_nwis_sites(df['MonitoringLocationIdentifier'].nunique()))
+    zones = {level: sites.zones(level) for level in ('huc4', 'huc8', 'grid')}
+
+    stages: Dict[str, Callable[[], Any]] = {
+        'clean_and_validate_data': lambda: DataProcessor.clean_and_validate_data(raw, columns=ALL_REPORT_COLUMNS),
+        'generate_summary_report': lambda: ReportGenerator.generate_summary_report(df, {}),
+        'generate_sampled_summary_report': lambda: ReportGenerator.generate_sampled_summary_report(sample, {}, len(df)),
+        'generate_detailed_report': lambda: ReportGenerator.generate_detailed_report(df, {}),
+        'iter_detailed_chunks_csv': lambda: sum(map(len, ReportGenerator.iter_detailed_chunks(df, 'csv', 5000))),
+        'iter_detailed_chunks_ndjson': lambda: sum(map(len, ReportGenerator.iter_detailed_chunks(df, 'ndjson', 5000))),
+        'iter_columnar_chunks_arrow': lambda: sum(map(len, ReportGenerator.iter_columnar_chunks(df, 'arrow', 65536, {}))),
+        'iter_columnar_chunks_parquet': lambda: sum(map(len, ReportGenerator.iter_columnar_chunks(df, 'parquet', 65536, {}))),
+        'generate_trend_report': lambda: ReportGenerator.generate_trend_report(df, {}),
+        'generate_trend_report_monthly_statistics': lambda: ReportGenerator.generate_trend_report(
+            df, {}, granularity='monthly', trend_statistics=True
+        ),
+        'generate_trend_report_by_unit': lambda: ReportGenerator.generate_trend_report(df, {}, by_unit=True),
+        'generate_comparison_report': lambda: ReportGenerator.generate_comparison_report(
+            df, {}, thresholds={'pH': {'min': 6.5, 'max': 8.5}}
+        ),
+        'generate_spatial_report_huc4_huc8_grid': lambda: ReportGenerator.generate_spatial_report(
+            df, {}, zones, grid_degrees=0.25
+        ),
+        'generate_sections_summary_trend_detailed': lambda: ReportGenerator.generate_sections(
+            df, {}, ['summary', 'trend', 'detailed'], detail_limit=100
+        ),
+        'serialize_detailed_json': lambda: serialization.dumps({'data': detailed}),
+    }
+
+    results = {}
+    for name, func in stages.items():
+        seconds = best_of(repeat, func)
+        results[name] = {'seconds': seconds, 'rows_per_second': n_rows / seconds if seconds else None}
+        print(f"  {n_rows:>9} rows  {name:<42} {seconds * 1000:10.1f} ms", file=sys.stderr)
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+def start_process(module: str, args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, '-m', module, *args],
+        cwd=ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL
+    )
+
+
+def latency_summary(latencies: List[float], statuses: List[int], elapsed: float) -> Dict[str, Any]:
+    ok = [latency for latency, status in zip(latencies, statuses) if status == 200]
+    summary: Dict[str, Any] = {
+        'requests': len(statuses),
+        'errors': len(statuses) - len(ok),
+        'status_counts': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+        'elapsed_seconds': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed else None,
+    }
+    if ok:
+        p50, p90, p99 = np.percentile(ok, [50, 90, 99])
+        summary.update({
+            'mean_seconds': float(np.mean(ok)),
+            'p50_seconds': float(p50),
+            'p90_seconds': float(p90),
+            'p99_seconds': float(p99),
+            'max_seconds': float(np.max(ok)),
+        })
+    return summary
+
+
+def run_load(url: str, body: Dict[str, Any], n_requests: int, concurrency: int) -> Dict[str, Any]:
+    """Send n_requests POSTs from concurrency threads and summarize latencies"""
+    local = threading.local()
+
+    def send(_: int):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = local.session.post(url, json=body, timeout=600).status_code
+        except requests.RequestException:
+            status = 0
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    return latency_summary([r[0] for r in results], [r[1] for r in results], elapsed)
+
+
+def end_to_end_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    standin_port, app_port = free_port(), free_port()
+    standin_url = f"http://127.0.0.1:{standin_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    standin = start_process('benchmarks.standin', [
+        '--port', str(standin_port),
+        '--rows', str(args.e2e_rows),
+        '--latency', str(args.latency),
+    ])
+    app = None
+    try:
+        wait_for(f"{standin_url}/", standin)
+        app = start_process(
+            'benchmarks.serve_app',
+            ['--standin', standin_url, '--port', str(app_port)],
+            env={'CACHE_ENABLED': 'true' if args.cache else 'false'}
+        )
+        wait_for(f"{app_url}/health", app)
+
+        results = {}
+        for name in args.scenarios:
+            query, config = SCENARIOS[name]
+            body = {'query': query, 'config': config}
+            # One warm-up request so imports and first-use costs are excluded
+            run_load(f"{app_url}/water-quality/query", body, 1, 1)
+            results[name] = run_load(
+                f"{app_url}/water-quality/query", body, args.requests, args.concurrency
+            )
+            print(f"  {name:<20} p50 {results[name].get('p50_seconds', float('nan')):.3f}s "
+                  f"p99 {results[name].get('p99_seconds', float('nan')):.3f}s "
+                  f"{results[name]['throughput_rps']:.2f} req/s "
+                  f"errors {results[name]['errors']}", file=sys.stderr)
+        return results
+    finally:
+        for process in (app, standin):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+def git_commit() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ['git', *args], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    try:
+        return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Lines describing stages and scenarios that got slower than threshold"""
+    lines = []
+    for size, stages in current.get('stages', {}).items():
+        for name, result in stages.items():
+            before = baseline.get('stages', {}).get(size, {}).get(name)
+            if before:
+                ratio = result['seconds'] / before['seconds']
+                flag = 'REGRESSION' if ratio > 1 + threshold else ''
+                lines.append(f"stage {name} @ {size} rows: {ratio:.2f}x {flag}".rstrip())
+    for name, result in current.get('end_to_end', {}).items():
+        before = baseline.get('end_to_end', {}).get(name)
+        if before and 'p99_seconds' in result and 'p99_seconds' in before:
+            ratio = result['p99_seconds'] / before['p99_seconds']
+            flag = 'REGRESSION' if ratio > 1 + threshold else ''
+            lines.append(f"end_to_end {name} p99: {ratio:.2f}x {flag}".rstrip())
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Raw row counts for stage benchmarks (up to 5M needs ~16 GB RAM)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-stages', action='store_true')
+    parser.add_argument('--skip-end-to-end', action='store_true')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--e2e-rows', type=int, default=100_000, help='Rows per stand-in WQP response')
+    parser.add_argument('--latency', type=float, default=0.1, help='Stand-in time to first byte (seconds)')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--cache', action='store_true', help='Leave the query cache enabled')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', type=Path, default=None, help='Earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown reported as a regression')
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        **git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'stages': {},
+        'end_to_end': {},
+    }
+
+    if not args.skip_stages:
+        for n_rows in args.sizes:
+            results['stages'][str(n_rows)] = stage_benchmarks(n_rows, args.repeat)
+    if not args.skip_end_to_end:
+        results['end_to_end'] = end_to_end_benchmarks(args)
+
+    output = args.output or RESULTS_DIR / f"{(results['commit'] or 'unknown')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, default=str))
+    print(f"Wrote {output}", file=sys.stderr)
+
+    if args.compare:
+        for line in compare(results, json.loads(args.compare.read_text()), args.threshold):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Run the API with its upstream services pointed at the local stand-in
+
+Every upstream request follows USGS_BASE_URL and NWIS_BASE_URL, so setting
+them before the app is imported is enough.
+
+Usage: python -m benchmarks.serve_app --standin http://127.0.0.1:8765 [--port 8000]
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def point_at_standin(base_url: str) -> None:
+    base_url = base_url.rstrip('/')
+    os.environ['USGS_BASE_URL'] = base_url
+    os.environ['NWIS_BASE_URL'] = f"{base_url}/nwis"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--standin', required=True, help='Base URL of benchmarks.standin')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    point_at_standin(args.standin)
+    from app.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
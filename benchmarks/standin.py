@@ -0,0 +1,222 @@
+"""
+Local HTTP stand-in for the WQP result and NWIS site services
+
+Serves synthetic data on the paths the app requests:
+  /data/Result/search   WQP results as CSV (optionally gzip encoded)
+  /nwis/site/           NWIS site descriptions as RDB
+  /_settings            GET ?rows=&latency=&error_rate=&error_status= changes them at runtime
+
+Result responses are built from a few pre-generated blocks of rows, cycled
+until the configured row count is reached, so large responses cost no more
+memory than the blocks. Latency (time to first byte) and bandwidth are
+configurable, and a fraction of data responses can fail with error_status
+to simulate an upstream outage.
+
+Usage: python -m benchmarks.standin [--port 8765] [--rows 100000] [--latency 0.2] [--error-rate 0.5]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from benchmarks.synthetic import generate_nwis_sites, generate_wqp_results
+
+WRITE_SIZE = 64 * 1024
+
+
+@dataclass
+class StandInConfig:
+    rows: int = 100_000
+    sites: int = 2_000
+    latency: float = 0.0
+    bandwidth: Optional[float] = None  # bytes per second, unlimited when None
+    gzip: bool = True
+    block_rows: int = 50_000
+    distinct_blocks: int = 4
+    error_rate: float = 0.0  # fraction of data responses answered with error_status
+    error_status: int = 503
+
+
+class ResultBlocks:
+    """Pre-encoded CSV blocks of synthetic WQP results with row offsets"""
+
+    def __init__(self, block_rows: int, distinct_blocks: int):
+        self.block_rows = block_rows
+        self.blocks: List[Tuple[bytes, np.ndarray]] = []
+        self.header = b''
+        for seed in range(distinct_blocks):
+            text = generate_wqp_results(block_rows, seed=seed).to_csv(index=False).encode()
+            header_end = text.index(b'\n') + 1
+            self.header = text[:header_end]
+            body = text[header_end:]
+            # Offsets just past each row's newline, for cutting partial blocks
+            ends = np.flatnonzero(np.frombuffer(body, dtype=np.uint8) == ord('\n')) + 1
+            self.blocks.append((body, ends))
+
+    def iter_csv(self, rows: int) -> Iterator[bytes]:
+        yield self.header
+        index = 0
+        while rows > 0:
+            body, ends = self.blocks[index % len(self.blocks)]
+            take = min(rows, len(ends))
+            data = body if take == len(ends) else body[:ends[take - 1]]
+            for start in range(0, len(data), WRITE_SIZE):
+                yield data[start:start + WRITE_SIZE]
+            rows -= take
+            index += 1
+
+
+def to_rdb(df) -> bytes:
+    """Encode a frame in the NWIS RDB format read by USGSDataFetcher.parse_rdb"""
+    lines = ['# Synthetic NWIS site output', '\t'.join(df.columns), '\t'.join('5s' for _ in df.columns)]
+    body = df.to_csv(sep='\t', index=False, header=False, na_rep='')
+    return ('\n'.join(lines) + '\n' + body).encode()
+
+
+def make_handler(config: StandInConfig, blocks: ResultBlocks):
+    sites_cache: Dict[Tuple[str, ...], bytes] = {}
+    sites_lock = threading.Lock()
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so clients can reuse connections between requests
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _write(self, chunks: Iterator[bytes]) -> None:
+            started = time.perf_counter()
+            sent = 0
+            for chunk in chunks:
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if config.bandwidth:
+                    ahead = sent / config.bandwidth - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+        def _send_stream(self, content_type: str, chunks: Iterator[bytes]) -> None:
+            accepts_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            if config.gzip and accepts_gzip:
+                chunks = gzip_chunks(chunks)
+                self.send_header('Content-Encoding', 'gzip')
+            # Length is unknown up front, so the body is sent chunked
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self._write(
+                b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks if chunk
+            )
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _update_settings(self, params: Dict[str, List[str]]) -> None:
+            for name in ('error_rate', 'latency'):
+                if name in params:
+                    setattr(config, name, float(params[name][0]))
+            for name in ('error_status', 'rows'):
+                if name in params:
+                    setattr(config, name, int(params[name][0]))
+            body = json.dumps({
+                'rows': config.rows,
+                'latency': config.latency,
+                'error_rate': config.error_rate,
+                'error_status': config.error_status
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == '/_settings':
+                self._update_settings(params)
+                return
+            if config.latency:
+                time.sleep(config.latency)
+            if config.error_rate and random.random() < config.error_rate:
+                self.send_error(config.error_status)
+                return
+            try:
+                if url.path.rstrip('/') == '/data/Result/search':
+                    self._send_stream('text/csv', blocks.iter_csv(config.rows))
+                elif url.path.rstrip('/') == '/nwis/site':
+                    site_types = tuple(sorted(
+                        code for value in params.get('siteType', []) for code in value.split(',')
+                    ))
+                    with sites_lock:
+                        if site_types not in sites_cache:
+                            sites = generate_nwis_sites(config.sites, site_types=list(site_types) or None)
+                            sites_cache[site_types] = to_rdb(sites)
+                    self._send_stream('text/plain', iter([sites_cache[site_types]]))
+                else:
+                    self.send_error(404)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading (early termination); nothing to do
+                pass
+
+    return StandInHandler
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip-encode a stream of chunks at a fast compression level"""
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def make_server(host: str, port: int, config: StandInConfig) -> ThreadingHTTPServer:
+    blocks = ResultBlocks(config.block_rows, config.distinct_blocks)
+    server = ThreadingHTTPServer((host, port), make_handler(config, blocks))
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rows', type=int, default=100_000, help='Rows per result response')
+    parser.add_argument('--sites', type=int, default=2_000, help='Sites per site response')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each response starts')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Bytes per second per response')
+    parser.add_argument('--no-gzip', action='store_true', help='Never gzip responses')
+    parser.add_argument('--block-rows', type=int, default=50_000)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of data responses that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='Status of failed responses')
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        rows=args.rows,
+        sites=args.sites,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        gzip=not args.no_gzip,
+        block_rows=min(args.block_rows, args.rows),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    server = make_server(args.host, args.port, config)
+    print(f"Serving WQP/NWIS stand-in on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Synthetic Water Quality Portal result sets for benchmarks
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Legacy WQX result profile columns, in the order WQP returns them
+WQP_RESULT_COLUMNS = [
+    'OrganizationIdentifier', 'OrganizationFormalName', 'ActivityIdentifier',
+    'ActivityTypeCode', 'ActivityMediaName', 'ActivityMediaSubdivisionName',
+    'ActivityStartDate', 'ActivityStartTime/Time', 'ActivityStartTime/TimeZoneCode',
+    'ActivityEndDate', 'ActivityEndTime/Time', 'ActivityEndTime/TimeZoneCode',
+    'ActivityDepthHeightMeasure/MeasureValue', 'ActivityDepthHeightMeasure/MeasureUnitCode',
+    'ActivityDepthAltitudeReferencePointText', 'ActivityTopDepthHeightMeasure/MeasureValue',
+    'ActivityTopDepthHeightMeasure/MeasureUnitCode', 'ActivityBottomDepthHeightMeasure/MeasureValue',
+    'ActivityBottomDepthHeightMeasure/MeasureUnitCode', 'ProjectIdentifier',
+    'ActivityConductingOrganizationText', 'MonitoringLocationIdentifier', 'ActivityCommentText',
+    'SampleAquifer', 'HydrologicCondition', 'HydrologicEvent',
+    'SampleCollectionMethod/MethodIdentifier', 'SampleCollectionMethod/MethodIdentifierContext',
+    'SampleCollectionMethod/MethodName', 'SampleCollectionEquipmentName',
+    'ResultDetectionConditionText', 'CharacteristicName', 'ResultSampleFractionText',
+    'ResultMeasureValue', 'ResultMeasure/MeasureUnitCode', 'MeasureQualifierCode',
+    'ResultStatusIdentifier', 'StatisticalBaseCode', 'ResultValueTypeName',
+    'ResultWeightBasisText', 'ResultTimeBasisText', 'ResultTemperatureBasisText',
+    'ResultParticleSizeBasisText', 'PrecisionValue', 'ResultCommentText', 'USGSPCode',
+    'ResultDepthHeightMeasure/MeasureValue', 'ResultDepthHeightMeasure/MeasureUnitCode',
+    'ResultDepthAltitudeReferencePointText', 'SubjectTaxonomicName', 'SampleTissueAnatomyName',
+    'ResultAnalyticalMethod/MethodIdentifier', 'ResultAnalyticalMethod/MethodIdentifierContext',
+    'ResultAnalyticalMethod/MethodName', 'MethodDescriptionText', 'LaboratoryName',
+    'AnalysisStartDate', 'ResultLaboratoryCommentText', 'DetectionQuantitationLimitTypeName',
+    'DetectionQuantitationLimitMeasure/MeasureValue',
+    'DetectionQuantitationLimitMeasure/MeasureUnitCode', 'PreparationStartDate', 'ProviderName'
+]
+
+# (characteristic, unit, typical value, spread, USGS parameter code)
+CHARACTERISTICS = [
+    ('Temperature, water', 'deg C', 14.0, 5.0, '00010'),
+    ('pH', 'std units', 7.6, 0.6, '00400'),
+    ('Dissolved oxygen (DO)', 'mg/l', 9.0, 2.0, '00300'),
+    ('Specific conductance', 'uS/cm @25C', 350.0, 150.0, '00095'),
+    ('Turbidity', 'NTU', 8.0, 10.0, '63680'),
+    ('Nitrate', 'mg/l as N', 0.8, 0.7, '00618'),
+    ('Phosphorus', 'mg/l as P', 0.12, 0.1, '00665'),
+    ('Escherichia coli', 'cfu/100mL', 120.0, 200.0, '31633'),
+    ('Chloride', 'mg/l', 25.0, 20.0, '00940'),
+    ('Arsenic', 'ug/l', 2.0, 2.0, '01000'),
+]
+
+ORGANIZATIONS = [
+    ('USGS-CA', 'USGS California Water Science Center', 'NWIS'),
+    ('CEDEN', 'California Environmental Data Exchange Network', 'STORET'),
+    ('21CAXWRB-WQX', 'California State Water Resources Control Board', 'STORET'),
+    ('CABW_WQX', 'California Bioassessment Workgroup', 'STORET'),
+]
+
+NON_NUMERIC_VALUES = ['ND', '*Non-detect', '*Present <QL', 'Not Reported', '<0.01']
+
+
+def generate_wqp_results(
+    n_rows: int,
+    seed: int = 0,
+    n_sites: Optional[int] = None,
+    start_year: int = 2000,
+    end_year: int = 2023,
+    null_fraction: float = 0.08,
+    non_numeric_fraction: float = 0.03
+) -> pd.DataFrame:
+    """
+    Generate a raw WQP result frame shaped like wqp.get_results output
+
+    Values are mostly numeric strings with a mix of missing and non-numeric
+    results, dates are unparsed strings, and sparse columns are mostly NaN,
+    matching what pandas.read_csv produces for a WQP CSV download.
+    """
+    rng = np.random.default_rng(seed)
+    n_sites = n_sites or max(10, min(5000, n_rows // 200))
+
+    site_ids = np.array([f"USGS-{11000000 + i * 37}" for i in range(n_sites)])
+    site_idx = rng.integers(0, n_sites, n_rows)
+    org_idx = rng.integers(0, len(ORGANIZATIONS), n_rows)
+    char_idx = rng.integers(0, len(CHARACTERISTICS), n_rows)
+
+    days = (pd.Timestamp(f"{end_year}-12-31") - pd.Timestamp(f"{start_year}-01-01")).days
+    dates = pd.Timestamp(f"{start_year}-01-01") + pd.to_timedelta(rng.integers(0, days + 1, n_rows), unit='D')
+    date_strings = dates.strftime('%Y-%m-%d').to_numpy()
+
+    names = np.array([c[0] for c in CHARACTERISTICS], dtype=object)
+    units = np.array([c[1] for c in CHARACTERISTICS], dtype=object)
+    centers = np.array([c[2] for c in CHARACTERISTICS])
+    spreads = np.array([c[3] for c in CHARACTERISTICS])
+    pcodes = np.array([c[4] for c in CHARACTERISTICS], dtype=object)
+
+    values = np.abs(rng.normal(centers[char_idx], spreads[char_idx])).round(3)
+    result_values = values.astype(str).astype(object)
+    roll = rng.random(n_rows)
+    missing = roll < null_fraction
+    non_numeric = (roll >= null_fraction) & (roll < null_fraction + non_numeric_fraction)
+    result_values[missing] = np.nan
+    result_values[non_numeric] = rng.choice(NON_NUMERIC_VALUES, int(non_numeric.sum()))
+
+    detection = np.full(n_rows, np.nan, dtype=object)
+    detection[missing] = 'Not Detected'
+
+    org_ids = np.array([o[0] for o in ORGANIZATIONS], dtype=object)
+    org_names = np.array([o[1] for o in ORGANIZATIONS], dtype=object)
+    providers = np.array([o[2] for o in ORGANIZATIONS], dtype=object)
+
+    def sparse(choices, fraction):
+        column = np.full(n_rows, np.nan, dtype=object)
+        mask = rng.random(n_rows) < fraction
+        column[mask] = rng.choice(np.array(choices, dtype=object), int(mask.sum()))
+        return column
+
+    # Columns that are empty in every row parse as float NaN, as in read_csv
+    empty = np.full(n_rows, np.nan)
+    activity_ids = np.char.add(
+        np.char.add(org_ids[org_idx].astype(str), '-'),
+        np.arange(n_rows).astype(str)
+    ).astype(object)
+
+    data = {
+        'OrganizationIdentifier': org_ids[org_idx],
+        'OrganizationFormalName': org_names[org_idx],
+        'ActivityIdentifier': activity_ids,
+        'ActivityTypeCode': sparse(['Sample-Routine', 'Field Msr/Obs', 'Quality Control Sample-Field Replicate'], 0.98),
+        'ActivityMediaName': np.full(n_rows, 'Water', dtype=object),
+        'ActivityMediaSubdivisionName': sparse(['Surface Water', 'Groundwater'], 0.9),
+        'ActivityStartDate': date_strings,
+        'ActivityStartTime/Time': sparse(['08:30:00', '10:15:00', '13:45:00', '15:00:00'], 0.85),
+        'ActivityStartTime/TimeZoneCode': sparse(['PST', 'PDT'], 0.85),
+        'ActivityEndDate': sparse(list(date_strings[:50]), 0.05),
+        'ActivityDepthHeightMeasure/MeasureValue': sparse(['0.5', '1', '2'], 0.1),
+        'ActivityDepthHeightMeasure/MeasureUnitCode': sparse(['m', 'ft'], 0.1),
+        'ProjectIdentifier': sparse(['SWAMP', 'NAWQA', 'CA-WQM'], 0.4),
+        'MonitoringLocationIdentifier': site_ids[site_idx].astype(object),
+        'ActivityCommentText': sparse(['Sample collected mid-channel', 'High flow'], 0.05),
+        'HydrologicCondition': sparse(['Stable, normal stage', 'Rising stage', 'Falling stage'], 0.3),
+        'HydrologicEvent': sparse(['Routine sample', 'Storm'], 0.3),
+        'SampleCollectionMethod/MethodIdentifier': sparse(['USGS', 'GRAB'], 0.6),
+        'SampleCollectionMethod/MethodName': sparse(['Grab sample', 'Equal width increment'], 0.6),
+        'SampleCollectionEquipmentName': sparse(['Water Bottle', 'Probe/Sensor'], 0.7),
+        'ResultDetectionConditionText': detection,
+        'CharacteristicName': names[char_idx],
+        'ResultSampleFractionText': sparse(['Total', 'Dissolved'], 0.5),
+        'ResultMeasureValue': result_values,
+        'ResultMeasure/MeasureUnitCode': units[char_idx],
+        'MeasureQualifierCode': sparse(['J', 'E', 'U'], 0.05),
+        'ResultStatusIdentifier': rng.choice(np.array(['Accepted', 'Historical', 'Preliminary'], dtype=object), n_rows, p=[0.8, 0.15, 0.05]),
+        'ResultValueTypeName': np.full(n_rows, 'Actual', dtype=object),
+        'ResultCommentText': sparse(['Value verified', 'Sample holding time exceeded', 'Estimated'], 0.04),
+        'USGSPCode': pcodes[char_idx],
+        'ResultAnalyticalMethod/MethodIdentifier': sparse(['EPA 300.0', 'SM 4500-H+ B', 'I-2057-85'], 0.5),
+        'ResultAnalyticalMethod/MethodName': sparse(['Ion chromatography', 'Electrometric'], 0.5),
+        'LaboratoryName': sparse(['USGS-NWQL', 'Contract Lab'], 0.3),
+        'DetectionQuantitationLimitTypeName': sparse(['Method Detection Level', 'Reporting Level'], 0.3),
+        'DetectionQuantitationLimitMeasure/MeasureValue': sparse(['0.01', '0.02', '0.1', '1'], 0.3),
+        'DetectionQuantitationLimitMeasure/MeasureUnitCode': sparse(['mg/l', 'ug/l'], 0.3),
+        'ProviderName': providers[org_idx],
+    }
+
+    return pd.DataFrame({
+        column: data.get(column, empty) for column in WQP_RESULT_COLUMNS
+    })
+
+
+# (site_tp_cd, fraction of sites)
+SITE_TYPES = [('ST', 0.55), ('LK', 0.1), ('GW', 0.3), ('SP', 0.05)]
+
+# NWIS expanded site output columns used by the site catalog, in RDB order
+NWIS_SITE_COLUMNS = [
+    'agency_cd', 'site_no', 'station_nm', 'site_tp_cd', 'dec_lat_va', 'dec_long_va',
+    'coord_acy_cd', 'dec_coord_datum_cd', 'state_cd', 'county_cd', 'huc_cd',
+    'alt_va', 'alt_datum_cd', 'drain_area_va'
+]
+
+
+def generate_nwis_sites(
+    n_sites: int,
+    seed: int = 0,
+    site_types: Optional[List[str]] = None,
+    bbox: Tuple[float, float, float, float] = (-124.4, 32.5, -114.1, 42.0)
+) -> pd.DataFrame:
+    """
+    Generate an NWIS site table shaped like nwis.get_info(siteOutput='expanded')
+
+    Site numbers line up with the MonitoringLocationIdentifier values of
+    generate_wqp_results, and sites are spread uniformly over bbox
+    ([minx, miny, maxx, maxy], California by default).
+    """
+    rng = np.random.default_rng(seed)
+    codes = [code for code, _ in SITE_TYPES]
+    weights = np.array([fraction for _, fraction in SITE_TYPES])
+    if site_types:
+        keep = np.isin(codes, site_types)
+        codes = list(np.array(codes)[keep])
+        weights = weights[keep] / weights[keep].sum()
+
+    site_type = rng.choice(np.array(codes, dtype=object), n_sites, p=weights)
+    huc = rng.choice([18010110, 18020111, 18020125, 18040001, 18050004, 18070105], n_sites)
+    drainage = np.where(site_type == 'ST', rng.lognormal(4, 1.5, n_sites).round(1), np.nan)
+
+    return pd.DataFrame({
+        'agency_cd': 'USGS',
+        'site_no': [f"{11000000 + i * 37}" for i in range(n_sites)],
+        'station_nm': [f"SYNTHETIC SITE {i} NR SACRAMENTO CA" for i in range(n_sites)],
+        'site_tp_cd': site_type,
+        'dec_lat_va': rng.uniform(bbox[1], bbox[3], n_sites).round(6),
+        'dec_long_va': rng.uniform(bbox[0], bbox[2], n_sites).round(6),
+        'coord_acy_cd': rng.choice(np.array(['S', 'F', 'T', '5'], dtype=object), n_sites),
+        'dec_coord_datum_cd': 'NAD83',
+        'state_cd': 6,
+        'county_cd': rng.integers(1, 116, n_sites) | 1,
+        'huc_cd': huc,
+        'alt_va': np.where(rng.random(n_sites) < 0.8, rng.uniform(0, 3000, n_sites).round(0), np.nan),
+        'alt_datum_cd': 'NAVD88',
+        'drain_area_va': drainage,
+    }, columns=NWIS_SITE_COLUMNS)
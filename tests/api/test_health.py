@@ -0,0 +1,15 @@
+"""
+Tests for the health endpoints
+"""
+
+
+def test_health_reports_upstream_breakers(client):
+    health = client.get('/health').json()
+    assert health['status'] == 'healthy'
+    assert health['upstream']['wqp']['state'] == 'closed'
+
+
+def test_ready_reports_startup_steps(client):
+    ready = client.get('/ready').json()
+    assert ready['status'] == 'ready'
+    assert ready['startup']
@@ -0,0 +1,11 @@
+"""
+Tests for the Prometheus metrics endpoint
+"""
+
+
+def test_metrics_endpoint(client):
+    client.get('/health')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
@@ -0,0 +1,52 @@
+"""
+Tests for the sites endpoint, served from the catalog of stand-in NWIS sites
+"""
+
+
+def sites(client, **params):
+    # Not a state the query tests use: a catalogued state's queries are sharded by county
+    return client.get('/water-quality/sites', params={'state_cd': 'NV', **params})
+
+
+def test_all_catalogued_sites(client):
+    response = sites(client)
+    assert response.status_code == 200
+    body = response.json()
+    assert body['count'] == len(body['sites']) > 0
+    assert {site['site_tp_cd'] for site in body['sites']} == {'ST'}
+
+
+def test_bbox(client):
+    everything = sites(client).json()['sites']
+    bbox = [-122.0, 37.0, -120.0, 39.0]
+    response = sites(client, bbox=bbox)
+    assert response.status_code == 200
+    inside = [
+        site['site_no'] for site in everything
+        if site['dec_lat_va'] is not None
+        and bbox[0] <= site['dec_long_va'] <= bbox[2] and bbox[1] <= site['dec_lat_va'] <= bbox[3]
+    ]
+    assert [site['site_no'] for site in response.json()['sites']] == inside
+    assert response.json()['query_params']['bbox'] == bbox
+
+
+def test_radius(client):
+    center = sites(client).json()['sites'][0]
+    response = sites(client, latitude=center['dec_lat_va'], longitude=center['dec_long_va'], radius_km=10)
+    found = response.json()['sites']
+    assert center['site_no'] in [site['site_no'] for site in found]
+    for site in found:
+        # A degree of latitude is over 111 km
+        assert abs(site['dec_lat_va'] - center['dec_lat_va']) <= 10 / 111
+
+
+def test_huc_prefix(client):
+    huc = str(sites(client).json()['sites'][0]['huc_cd'])[:6]
+    found = sites(client, huc=huc).json()['sites']
+    assert found
+    assert all(str(site['huc_cd']).startswith(huc) for site in found)
+
+
+def test_incomplete_filters_are_rejected(client):
+    assert sites(client, bbox=[1, 2, 3]).status_code == 400
+    assert sites(client, latitude=38.0, longitude=-121.0).status_code == 400
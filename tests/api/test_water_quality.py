@@ -0,0 +1,239 @@
+"""
+Tests for the water quality endpoints, against the WQP stand-in
+"""
+import asyncio
+import json
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.api import water_quality
+from tests.conftest import STANDIN_ROWS
+
+
+def query(client, config=None, **query):
+    return client.post('/water-quality/query', json={
+        'query': {'state_cd': ['CA'], **query},
+        'config': config or {}
+    })
+
+
+def county_results(rows_by_county):
+    """A WQP response function answering each countycode with that county's rows"""
+    def respond(params):
+        county = params['countycode'][0]
+        n = rows_by_county[county]
+        df = pd.DataFrame({
+            'OrganizationIdentifier': 'USGS-CA',
+            'ActivityIdentifier': [f"{county}-{i}" for i in range(n)],
+            'MonitoringLocationIdentifier': f"USGS-{county[-3:]}",
+            'ActivityStartDate': '2020-01-01',
+            'CharacteristicName': 'pH',
+            'ResultMeasureValue': 7.0,
+            'ResultMeasureUnitCode': 'std units'
+        })
+        return 200, 'text/csv', df.to_csv(index=False).encode()
+    return respond
+
+
+class TestQuery:
+    def test_summary_report(self, client):
+        response = query(client)
+        assert response.status_code == 200
+        report = response.json()
+        assert report['report_type'] == 'summary'
+        assert report['records_processed'] == STANDIN_ROWS
+        assert report['data_summary']['total_records'] == STANDIN_ROWS
+
+    def test_max_records_draws_on_every_shard(self, client):
+        response = query(client, {'max_records': 500}, state_cd=['CA', 'OR', 'WA'])
+        assert response.status_code == 200
+        metadata = response.json()['metadata']
+        assert metadata['shards_planned'] == 3
+        assert metadata['shard_rows'] == [167, 167, 167]
+        assert metadata['passes'] == 1
+
+    def test_comparison_report_keeps_the_summary(self, client):
+        response = query(client, {
+            'report_type': 'comparison',
+            'comparison_thresholds': {'pH': {'min': 6.5, 'max': 8.5}}
+        })
+        assert response.status_code == 200
+        summary = response.json()['data_summary']
+        assert summary['total_records'] == STANDIN_ROWS
+        assert 'date_range' in summary
+        assert summary['comparison']
+        assert summary['unmatched_thresholds'] == []
+
+
+class TestSpatialReport:
+    def test_results_are_aggregated_by_catalogued_site_location(self, client):
+        # Not a state the other query tests use, since it is catalogued here
+        response = query(client, {'report_type': 'spatial', 'spatial_levels': ['huc8', 'grid'], 'grid_degrees': 0.5},
+                         state_cd=['NV'])
+        assert response.status_code == 200
+        summary = response.json()['data_summary']
+        assert summary['grid_degrees'] == 0.5
+        for level in summary['levels'].values():
+            assert level['mapped_records'] + level['unmapped_records'] == summary['total_records']
+            assert level['zone_count'] == len(level['zones']) > 0
+        assert all(len(label) == 8 for label in summary['levels']['huc8']['zones'])
+        cell = next(iter(summary['levels']['grid']['zones'].values()))
+        assert cell['bounds'][2] - cell['bounds'][0] == 0.5
+
+
+class TestConditionalRequests:
+    def test_unchanged_query_data_returns_304(self, client, monkeypatch):
+        # Without the cache every request fetches anew, so its data is never unchanged
+        monkeypatch.setattr(water_quality.get_settings(), 'cache_enabled', True)
+        first = query(client, characteristic_name=['Conditional'])
+        etag = first.headers['ETag']
+        assert first.headers['Cache-Control'].startswith('private, max-age=')
+        assert first.headers['Last-Modified']
+
+        repeated = query(client, characteristic_name=['Conditional'])
+        assert repeated.headers['ETag'] == etag
+        not_modified = client.post('/water-quality/query', json={
+            'query': {'state_cd': ['CA'], 'characteristic_name': ['Conditional']}, 'config': {}
+        }, headers={'If-None-Match': etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b''
+
+        other_config = query(client, {'report_type': 'trend'}, characteristic_name=['Conditional'])
+        assert other_config.headers['ETag'] != etag
+
+    def test_static_endpoints(self, client):
+        response = client.get('/water-quality/parameters')
+        etag = response.headers['ETag']
+        assert client.get('/water-quality/parameters', headers={'If-None-Match': etag}).status_code == 304
+        assert client.get('/water-quality/example-queries').headers['ETag'] != etag
+
+    def test_catalog_sites(self, client):
+        params = {'state_cd': 'NV'}
+        response = client.get('/water-quality/sites', params=params)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        assert etag.startswith('W/')
+        assert client.get('/water-quality/sites', params=params, headers={'If-None-Match': etag}).status_code == 304
+        assert client.get(
+            '/water-quality/sites', params=params, headers={'If-Modified-Since': last_modified}
+        ).status_code == 304
+        assert client.get('/water-quality/sites', params={**params, 'huc': '18'}).headers['ETag'] != etag
+
+
+class TestEarlyTermination:
+    def test_limited_reads_stop_at_max_records(self, upstream, monkeypatch):
+        monkeypatch.setattr(water_quality.get_settings(), 'fetch_chunk_size', 1)
+        df, metadata = water_quality._load_limited({'statecode': ['US:06']}, 2)
+        assert len(df) == 2
+        assert metadata['rows_read'] == 2
+        assert metadata['truncated']
+
+    def test_sampled_summary_is_marked_estimated(self, client):
+        response = query(client, {'report_type': 'summary', 'sample_size': 100})
+        assert response.status_code == 200
+        sampling = response.json()['data_summary']['sampling']
+        assert sampling['sample_rows'] == 100
+        assert sampling['population_rows'] == STANDIN_ROWS
+        assert sampling['estimated']
+
+
+class TestStreamedReports:
+    def test_csv(self, client):
+        response = query(client, {'report_type': 'detailed', 'format': 'csv'})
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/csv')
+        assert response.headers['X-Records-Processed'] == str(STANDIN_ROWS)
+        assert 'water-quality.csv' in response.headers['Content-Disposition']
+        assert len(response.text.strip().splitlines()) == STANDIN_ROWS + 1
+
+    def test_ndjson_honours_the_detail_limit(self, client):
+        response = query(client, {'report_type': 'detailed', 'format': 'ndjson', 'detail_limit': 25})
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 25
+        assert {'MonitoringLocationIdentifier', 'ResultMeasureValue'} <= set(rows[0])
+
+    def test_arrow_is_not_gzipped(self, client):
+        response = client.post('/water-quality/query', json={
+            'query': {'state_cd': ['CA']}, 'config': {'report_type': 'detailed', 'format': 'arrow'}
+        }, headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/vnd.apache.arrow.stream'
+        assert 'content-encoding' not in response.headers
+        reader = pa.ipc.open_stream(response.content)
+        assert json.loads(reader.schema.metadata[b'query_info'])['statecode']
+        assert reader.read_all().num_rows == STANDIN_ROWS
+
+    def test_parquet(self, client):
+        response = query(client, {'report_type': 'detailed', 'format': 'parquet', 'detail_limit': 10})
+        assert response.status_code == 200
+        assert 'water-quality.parquet' in response.headers['Content-Disposition']
+        table = pq.read_table(pa.BufferReader(response.content))
+        assert table.num_rows == 10
+        assert json.loads(table.schema.metadata[b'report_type']) == 'detailed'
+
+    def test_stream_formats_are_only_for_detailed_reports(self, client):
+        assert query(client, {'report_type': 'summary', 'format': 'csv'}).status_code == 400
+
+
+class TestLimitedShards:
+    def test_short_shards_are_topped_up_from_the_others(self, upstream):
+        rows_by_county = {'US:06:001': 2, 'US:06:003': 10, 'US:06:005': 10}
+        upstream.responses['/data/Result/search'] = county_results(rows_by_county)
+        shards = [{'statecode': ['CA'], 'countycode': [county]} for county in rows_by_county]
+
+        df, metadata = asyncio.run(water_quality._load_limited_shards(shards, 12))
+        assert len(df) == 12
+        assert metadata['passes'] == 2
+        assert metadata['shard_rows'] == [2, 5, 5]
+        assert metadata['truncated']
+
+    def test_all_rows_when_shards_run_out(self, upstream):
+        rows_by_county = {'US:06:001': 2, 'US:06:003': 3}
+        upstream.responses['/data/Result/search'] = county_results(rows_by_county)
+        shards = [{'statecode': ['CA'], 'countycode': [county]} for county in rows_by_county]
+
+        df, metadata = asyncio.run(water_quality._load_limited_shards(shards, 100))
+        assert len(df) == 5
+        assert metadata['passes'] == 1
+        assert not metadata['truncated']
+
+
+class TestBatch:
+    def test_overlapping_queries_share_one_fetch(self, client):
+        queries = [
+            {'id': 'ph', 'query': {'state_cd': ['CA'], 'characteristic_name': ['pH']}},
+            {'id': 'temperature', 'query': {'state_cd': ['CA'], 'characteristic_name': ['Temperature, water']}},
+        ]
+        response = client.post('/water-quality/batch', json={'queries': queries})
+        assert response.status_code == 200
+        assert response.headers['X-Batch-Fetches'] == '1'
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[-1]['summary']['succeeded'] == 2
+        assert sorted(line['id'] for line in lines[:-1]) == ['ph', 'temperature']
+
+
+class TestJobs:
+    def test_submitted_report_can_be_fetched(self, client):
+        body = {'query': {'state_cd': ['CA']}, 'config': {'report_type': 'summary'}}
+        job = client.post('/water-quality/jobs', json=body).json()
+        assert client.post('/water-quality/jobs', json=body).json()['job_id'] == job['job_id']
+
+        deadline = time.monotonic() + 30
+        while job['status'] not in ('succeeded', 'failed'):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+            job = client.get(f"/water-quality/jobs/{job['job_id']}").json()
+        assert job['status'] == 'succeeded'
+
+        result = client.get(job['result_url'], headers={'Accept-Encoding': 'identity'})
+        assert result.json()['records_processed'] == STANDIN_ROWS
+        raw = client.get(job['result_url'], headers={'Accept-Encoding': 'gzip'})
+        assert raw.headers['Content-Encoding'] == 'gzip'
+
+        assert client.delete(f"/water-quality/jobs/{job['job_id']}").status_code == 200
+        assert client.get(f"/water-quality/jobs/{job['job_id']}").status_code == 404
@@ -0,0 +1,95 @@
+"""
+Shared fixtures
+
+The API tests run against benchmarks.standin, served from a thread of the
+test process. Settings are read once per process, so the app's upstream
+URLs are pointed at the stand-in before anything imports them.
+"""
+import os
+import socket
+import threading
+
+import pytest
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+STANDIN_PORT = _free_port()
+STANDIN_URL = f"http://127.0.0.1:{STANDIN_PORT}"
+STANDIN_ROWS = 2_000
+
+os.environ.update({
+    'USGS_BASE_URL': STANDIN_URL,
+    'NWIS_BASE_URL': f"{STANDIN_URL}/nwis",
+    'CACHE_ENABLED': 'false',
+    'SITE_CATALOG_STATES': '[]',
+    'RESULT_STORE_ENABLED': 'false',
+})
+
+
+@pytest.fixture(scope='session')
+def wqp_frame():
+    """Cleaned synthetic WQP results"""
+    from app.core.data_processor import ALL_REPORT_COLUMNS, DataProcessor
+    from benchmarks.synthetic import generate_wqp_results
+
+    return DataProcessor.clean_and_validate_data(generate_wqp_results(20_000, seed=1), columns=ALL_REPORT_COLUMNS)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    A RecordingServer answering for WQP and NWIS, reached without the pooled client
+
+    Tests may replace its responses.
+    """
+    from app.config import get_settings
+    from app.core.upstream import get_upstream_client
+    from tests.fixtures.mock_responses import NWIS_RDB, WQP_CSV, RecordingServer
+
+    responses = {
+        '/data/Result/search': (200, 'text/csv', WQP_CSV.encode()),
+        '/nwis/site/': (200, 'text/plain', NWIS_RDB.encode()),
+    }
+    with RecordingServer(responses) as server:
+        settings = get_settings()
+        monkeypatch.setattr(settings, 'usgs_base_url', server.url)
+        monkeypatch.setattr(settings, 'nwis_base_url', f"{server.url}/nwis")
+        # The API tests may have started the pooled client in this process
+        monkeypatch.setattr(get_upstream_client(), '_client', None)
+        yield server
+
+
+@pytest.fixture(scope='session')
+def standin():
+    """Base URL of a WQP/NWIS stand-in serving STANDIN_ROWS rows per result response"""
+    from benchmarks.standin import StandInConfig, make_server
+
+    config = StandInConfig(rows=STANDIN_ROWS, sites=200, block_rows=STANDIN_ROWS, distinct_blocks=1)
+    server = make_server('127.0.0.1', STANDIN_PORT, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield STANDIN_URL
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='session')
+def client(standin):
+    """TestClient of the app once its startup warm-up has added the query routes"""
+    import time
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        deadline = time.monotonic() + 60
+        while test_client.get('/ready').status_code != 200:
+            assert time.monotonic() < deadline, 'app did not become ready'
+            time.sleep(0.1)
+        yield test_client
@@ -0,0 +1,106 @@
+"""
+Tests for batch query merging and fan-out
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.batch import BatchPlanner, RowIndex
+from app.core.query_planner import QueryPlanner
+
+
+class TestBatchPlanner:
+    def test_overlapping_and_touching_date_ranges_share_a_fetch(self):
+        queries = [
+            {'statecode': ['US:06'], 'siteid': ['A'], 'startDateLo': '01-01-2020', 'startDateHi': '06-30-2020'},
+            {'statecode': ['US:06'], 'siteid': ['B', 'A'], 'startDateLo': '07-01-2020', 'startDateHi': '12-31-2020'},
+            {'statecode': ['US:06'], 'siteid': ['C'], 'startDateLo': '03-01-2020', 'startDateHi': '04-30-2020'},
+        ]
+        fetches = BatchPlanner.plan(queries)
+        assert len(fetches) == 1
+        assert fetches[0].members == [0, 1, 2]
+        assert fetches[0].params == {
+            'statecode': ['US:06'], 'siteid': ['A', 'B', 'C'],
+            'startDateLo': '01-01-2020', 'startDateHi': '12-31-2020'
+        }
+
+    def test_disjoint_date_ranges_are_fetched_separately(self):
+        queries = [
+            {'statecode': ['US:06'], 'startDateLo': '01-01-2020', 'startDateHi': '01-31-2020'},
+            {'statecode': ['US:06'], 'startDateLo': '03-01-2020', 'startDateHi': '03-31-2020'},
+        ]
+        assert [fetch.members for fetch in BatchPlanner.plan(queries)] == [[0], [1]]
+
+    def test_other_parameters_must_match(self):
+        queries = [
+            {'statecode': ['US:06'], 'characteristicName': ['pH']},
+            {'statecode': ['US:41'], 'characteristicName': ['pH']},
+            {'statecode': ['US:06'], 'characteristicName': ['Temperature']},
+        ]
+        fetches = BatchPlanner.plan(queries)
+        assert sorted(fetch.members for fetch in fetches) == [[0, 2], [1]]
+        merged = next(fetch for fetch in fetches if fetch.members == [0, 2])
+        assert merged.params['characteristicName'] == ['Temperature', 'pH']
+
+    def test_a_query_without_a_filter_widens_the_fetch_to_all_values(self):
+        queries = [
+            {'statecode': ['US:06'], 'siteid': ['A'], 'characteristicName': ['pH']},
+            {'statecode': ['US:06'], 'characteristicName': ['pH']},
+            {'statecode': ['US:06'], 'siteid': ['B'], 'startDateLo': '01-01-2020'},
+        ]
+        fetches = BatchPlanner.plan(queries)
+        assert len(fetches) == 1
+        assert 'siteid' not in fetches[0].params
+        assert 'characteristicName' not in fetches[0].params
+        assert 'startDateLo' not in fetches[0].params
+
+
+def naive_subset(df: pd.DataFrame, params) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    if params.get('siteid') is not None:
+        mask &= df['MonitoringLocationIdentifier'].isin(params['siteid'])
+    if params.get('characteristicName'):
+        mask &= df['CharacteristicName'].isin(params['characteristicName'])
+    if params.get('startDateLo'):
+        mask &= df['ActivityStartDate'] >= pd.Timestamp(QueryPlanner._parse_date(params['startDateLo']))
+    if params.get('startDateHi'):
+        mask &= df['ActivityStartDate'] <= pd.Timestamp(QueryPlanner._parse_date(params['startDateHi']))
+    return df[mask]
+
+
+class TestRowIndex:
+    def test_subsets_match_boolean_masks(self, wqp_frame):
+        index = RowIndex(wqp_frame)
+        sites = list(wqp_frame['MonitoringLocationIdentifier'].cat.categories)
+        characteristics = list(wqp_frame['CharacteristicName'].dropna().unique())
+        rng = np.random.default_rng(0)
+        for _ in range(25):
+            params = {}
+            if rng.random() < 0.8:
+                params['siteid'] = list(rng.choice(sites, size=rng.integers(1, 4), replace=False))
+            if rng.random() < 0.5:
+                params['characteristicName'] = list(rng.choice(characteristics, size=2, replace=False))
+            if rng.random() < 0.5:
+                year = int(rng.integers(2000, 2020))
+                params['startDateLo'] = f"01-01-{year}"
+                params['startDateHi'] = f"12-31-{year + 2}"
+            pd.testing.assert_frame_equal(index.subset(params), naive_subset(wqp_frame, params))
+
+    def test_unknown_sites_select_nothing(self, wqp_frame):
+        index = RowIndex(wqp_frame)
+        assert index.subset({'siteid': ['USGS-NOT-A-SITE']}).empty
+        assert len(index.positions(None)) == len(wqp_frame)
+
+    def test_rows_without_a_site_belong_to_no_slice(self):
+        df = pd.DataFrame({
+            'MonitoringLocationIdentifier': pd.Categorical(['B', None, 'A', 'B']),
+            'ResultMeasureValue': [1.0, 2.0, 3.0, 4.0]
+        })
+        index = RowIndex(df)
+        assert index.positions(['B']).tolist() == [0, 3]
+        assert index.positions(['A', 'B', 'A']).tolist() == [0, 2, 3]
+
+    @pytest.mark.parametrize('sites', [['A'], []])
+    def test_empty_frames(self, sites):
+        df = pd.DataFrame({'MonitoringLocationIdentifier': pd.Categorical([])})
+        assert RowIndex(df).subset({'siteid': sites}).empty
@@ -0,0 +1,184 @@
+"""
+Tests for the query result cache
+"""
+import asyncio
+import pickle
+import time
+
+import pandas as pd
+import pytest
+
+from app.core.cache import QueryCache, deserialize_result, make_cache_key, serialize_result
+
+
+def make_cache(**kwargs) -> QueryCache:
+    return QueryCache(**{'ttl': 60, 'max_entries': 10, 'max_bytes': 2**24, **kwargs})
+
+
+def frame_result(value: int = 1):
+    return pd.DataFrame({'ResultMeasureValue': [value, value + 1]}), {'source': 'test'}
+
+
+class TestMakeCacheKey:
+    def test_list_order_whitespace_and_duplicates_are_ignored(self):
+        assert make_cache_key({'statecode': ['US:06', 'US:41']}) == make_cache_key(
+            {'statecode': [' US:41', 'US:06', 'US:06']}
+        )
+
+    def test_empty_values_are_dropped(self):
+        assert make_cache_key({'statecode': ['US:06']}) == make_cache_key(
+            {'statecode': ['US:06'], 'huc': [], 'siteid': None, 'organization': ''}
+        )
+
+    def test_dates_are_normalized(self):
+        assert make_cache_key({'startDateLo': '1-2-2020'}) == make_cache_key({'startDateLo': '01-02-2020'})
+        assert make_cache_key({'startDateLo': '01-02-2020'}) != make_cache_key({'startDateLo': '01-03-2020'})
+
+    def test_variants_are_distinct(self):
+        params = {'statecode': ['US:06']}
+        keys = {make_cache_key(params), make_cache_key(params, 'limit=10'), make_cache_key(params, 'sample=10')}
+        assert len(keys) == 3
+
+    def test_different_queries_differ(self):
+        assert make_cache_key({'statecode': ['US:06']}) != make_cache_key({'statecode': ['US:41']})
+
+
+class TestSerialization:
+    def test_round_trip_keeps_dtypes_index_and_metadata(self, wqp_frame):
+        df = wqp_frame.iloc[::7]
+        metadata = {'fetched_at': '2024-05-01T12:00:00', 'shards': 3, 'memory_usage': {'typed': 1024}}
+        restored, restored_metadata = deserialize_result(serialize_result(df, metadata))
+        pd.testing.assert_series_equal(restored.dtypes, df.dtypes)
+        pd.testing.assert_index_equal(restored.index, df.index)
+        pd.testing.assert_frame_equal(restored, df)
+        assert restored_metadata == metadata
+
+    def test_missing_metadata(self):
+        df, metadata = deserialize_result(serialize_result(pd.DataFrame({'ResultMeasureValue': [1.0]}), None))
+        assert metadata is None
+        assert df['ResultMeasureValue'].tolist() == [1.0]
+
+    def test_blobs_are_not_unpickled(self):
+        class Payload:
+            def __reduce__(self):
+                return (exec, ("raise SystemExit('unpickled')",))
+
+        with pytest.raises(Exception) as error:
+            deserialize_result(pickle.dumps(Payload()))
+        assert not isinstance(error.value, SystemExit)
+
+
+class TestGetOrLoad:
+    def test_concurrent_callers_share_one_load(self):
+        cache = make_cache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return frame_result()
+
+        async def run():
+            return await asyncio.gather(*[cache.get_or_load({'statecode': ['US:06']}, loader) for _ in range(5)])
+
+        results = asyncio.run(run())
+        assert calls == 1
+        assert cache.coalesced == 4
+        # Every caller gets its own copy
+        results[0][0].loc[0, 'ResultMeasureValue'] = -1
+        assert results[1][0].loc[0, 'ResultMeasureValue'] == 1
+
+    def test_repeat_call_is_a_hit(self):
+        cache = make_cache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            return frame_result()
+
+        async def run():
+            await cache.get_or_load({'statecode': ['US:06']}, loader)
+            return await cache.get_or_load({'statecode': ['US:06']}, loader)
+
+        df, metadata = asyncio.run(run())
+        assert calls == 1
+        assert cache.hits == 1
+        assert metadata == {'source': 'test'}
+        assert df['ResultMeasureValue'].tolist() == [1, 2]
+
+    def test_waiter_takes_over_a_cancelled_load(self):
+        cache = make_cache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            return frame_result(calls)
+
+        async def run():
+            leader = asyncio.ensure_future(cache.get_or_load({'statecode': ['US:06']}, loader))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(cache.get_or_load({'statecode': ['US:06']}, loader))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower, leader
+
+        (df, _), leader = asyncio.run(run())
+        assert leader.cancelled()
+        assert calls == 2
+        assert df['ResultMeasureValue'].tolist() == [2, 3]
+
+    def test_errors_reach_waiters_and_are_not_cached(self):
+        cache = make_cache()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            raise RuntimeError('upstream down')
+
+        async def run():
+            return await asyncio.gather(
+                *[cache.get_or_load({'statecode': ['US:06']}, failing) for _ in range(3)],
+                return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        assert calls == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def loader():
+            return frame_result()
+
+        df, _ = asyncio.run(cache.get_or_load({'statecode': ['US:06']}, loader))
+        assert len(df) == 2
+
+
+class TestStale:
+    def test_expired_entries_are_served_stale_within_stale_ttl(self):
+        cache = make_cache(ttl=0, stale_ttl=60)
+
+        async def loader():
+            return frame_result()
+
+        asyncio.run(cache.get_or_load({'statecode': ['US:06']}, loader))
+        time.sleep(0.01)
+        assert asyncio.run(cache.get({'statecode': ['US:06']})) is None
+        (df, _), age = cache.get_stale({'statecode': ['US:06']})
+        assert len(df) == 2
+        assert age >= 0
+        assert cache.get_stale({'statecode': ['US:41']}) is None
+
+    def test_entries_past_stale_ttl_are_dropped(self):
+        cache = make_cache(ttl=0, stale_ttl=0)
+
+        async def loader():
+            return frame_result()
+
+        asyncio.run(cache.get_or_load({'statecode': ['US:06']}, loader))
+        time.sleep(0.01)
+        assert cache.get_stale({'statecode': ['US:06']}) is None
@@ -0,0 +1,89 @@
+"""
+Tests for the gzip middleware
+"""
+import asyncio
+import gzip
+import zlib
+
+import pytest
+
+from app.core.compression import GZipMiddleware
+
+
+def make_app(chunks, content_type='application/json', headers=()):
+    async def app(scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', content_type.encode()), *headers]
+        })
+        for i, chunk in enumerate(chunks):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1})
+    return app
+
+
+def run(app, accept_encoding='gzip, deflate', **kwargs):
+    """Messages the middleware sends for one GET request"""
+    middleware = GZipMiddleware(app, minimum_size=100, **kwargs)
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return messages
+
+
+def response_headers(messages):
+    return {name.decode().lower(): value.decode() for name, value in messages[0]['headers']}
+
+
+def body(messages):
+    return b''.join(message['body'] for message in messages[1:])
+
+
+class TestGZip:
+    def test_whole_bodies_are_compressed_with_a_length(self):
+        content = b'{"value": 1}' * 100
+        messages = run(make_app([content], headers=[(b'content-length', str(len(content)).encode())]))
+        headers = response_headers(messages)
+        assert headers['content-encoding'] == 'gzip'
+        assert headers['vary'] == 'Accept-Encoding'
+        assert int(headers['content-length']) == len(body(messages))
+        assert gzip.decompress(body(messages)) == content
+
+    def test_each_streamed_chunk_is_flushed(self):
+        lines = [b'{"index": %d, "report": "%s"}\n' % (i, b'x' * 200) for i in range(5)]
+        messages = run(make_app(lines))
+        headers = response_headers(messages)
+        assert headers['content-encoding'] == 'gzip'
+        assert 'content-length' not in headers
+
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        for line, message in zip(lines, messages[1:]):
+            # Every line decodes as soon as it is sent
+            assert decompressor.decompress(message['body']) == line
+        assert messages[-1]['more_body'] is False
+        assert decompressor.eof
+
+    @pytest.mark.parametrize('chunks, content_type, headers', [
+        ([b'small'], 'application/json', []),
+        ([b'x' * 1000], 'application/vnd.apache.parquet', []),
+        ([b'x' * 1000, b'y' * 1000], 'application/vnd.apache.arrow.stream', []),
+        ([b'x' * 1000], 'application/json', [(b'content-encoding', b'br')]),
+        ([b'data: x\n\n' * 100], 'text/event-stream', []),
+    ])
+    def test_passes_through(self, chunks, content_type, headers):
+        excluded = ('application/vnd.apache.arrow', 'application/vnd.apache.parquet')
+        messages = run(make_app(chunks, content_type, headers), excluded_media_types=excluded)
+        assert response_headers(messages).get('content-encoding') != 'gzip'
+        assert body(messages) == b''.join(chunks)
+
+    def test_clients_without_gzip_get_identity(self):
+        messages = run(make_app([b'x' * 1000]), accept_encoding='identity')
+        assert 'content-encoding' not in response_headers(messages)
+        assert body(messages) == b'x' * 1000
@@ -0,0 +1,68 @@
+"""
+Tests for ETag, Last-Modified and Cache-Control validators
+"""
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.conditional import Validators, cache_control
+
+MODIFIED = datetime(2024, 5, 1, 12, 30, 15, 500_000, tzinfo=timezone.utc)
+
+
+def request(**headers):
+    return SimpleNamespace(headers={name.replace('_', '-'): value for name, value in headers.items()})
+
+
+def http_date(moment):
+    return format_datetime(moment, usegmt=True)
+
+
+class TestValidators:
+    def test_content_etags_are_strong_and_input_etags_weak(self):
+        assert Validators.for_content(b'{}').etag == Validators.for_content(b'{}').etag
+        assert Validators.for_content(b'{}').etag != Validators.for_content(b'[]').etag
+        assert not Validators.for_content(b'{}').etag.startswith('W/')
+        assert Validators.for_inputs('query', 1).etag.startswith('W/"')
+        assert Validators.for_inputs('query', 1).etag != Validators.for_inputs('query', 2).etag
+
+    @pytest.mark.parametrize('if_none_match, matched', [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"other", "abc"', True),
+        ('*', True),
+        ('"other"', False),
+    ])
+    def test_if_none_match_compares_weakly(self, if_none_match, matched):
+        validators = Validators('W/"abc"')
+        assert validators.matches(request(if_none_match=if_none_match)) is matched
+
+    @pytest.mark.parametrize('since, matched', [
+        (MODIFIED, True),
+        (MODIFIED + timedelta(days=1), True),
+        (MODIFIED - timedelta(seconds=1), False),
+    ])
+    def test_if_modified_since_ignores_subsecond_precision(self, since, matched):
+        validators = Validators('"abc"', last_modified=MODIFIED)
+        assert validators.matches(request(if_modified_since=http_date(since))) is matched
+
+    def test_if_none_match_takes_precedence(self):
+        validators = Validators('"abc"', last_modified=MODIFIED)
+        assert not validators.matches(request(if_none_match='"other"', if_modified_since=http_date(MODIFIED)))
+        assert not validators.matches(request(if_modified_since='not a date'))
+        assert not validators.matches(request())
+
+    def test_not_modified_repeats_the_headers(self):
+        validators = Validators('"abc"', last_modified=MODIFIED, cache_control=cache_control(60))
+        response = validators.not_modified()
+        assert response.status_code == 304
+        assert response.headers['ETag'] == '"abc"'
+        assert response.headers['Last-Modified'] == 'Wed, 01 May 2024 12:30:15 GMT'
+        assert response.headers['Cache-Control'] == 'public, max-age=60'
+
+
+def test_cache_control():
+    assert cache_control(0) == 'no-cache'
+    assert cache_control(30, public=False) == 'private, max-age=30'
@@ -0,0 +1,128 @@
+"""
+Tests for USGS data fetching
+"""
+import asyncio
+import io
+from datetime import date
+
+import pandas as pd
+import pytest
+import requests
+
+from app.config import get_settings
+from app.core.data_fetcher import USGSDataFetcher
+from app.core.governor import UpstreamError
+from app.core.upstream import UpstreamClient, upstream_headers
+from tests.fixtures.mock_responses import WQP_CSV, WQP_ROWS
+
+
+def test_build_wqp_query_params():
+    params = USGSDataFetcher.build_wqp_query_params(
+        state_cd=['CA'], bbox=[-122.5, 37.0, -121.0, 38.5], characteristic_name=['pH'],
+        start_date=date(2020, 1, 2), end_date=date(2021, 12, 31), sample_media=['Water']
+    )
+    assert params == {
+        'statecode': ['CA'],
+        'bbox': '-122.5,37.0,-121.0,38.5',
+        'characteristicName': ['pH'],
+        'startDateLo': '01-02-2020',
+        'startDateHi': '12-31-2021',
+        'sampleMedia': ['Water']
+    }
+
+
+class TestWaterQuality:
+    def test_fallback_reads_every_chunk(self, upstream):
+        df, stream_info = USGSDataFetcher.fetch_water_quality_data(
+            {'statecode': ['US:06'], 'characteristicName': ['pH', 'Temperature']}
+        )
+        assert len(df) == WQP_ROWS
+        assert df.loc[1, 'ResultCommentText'] == 'field note,\nsecond line'
+        assert stream_info['url'].startswith(upstream.url)
+
+        path, params, _ = upstream.requests[0]
+        assert path == '/data/Result/search'
+        assert params['statecode'] == ['US:06']
+        assert params['characteristicName'] == ['pH;Temperature']
+        assert params['mimeType'] == ['csv']
+
+    def test_chunks_stop_when_the_caller_does(self, upstream):
+        chunks = USGSDataFetcher.iter_water_quality_chunks({'statecode': ['US:06']}, 2)
+        first = next(chunks)
+        chunks.close()
+        assert len(first) == 2
+
+    def test_bad_requests_raise_value_error(self, upstream):
+        upstream.responses['/data/Result/search'] = (400, 'text/plain', b'')
+        with pytest.raises(ValueError):
+            USGSDataFetcher.fetch_water_quality_data({'statecode': ['US:06']})
+
+    def test_server_errors_count_against_the_governor(self, upstream):
+        upstream.responses['/data/Result/search'] = (503, 'text/plain', b'')
+        with pytest.raises(UpstreamError) as error:
+            USGSDataFetcher.fetch_water_quality_data({'statecode': ['US:06']})
+        assert isinstance(error.value.__cause__, requests.HTTPError)
+
+
+class TestSiteInfo:
+    def test_fallback_parses_rdb(self, upstream):
+        sites = USGSDataFetcher.fetch_site_info(['CA'], ['Stream', 'Lake'], has_data_since=date(2020, 1, 1))
+        assert sites['site_no'].tolist() == ['11000001', '11000002']
+        assert sites['dec_lat_va'].dtype == float
+
+        path, params, _ = upstream.requests[0]
+        assert path == '/nwis/site/'
+        assert params['siteType'] == ['ST,LK']
+        assert params['startDt'] == ['2020-01-01']
+        assert params['format'] == ['rdb']
+
+    def test_no_matching_sites(self, upstream):
+        del upstream.responses['/nwis/site/']
+        assert USGSDataFetcher.fetch_site_info(['CA'], ['Stream']).empty
+
+
+def test_parse_rdb_without_rows():
+    assert USGSDataFetcher.parse_rdb('# nothing here\n').empty
+
+
+class TestUserAgent:
+    def test_names_this_app(self):
+        user_agent = upstream_headers()['User-Agent']
+        assert user_agent == f"usgs-water-quality-api/{get_settings().version}"
+
+    def test_both_clients_send_it(self, upstream):
+        USGSDataFetcher.fetch_water_quality_data({'statecode': ['US:06']})
+
+        async def pooled():
+            client = UpstreamClient(timeout=5, max_connections=2, max_connections_per_host=2, http2=False)
+            await client.start()
+            try:
+                await client.get_text(f"{upstream.url}/nwis/site/", {})
+            finally:
+                await client.close()
+
+        asyncio.run(pooled())
+        user_agents = [headers['User-Agent'] for _, _, headers in upstream.requests]
+        assert user_agents == [upstream_headers()['User-Agent']] * 2
+
+
+class TestCsvBlocks:
+    @staticmethod
+    def blocks(url, block_rows):
+        async def collect():
+            client = UpstreamClient(timeout=5, max_connections=2, max_connections_per_host=2, http2=False)
+            await client.start()
+            try:
+                return [block async for block in client.stream_csv_blocks(url, {}, block_rows)]
+            finally:
+                await client.close()
+        return asyncio.run(collect())
+
+    @pytest.mark.parametrize('block_rows', [1, 2, 100])
+    def test_blocks_split_at_row_boundaries(self, upstream, block_rows):
+        blocks = self.blocks(f"{upstream.url}/data/Result/search", block_rows)
+        frames = [pd.read_csv(io.BytesIO(block)) for block in blocks]
+        assert all(list(frame.columns) == list(frames[0].columns) for frame in frames)
+        pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), pd.read_csv(io.StringIO(WQP_CSV)))
+        if block_rows == 100:
+            assert len(blocks) == 1
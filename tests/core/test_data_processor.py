@@ -0,0 +1,133 @@
+"""
+Tests for cleaning, projection and compact dtypes
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.data_processor import (
+    ALL_REPORT_COLUMNS, CATEGORY_COLUMNS, ESSENTIAL_COLUMNS, KEY_COLUMNS, DataProcessor
+)
+from benchmarks.synthetic import generate_wqp_results
+
+
+@pytest.fixture(scope='module')
+def raw_frame():
+    return generate_wqp_results(2_000, seed=3)
+
+
+class TestColumns:
+    def test_report_columns_include_the_essentials_and_keys_once(self):
+        columns = DataProcessor.columns_for_reports(['detailed', 'trend'])
+        assert columns[:len(ESSENTIAL_COLUMNS) + len(KEY_COLUMNS)] == ESSENTIAL_COLUMNS + KEY_COLUMNS
+        assert len(columns) == len(set(columns))
+        assert 'ResultCommentText' in columns
+
+    def test_summary_needs_no_measurements(self):
+        assert 'ResultMeasureValue' not in DataProcessor.columns_for_reports(['summary'])
+
+
+class TestCleanAndValidate:
+    def test_projection_keeps_only_requested_columns(self, raw_frame):
+        columns = DataProcessor.columns_for_reports(['trend'])
+        df = DataProcessor.clean_and_validate_data(raw_frame, columns=columns)
+        # Columns WQP did not return (ResultIdentifier here) are skipped
+        assert list(df.columns) == [col for col in columns if col != 'ResultIdentifier']
+        assert 'ResultMeasureUnitCode' in df.columns
+
+    def test_without_projection_every_column_is_kept(self, raw_frame):
+        df = DataProcessor.clean_and_validate_data(raw_frame)
+        assert len(df.columns) == len(raw_frame.columns)
+        assert 'ResultMeasureUnitCode' in df.columns
+        assert 'ResultMeasure/MeasureUnitCode' not in df.columns
+
+    def test_dtypes(self, raw_frame):
+        df = DataProcessor.clean_and_validate_data(raw_frame)
+        for col in CATEGORY_COLUMNS:
+            assert isinstance(df[col].dtype, pd.CategoricalDtype), col
+        assert df['ResultMeasureValue'].dtype == 'float64'
+        assert df['DetectionQuantitationLimitMeasureValue'].dtype == 'float32'
+        assert pd.api.types.is_datetime64_any_dtype(df['ActivityStartDate'])
+
+    def test_values_are_unchanged_by_compaction(self, raw_frame):
+        df = DataProcessor.clean_and_validate_data(raw_frame, columns=ALL_REPORT_COLUMNS)
+        kept = raw_frame.loc[df.index]
+        assert df['MonitoringLocationIdentifier'].astype(str).tolist() == kept['MonitoringLocationIdentifier'].tolist()
+        expected = pd.to_numeric(kept['ResultMeasureValue'], errors='coerce')
+        pd.testing.assert_series_equal(df['ResultMeasureValue'], expected, check_names=False)
+
+    def test_rows_missing_essential_data_are_dropped(self):
+        df = pd.DataFrame({
+            'OrganizationIdentifier': ['USGS', 'USGS', None],
+            'MonitoringLocationIdentifier': ['A', None, 'C'],
+            'ActivityStartDate': ['2020-01-01', '2020-01-02', '2020-01-03'],
+            'CharacteristicName': ['pH', 'pH', 'pH'],
+            'ResultMeasureValue': ['7.1', 'not a number', '7.3']
+        })
+        cleaned = DataProcessor.clean_and_validate_data(df)
+        assert cleaned['MonitoringLocationIdentifier'].tolist() == ['A']
+        assert cleaned['ResultMeasureValue'].tolist() == [7.1]
+
+    def test_memory_report_shrinks_at_each_stage(self, raw_frame):
+        report = {}
+        DataProcessor.clean_and_validate_data(raw_frame, columns=ALL_REPORT_COLUMNS, memory_report=report)
+        assert list(report) == ['raw', 'projected', 'filtered', 'typed']
+        assert report['raw'] > report['projected'] >= report['filtered'] > report['typed']
+
+    def test_empty_frame(self):
+        assert DataProcessor.clean_and_validate_data(pd.DataFrame()).empty
+
+
+def chunked(df, size, pulled):
+    """Chunks of df, counting in pulled how many were taken"""
+    for start in range(0, len(df), size):
+        pulled.append(start)
+        yield df.iloc[start:start + size]
+
+
+class TestCollectLimited:
+    def test_stops_pulling_once_the_limit_is_reached(self, raw_frame):
+        pulled = []
+        df, rows_read = DataProcessor.collect_limited(chunked(raw_frame, 100, pulled), 250, ALL_REPORT_COLUMNS)
+        assert len(df) == 250
+        assert len(pulled) == rows_read // 100 < len(raw_frame) // 100
+        expected = DataProcessor.clean_and_validate_data(raw_frame.iloc[:rows_read], columns=ALL_REPORT_COLUMNS)
+        assert df['ActivityIdentifier'].tolist() == expected['ActivityIdentifier'].head(250).tolist()
+        assert isinstance(df['CharacteristicName'].dtype, pd.CategoricalDtype)
+
+    def test_without_a_limit_every_chunk_is_read(self, raw_frame):
+        pulled = []
+        df, rows_read = DataProcessor.collect_limited(chunked(raw_frame, 300, pulled), None, ALL_REPORT_COLUMNS)
+        assert rows_read == len(raw_frame)
+        assert len(df) == len(DataProcessor.clean_and_validate_data(raw_frame, columns=ALL_REPORT_COLUMNS))
+
+    def test_no_chunks(self):
+        df, rows_read = DataProcessor.collect_limited(iter([]), 10)
+        assert df.empty and rows_read == 0
+
+
+class TestCollectSample:
+    def test_sample_is_drawn_from_every_chunk(self, raw_frame):
+        cleaned = DataProcessor.clean_and_validate_data(raw_frame, columns=ALL_REPORT_COLUMNS)
+        sample, population = DataProcessor.collect_sample(
+            chunked(raw_frame, 200, []), 300, ALL_REPORT_COLUMNS, seed=0
+        )
+        assert population == len(cleaned)
+        assert len(sample) == 300
+        assert '_sample_key' not in sample.columns
+        assert sample['ActivityIdentifier'].is_unique
+        assert set(sample['ActivityIdentifier']) <= set(cleaned['ActivityIdentifier'])
+        # Rows from the first and second half are both represented
+        positions = cleaned['ActivityIdentifier'].reset_index(drop=True)
+        drawn = positions[positions.isin(sample['ActivityIdentifier'])].index
+        assert 0.35 < np.mean(drawn < len(cleaned) / 2) < 0.65
+
+    def test_same_seed_same_sample(self, raw_frame):
+        first, _ = DataProcessor.collect_sample(chunked(raw_frame, 500, []), 50, seed=7)
+        second, _ = DataProcessor.collect_sample(chunked(raw_frame, 500, []), 50, seed=7)
+        assert len(first) == 50
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_small_populations_are_kept_whole(self, raw_frame):
+        sample, population = DataProcessor.collect_sample(chunked(raw_frame.head(40), 15, []), 100)
+        assert len(sample) == population
@@ -0,0 +1,194 @@
+"""
+Tests for the upstream governor: circuit breaker, AIMD concurrency and rate limit
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.governor import (
+    CLOSED, HALF_OPEN, OPEN, Governor, Permit, UpstreamError, UpstreamUnavailableError,
+    find_upstream_error, is_upstream_failure
+)
+
+
+def make_governor(**kwargs) -> Governor:
+    settings = {
+        'source': 'test',
+        'rate': 0,
+        'burst': 1,
+        'min_concurrency': 1,
+        'max_concurrency': 8,
+        'target_latency': 10,
+        'failure_threshold': 3,
+        'reset_seconds': 0.05,
+        'max_wait': 0.05,
+        **kwargs
+    }
+    return Governor(**settings)
+
+
+def http_error(status: int) -> Exception:
+    error = Exception(f"HTTP {status}")
+    error.response = SimpleNamespace(status_code=status)
+    return error
+
+
+def fail(governor: Governor, error: Exception = None) -> None:
+    with pytest.raises(UpstreamError):
+        with governor.call():
+            raise error or http_error(503)
+
+
+def succeed(governor: Governor) -> None:
+    with governor.call() as permit:
+        permit.responded()
+
+
+class TestFailureClassification:
+    @pytest.mark.parametrize('status, failed', [(500, True), (503, True), (429, True), (404, False), (400, False)])
+    def test_http_statuses(self, status, failed):
+        assert is_upstream_failure(http_error(status)) is failed
+
+    def test_connection_errors_count_and_client_errors_do_not(self):
+        assert is_upstream_failure(ConnectionError('reset'))
+        assert not is_upstream_failure(ValueError('bad parameters'))
+        assert not is_upstream_failure(GeneratorExit())
+
+    def test_find_upstream_error_follows_causes(self):
+        upstream = UpstreamError('down')
+        try:
+            try:
+                raise upstream
+            except UpstreamError as exc:
+                raise RuntimeError('shard failed') from exc
+        except RuntimeError as wrapped:
+            assert find_upstream_error(wrapped) is upstream
+        assert find_upstream_error(RuntimeError('other')) is None
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        governor = make_governor(reset_seconds=60)
+        for _ in range(2):
+            fail(governor)
+        assert governor.state == CLOSED
+        fail(governor)
+        assert governor.state == OPEN
+
+        with pytest.raises(UpstreamUnavailableError) as refused:
+            governor.acquire()
+        assert refused.value.retry_after > 0
+        assert governor.rejected == 1
+
+    def test_success_resets_the_failure_count(self):
+        governor = make_governor()
+        fail(governor)
+        fail(governor)
+        succeed(governor)
+        fail(governor)
+        assert governor.state == CLOSED
+        assert governor.failures == 1
+
+    def test_half_open_admits_a_single_probe_that_closes_it(self):
+        governor = make_governor()
+        for _ in range(3):
+            fail(governor)
+        time.sleep(0.06)
+
+        probe = governor.acquire()
+        assert probe
+        assert governor.state == HALF_OPEN
+        with pytest.raises(UpstreamUnavailableError):
+            governor.acquire()
+
+        permit = Permit()
+        permit.responded()
+        governor.release(permit, failed=False, probe=probe)
+        assert governor.state == CLOSED
+        succeed(governor)
+
+    def test_failed_probe_reopens(self):
+        governor = make_governor()
+        for _ in range(3):
+            fail(governor)
+        time.sleep(0.06)
+        fail(governor)
+        assert governor.state == OPEN
+        with pytest.raises(UpstreamUnavailableError):
+            governor.acquire()
+
+    def test_client_errors_pass_through_without_counting(self):
+        governor = make_governor()
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                with governor.call():
+                    raise ValueError('bad parameters')
+        assert governor.state == CLOSED
+        assert governor.failures == 0
+
+
+class TestAdaptiveConcurrency:
+    def test_failure_halves_the_limit_and_successes_grow_it(self):
+        governor = make_governor(failure_threshold=100)
+        fail(governor)
+        assert governor.limit == 4
+        for _ in range(4):
+            succeed(governor)
+        assert governor.limit == pytest.approx(5, abs=0.1)
+
+    def test_limit_is_halved_at_most_once_per_target_latency(self):
+        governor = make_governor(failure_threshold=100)
+        fail(governor)
+        fail(governor)
+        assert governor.limit == 4
+
+    def test_slow_responses_halve_the_limit(self):
+        governor = make_governor(target_latency=0.01)
+        with governor.call():
+            time.sleep(0.02)
+        assert governor.limit == 4
+        assert governor.state == CLOSED
+
+    def test_limit_stays_within_bounds(self):
+        governor = make_governor(min_concurrency=2, max_concurrency=4, target_latency=0.005, failure_threshold=100)
+        for _ in range(5):
+            fail(governor, ConnectionError('reset'))
+            time.sleep(0.006)
+        assert governor.limit == 2
+        for _ in range(50):
+            succeed(governor)
+        assert governor.limit == 4
+
+    def test_calls_beyond_the_limit_wait_then_are_refused(self):
+        governor = make_governor(max_concurrency=1, max_wait=0.05)
+        first = governor.acquire()
+        started = time.monotonic()
+        with pytest.raises(UpstreamUnavailableError):
+            governor.acquire()
+        assert time.monotonic() - started >= 0.04
+
+        # A released slot admits a waiting call
+        release = threading.Timer(0.01, governor.release, (Permit(), False, first))
+        release.start()
+        governor.acquire()
+        release.join()
+        assert governor.in_flight == 1
+
+
+class TestRateLimit:
+    def test_tokens_beyond_the_burst_are_refused_past_max_wait(self):
+        governor = make_governor(rate=1, burst=2, max_wait=0.01)
+        succeed(governor)
+        succeed(governor)
+        with pytest.raises(UpstreamUnavailableError) as refused:
+            governor.acquire()
+        assert refused.value.retry_after > 0.5
+
+    def test_short_waits_for_a_token_are_slept(self):
+        governor = make_governor(rate=50, burst=1, max_wait=1)
+        succeed(governor)
+        started = time.monotonic()
+        succeed(governor)
+        assert time.monotonic() - started >= 0.01
@@ -0,0 +1,192 @@
+"""
+Tests for background report jobs
+"""
+import asyncio
+import gzip
+import os
+import time
+
+import pytest
+
+from app.core.jobs import JobManager, JobQueueFullError, JobStatus
+from app.core.shared_state import SharedStateClient, start_shared_state
+
+
+def make_manager(tmp_path, shared=None, **kwargs):
+    settings = {'workers': 1, 'max_queue': 10, 'ttl': 60, 'timeout': 5, **kwargs}
+    return JobManager(result_dir=tmp_path / 'jobs', shared=shared, **settings)
+
+
+def run(manager, scenario):
+    """Run scenario(manager) on an event loop, stopping the manager's tasks afterwards"""
+    async def main():
+        try:
+            return await scenario(manager)
+        finally:
+            await manager.stop()
+    return asyncio.run(main())
+
+
+async def finished(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, f"job still {job.status.value}"
+        await asyncio.sleep(0.005)
+    return job
+
+
+def returning(body, delay=0.0, started=None):
+    async def runner(job):
+        if started is not None:
+            started.append(job.key)
+        job.report_progress('working', 0.5)
+        await asyncio.sleep(delay)
+        return body
+    return runner
+
+
+class TestJobs:
+    def test_result_is_stored_compressed(self, tmp_path):
+        manager = make_manager(tmp_path)
+
+        async def scenario(manager):
+            job = await finished(manager.submit('a', 5, returning(b'{"report": 1}')))
+            return job, manager.read_result(job)
+
+        job, stored = run(manager, scenario)
+        assert job.status == JobStatus.succeeded
+        assert job.progress == 1.0
+        assert gzip.decompress(stored) == b'{"report": 1}'
+        assert job.expires_at > job.finished_at
+
+    def test_identical_jobs_are_deduplicated_until_finished(self, tmp_path):
+        manager = make_manager(tmp_path)
+
+        async def scenario(manager):
+            first = manager.submit('a', 5, returning(b'1', delay=0.05))
+            second = manager.submit('a', 0, returning(b'2'))
+            await finished(first)
+            third = manager.submit('a', 5, returning(b'3'))
+            return first, second, third
+
+        first, second, third = run(manager, scenario)
+        assert second is first
+        assert third is not first
+
+    def test_most_urgent_priority_runs_first(self, tmp_path):
+        manager = make_manager(tmp_path)
+        started = []
+
+        async def scenario(manager):
+            blocker = manager.submit('blocker', 5, returning(b'', delay=0.05, started=started))
+            await asyncio.sleep(0.01)
+            jobs = [manager.submit(key, priority, returning(b'', started=started))
+                    for key, priority in (('low', 9), ('high', 0), ('normal', 5))]
+            for job in [blocker, *jobs]:
+                await finished(job)
+
+        run(manager, scenario)
+        assert started == ['blocker', 'high', 'normal', 'low']
+
+    def test_failures_and_timeouts(self, tmp_path):
+        manager = make_manager(tmp_path, workers=2, timeout=0.05)
+
+        async def failing(job):
+            raise ValueError('no data')
+
+        async def scenario(manager):
+            failed = manager.submit('failing', 5, failing)
+            slow = manager.submit('slow', 5, returning(b'', delay=1))
+            return await finished(failed), await finished(slow)
+
+        failed, slow = run(manager, scenario)
+        assert (failed.status, failed.error) == (JobStatus.failed, 'no data')
+        assert slow.status == JobStatus.failed
+        assert 'timeout' in slow.error
+
+    def test_full_queue_refuses_jobs(self, tmp_path):
+        manager = make_manager(tmp_path, max_queue=1)
+
+        async def scenario(manager):
+            manager.submit('running', 5, returning(b'', delay=0.05))
+            await asyncio.sleep(0.01)
+            manager.submit('queued', 5, returning(b''))
+            with pytest.raises(JobQueueFullError):
+                manager.submit('refused', 5, returning(b''))
+
+        run(manager, scenario)
+
+
+class TestCancel:
+    def test_queued_and_running_jobs_are_cancelled(self, tmp_path):
+        manager = make_manager(tmp_path)
+        started = []
+
+        async def scenario(manager):
+            running = manager.submit('running', 5, returning(b'', delay=5, started=started))
+            queued = manager.submit('queued', 5, returning(b'', started=started))
+            await asyncio.sleep(0.01)
+            manager.cancel(queued.id)
+            manager.cancel(running.id)
+            return await finished(running), await finished(queued)
+
+        running, queued = run(manager, scenario)
+        assert running.status == queued.status == JobStatus.cancelled
+        assert started == ['running']
+
+    def test_cancelling_a_finished_job_deletes_it(self, tmp_path):
+        manager = make_manager(tmp_path)
+
+        async def scenario(manager):
+            job = await finished(manager.submit('a', 5, returning(b'{}')))
+            path = job.result_path
+            assert manager.cancel(job.id) is job
+            return job, path
+
+        job, path = run(manager, scenario)
+        assert manager.get(job.id) is None
+        assert not path.exists()
+
+
+class TestExpiry:
+    def test_expired_jobs_and_orphaned_results_are_swept(self, tmp_path):
+        manager = make_manager(tmp_path, ttl=0)
+
+        async def scenario(manager):
+            return await finished(manager.submit('a', 5, returning(b'{}')))
+
+        job = run(manager, scenario)
+        orphan = manager.result_dir / 'orphan.json.gz'
+        orphan.write_bytes(b'')
+        os.utime(orphan, (0, 0))
+        manager._sweep()
+        assert manager.get(job.id) is None
+        assert not job.result_path.exists()
+        assert not orphan.exists()
+
+
+class TestSharedJobs:
+    def test_workers_share_jobs_through_the_shared_state(self, tmp_path):
+        address = str(tmp_path / 'shared.sock')
+        shared_state = start_shared_state(address, max_entries=10, max_bytes=2**20)
+        first = make_manager(tmp_path, shared=SharedStateClient(address))
+        second = make_manager(tmp_path, shared=SharedStateClient(address))
+
+        async def scenario(first):
+            job = first.submit('a', 5, returning(b'{}', delay=5))
+            await asyncio.sleep(0.01)
+            # The second worker sees, deduplicates against and cancels the first's job
+            seen = second.submit('a', 5, returning(b'{}'))
+            assert seen.id == job.id
+            assert second.get(job.id).status == JobStatus.running
+            second.cancel(job.id)
+            await finished(job, timeout=3)
+            await second.stop()
+            return job, second.get(job.id)
+
+        try:
+            job, seen = run(first, scenario)
+        finally:
+            shared_state.shutdown()
+        assert job.status == JobStatus.cancelled
+        assert seen.status == JobStatus.cancelled
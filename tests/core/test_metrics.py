@@ -0,0 +1,103 @@
+"""
+Tests for request metrics, stage timing and the request profiler
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from prometheus_client import REGISTRY
+
+from app.core.metrics import MetricsMiddleware, ProfilerMiddleware, time_stream
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def busy_endpoint(route_path):
+    """An app answering 201 with two body chunks after some CPU work"""
+    async def app(scope, receive, send):
+        if route_path is not None:
+            scope['route'] = SimpleNamespace(path=route_path)
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        await send({'type': 'http.response.start', 'status': 201, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'x' * 300, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'y' * 200})
+    return app
+
+
+def call(app, headers=()):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/', 'headers': list(headers)}
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+class TestMetricsMiddleware:
+    def test_records_latency_and_size_by_route_template(self):
+        labels = {'method': 'POST', 'route': '/jobs/{job_id}', 'status': '201'}
+        before = sample('http_request_duration_seconds_count', **labels)
+        bytes_before = sample('http_response_bytes_sum', route='/jobs/{job_id}')
+
+        messages = call(MetricsMiddleware(busy_endpoint('/jobs/{job_id}')))
+        assert [message['type'] for message in messages] == ['http.response.start'] + ['http.response.body'] * 2
+        assert sample('http_request_duration_seconds_count', **labels) == before + 1
+        assert sample('http_request_duration_seconds_sum', **labels) >= 0.05
+        assert sample('http_response_bytes_sum', route='/jobs/{job_id}') == bytes_before + 500
+
+    def test_unmatched_routes_share_a_label(self):
+        labels = {'method': 'POST', 'route': 'unmatched', 'status': '201'}
+        before = sample('http_request_duration_seconds_count', **labels)
+        call(MetricsMiddleware(busy_endpoint(None)))
+        assert sample('http_request_duration_seconds_count', **labels) == before + 1
+
+
+class TestTimeStream:
+    def test_fetch_and_processing_time_are_split(self):
+        closed = []
+
+        def chunks():
+            try:
+                for _ in range(3):
+                    time.sleep(0.02)
+                    yield 'chunk'
+            finally:
+                closed.append(True)
+
+        fetch_before = sample('wqp_stage_duration_seconds_sum', stage='test-fetch')
+        clean_before = sample('wqp_stage_duration_seconds_sum', stage='test-clean')
+        with time_stream(chunks(), 'test-fetch', 'test-clean') as timed:
+            next(timed)
+            time.sleep(0.05)
+        fetch = sample('wqp_stage_duration_seconds_sum', stage='test-fetch') - fetch_before
+        clean = sample('wqp_stage_duration_seconds_sum', stage='test-clean') - clean_before
+        assert closed == [True]
+        assert fetch >= 0.02
+        # The sleep between chunks counts as processing
+        assert clean >= 0.05
+
+
+class TestProfilerMiddleware:
+    def test_profiled_requests_get_stack_samples(self):
+        messages = call(ProfilerMiddleware(busy_endpoint('/'), interval=0.001), headers=[(b'x-profile', b'1')])
+        headers = dict(messages[0]['headers'])
+        assert messages[0]['status'] == 200
+        assert headers[b'x-profiled-status'] == b'201'
+        stacks = messages[1]['body'].decode().splitlines()
+        assert stacks
+        assert any('app (test_metrics.py' in line for line in stacks)
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in stacks)
+
+    def test_other_requests_pass_through(self):
+        messages = call(ProfilerMiddleware(busy_endpoint('/'), interval=0.001))
+        assert messages[0]['status'] == 201
+
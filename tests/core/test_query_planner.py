@@ -0,0 +1,155 @@
+"""
+Tests for query sharding and shard merging
+"""
+import asyncio
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from app.core.governor import UpstreamUnavailableError
+from app.core.query_planner import QueryPlanner, ShardFetchError
+from app.core.site_catalog import SiteIndex
+
+
+def plan(params, window_days=180, max_sites=100, max_shards=32, counties=None):
+    return QueryPlanner.plan(
+        params, window_days=window_days, max_sites_per_shard=max_sites, max_shards=max_shards, counties=counties
+    )
+
+
+CA_COUNTIES = [f"US:06:{code:03d}" for code in range(1, 116, 2)]
+
+
+def shard_dates(shard):
+    return QueryPlanner._parse_date(shard['startDateLo']), QueryPlanner._parse_date(shard['startDateHi'])
+
+
+class TestPlan:
+    def test_small_query_is_not_split(self):
+        params = {'statecode': ['US:06'], 'characteristicName': ['pH']}
+        assert plan(params) == [params]
+
+    def test_site_lists_are_chunked_and_not_split_by_date(self):
+        sites = [f"USGS-{i:08d}" for i in range(250)]
+        params = {'siteid': sites, 'startDateLo': '01-01-2000', 'startDateHi': '12-31-2020'}
+        shards = plan(params)
+        assert [len(shard['siteid']) for shard in shards] == [100, 100, 50]
+        assert [site for shard in shards for site in shard['siteid']] == sites
+        assert all(shard['startDateLo'] == '01-01-2000' for shard in shards)
+
+    def test_only_the_narrowest_location_filter_is_split(self):
+        shards = plan({'huc': ['18010101', '18010102'], 'statecode': ['US:06', 'US:41']})
+        assert [shard['huc'] for shard in shards] == [['18010101'], ['18010102']]
+        assert all(shard['statecode'] == ['US:06', 'US:41'] for shard in shards)
+
+    def test_date_windows_cover_the_range_without_overlap(self):
+        shards = plan({'statecode': ['US:06'], 'startDateLo': '01-01-2020', 'startDateHi': '12-31-2021'}, window_days=100)
+        windows = [shard_dates(shard) for shard in shards]
+        assert windows[0][0] == date(2020, 1, 1)
+        assert windows[-1][1] == date(2021, 12, 31)
+        for (_, previous_end), (start, end) in zip(windows, windows[1:]):
+            assert start == previous_end + timedelta(days=1)
+            assert (end - start).days < 100
+
+    def test_windows_are_widened_to_stay_within_max_shards(self):
+        params = {
+            'statecode': ['US:06', 'US:41', 'US:53', 'US:32'],
+            'startDateLo': '01-01-2000', 'startDateHi': '12-31-2020'
+        }
+        shards = plan(params, window_days=30, max_shards=16)
+        assert len(shards) <= 16
+        for state in params['statecode']:
+            windows = sorted(shard_dates(shard) for shard in shards if shard['statecode'] == [state])
+            assert windows[0][0] == date(2000, 1, 1)
+            assert windows[-1][1] == date(2020, 12, 31)
+
+    def test_undated_states_are_split_by_county(self):
+        shards = plan({'statecode': ['CA'], 'characteristicName': ['pH']}, max_shards=16, counties={'CA': CA_COUNTIES})
+        assert 1 < len(shards) <= 16
+        assert [county for shard in shards for county in shard['countycode']] == CA_COUNTIES
+        assert all(shard['statecode'] == ['CA'] and shard['characteristicName'] == ['pH'] for shard in shards)
+
+    def test_states_without_known_counties_stay_whole(self):
+        shards = plan({'statecode': ['CA', 'OR']}, max_shards=8, counties={'CA': CA_COUNTIES})
+        assert {'statecode': ['OR']} in shards
+        assert len(shards) <= 8
+        assert sum(len(shard.get('countycode', [])) for shard in shards) == len(CA_COUNTIES)
+
+    def test_dated_and_narrower_queries_ignore_counties(self):
+        counties = {'CA': CA_COUNTIES}
+        dated = plan({'statecode': ['CA'], 'startDateLo': '01-01-2020', 'startDateHi': '12-31-2020'}, counties=counties)
+        assert all('countycode' not in shard for shard in dated)
+        huc = plan({'statecode': ['CA'], 'huc': ['18010101', '18010102']}, counties=counties)
+        assert [shard['huc'] for shard in huc] == [['18010101'], ['18010102']]
+
+
+def test_county_codes_restore_leading_zeros():
+    sites = pd.DataFrame({
+        'site_no': ['1', '2', '3', '4'],
+        'state_cd': [6, 6, 6, None],
+        'county_cd': [1, 113, 1, 5],
+        'dec_lat_va': [38.0] * 4,
+        'dec_long_va': [-121.0] * 4
+    })
+    assert SiteIndex(sites).county_codes() == ['US:06:001', 'US:06:113']
+
+
+class TestMergeResults:
+    def test_duplicate_result_identifiers_are_dropped(self):
+        first = pd.DataFrame({'ResultIdentifier': ['a', 'b'], 'ResultMeasureValue': [1.0, 2.0]})
+        second = pd.DataFrame({'ResultIdentifier': ['b', 'c'], 'ResultMeasureValue': [2.0, 3.0]})
+        merged = QueryPlanner.merge_results([first, second])
+        assert merged['ResultIdentifier'].tolist() == ['a', 'b', 'c']
+
+    def test_fallback_keys_are_used_without_result_identifiers(self):
+        row = {'ActivityIdentifier': 'x', 'CharacteristicName': 'pH', 'ResultMeasureValue': 7.0}
+        other = {**row, 'CharacteristicName': 'Temperature'}
+        merged = QueryPlanner.merge_results([pd.DataFrame([row]), pd.DataFrame([row, other])])
+        assert sorted(merged['CharacteristicName']) == ['Temperature', 'pH']
+
+    def test_empty_frames_are_skipped(self):
+        frame = pd.DataFrame({'ResultIdentifier': ['a']})
+        assert QueryPlanner.merge_results([pd.DataFrame(), frame]) is frame
+        assert QueryPlanner.merge_results([pd.DataFrame()]).empty
+
+
+class TestFetchShards:
+    @staticmethod
+    def fetch(shards, fetch_shard, retries=2):
+        return asyncio.run(QueryPlanner.fetch_shards(shards, fetch_shard, concurrency=2, retries=retries, backoff=0.001))
+
+    def test_failed_shards_are_retried(self):
+        attempts = {}
+
+        async def fetch_shard(shard):
+            attempts[shard['id']] = attempts.get(shard['id'], 0) + 1
+            if shard['id'] == 1 and attempts[1] < 3:
+                raise ConnectionError('reset')
+            return pd.DataFrame({'id': [shard['id']]}), {'id': shard['id']}
+
+        frames, metadata = self.fetch([{'id': 0}, {'id': 1}], fetch_shard)
+        assert [frame['id'][0] for frame in frames] == [0, 1]
+        assert metadata == [{'id': 0}, {'id': 1}]
+        assert attempts == {0: 1, 1: 3}
+
+    def test_exhausted_retries_raise_shard_fetch_error(self):
+        async def fetch_shard(shard):
+            raise ConnectionError('reset')
+
+        with pytest.raises(ShardFetchError) as error:
+            self.fetch([{'id': 0}], fetch_shard, retries=1)
+        assert isinstance(error.value.__cause__, ConnectionError)
+
+    @pytest.mark.parametrize('exception', [ValueError('bad request'), UpstreamUnavailableError('circuit open')])
+    def test_client_errors_and_refusals_are_not_retried(self, exception):
+        calls = 0
+
+        async def fetch_shard(shard):
+            nonlocal calls
+            calls += 1
+            raise exception
+
+        with pytest.raises(type(exception)):
+            self.fetch([{'id': 0}], fetch_shard)
+        assert calls == 1
@@ -0,0 +1,231 @@
+"""
+Tests for report generation
+"""
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app.core import report_generator
+from app.core.report_generator import DETAIL_COLUMNS, ReportGenerator
+from benchmarks.bench_trend_report import assert_equivalent, legacy_trend_report
+
+
+class TestTrendReport:
+    def test_matches_the_per_parameter_loop(self, wqp_frame):
+        legacy = legacy_trend_report(wqp_frame.copy(), {})
+        assert_equivalent(legacy, ReportGenerator.generate_trend_report(wqp_frame, {}))
+
+    def test_frame_is_not_modified(self, wqp_frame):
+        columns = list(wqp_frame.columns)
+        ReportGenerator.generate_trend_report(wqp_frame, {}, granularity='monthly')
+        assert list(wqp_frame.columns) == columns
+
+    def test_missing_dates_are_an_error(self):
+        assert 'error' in ReportGenerator.generate_trend_report(pd.DataFrame(), {})
+
+
+class TestDetailedChunks:
+    def test_ndjson_rows_match_the_detailed_report(self, wqp_frame):
+        df = wqp_frame.head(1_000)
+        chunks = list(ReportGenerator.iter_detailed_chunks(df, 'ndjson', 300))
+        assert len(chunks) == 4
+        rows = [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+        assert rows == ReportGenerator.generate_detailed_report(df, {})
+
+    def test_csv_has_one_header_and_every_row(self, wqp_frame):
+        df = wqp_frame.head(1_000)
+        text = b''.join(ReportGenerator.iter_detailed_chunks(df, 'csv', 300)).decode()
+        assert text.count('OrganizationIdentifier') == 1
+        parsed = pd.read_csv(io.StringIO(text))
+        assert list(parsed.columns) == [col for col in DETAIL_COLUMNS if col in df.columns]
+        assert len(parsed) == len(df)
+        assert parsed['ResultMeasureValue'].tolist() == pytest.approx(df['ResultMeasureValue'].tolist(), nan_ok=True)
+        assert parsed['ActivityStartDate'].iloc[0] == df['ActivityStartDate'].iloc[0].strftime('%Y-%m-%dT%H:%M:%S')
+
+    def test_empty_frames(self, wqp_frame):
+        empty = wqp_frame.head(0)
+        assert b''.join(ReportGenerator.iter_detailed_chunks(empty, 'csv', 10)).decode().startswith('OrganizationIdentifier,')
+        assert list(ReportGenerator.iter_detailed_chunks(empty, 'ndjson', 10)) == []
+
+    def test_unknown_format(self, wqp_frame):
+        with pytest.raises(ValueError):
+            next(ReportGenerator.iter_detailed_chunks(wqp_frame, 'xml', 10))
+
+
+class TestColumnarChunks:
+    @staticmethod
+    def expected(df):
+        return df[[col for col in DETAIL_COLUMNS if col in df.columns]].reset_index(drop=True)
+
+    def test_arrow_stream_keeps_dtypes_and_metadata(self, wqp_frame):
+        df = wqp_frame.head(1_000)
+        chunks = list(ReportGenerator.iter_columnar_chunks(df, 'arrow', 300, {'query_info': {'statecode': ['US:06']}}))
+        # One chunk per record batch, then the end-of-stream marker
+        assert len(chunks) == 5
+        reader = pa.ipc.open_stream(b''.join(chunks))
+        assert json.loads(reader.schema.metadata[b'query_info']) == {'statecode': ['US:06']}
+        batches = list(reader)
+        assert [batch.num_rows for batch in batches] == [300, 300, 300, 100]
+        assert pa.types.is_dictionary(batches[0].schema.field('CharacteristicName').type)
+        result = pa.Table.from_batches(batches).to_pandas()
+        pd.testing.assert_frame_equal(result, self.expected(df))
+
+    def test_parquet_has_one_row_group_per_batch(self, wqp_frame):
+        df = wqp_frame.head(1_000)
+        data = b''.join(ReportGenerator.iter_columnar_chunks(df, 'parquet', 400, {'records_processed': 1_000}))
+        parquet = pq.ParquetFile(pa.BufferReader(data))
+        assert parquet.num_row_groups == 3
+        assert parquet.metadata.row_group(0).column(0).compression == 'ZSTD'
+        assert json.loads(parquet.schema_arrow.metadata[b'records_processed']) == 1_000
+        pd.testing.assert_frame_equal(parquet.read().to_pandas(), self.expected(df))
+
+    def test_empty_frames_still_have_a_schema(self, wqp_frame):
+        reader = pa.ipc.open_stream(b''.join(ReportGenerator.iter_columnar_chunks(wqp_frame.head(0), 'arrow', 10, {})))
+        assert 'ResultMeasureValue' in reader.schema.names
+        assert reader.read_all().num_rows == 0
+
+    def test_unknown_format(self, wqp_frame):
+        with pytest.raises(ValueError):
+            next(ReportGenerator.iter_columnar_chunks(wqp_frame, 'csv', 10, {}))
+
+
+class TestSpatialReport:
+    def test_zone_statistics_match_a_groupby(self, wqp_frame):
+        sites = wqp_frame['MonitoringLocationIdentifier'].cat.categories
+        # The last site has no zone
+        huc = pd.Series([f"180201{i % 3:02d}" for i in range(len(sites) - 1)] + [None], index=sites)
+        report = ReportGenerator.generate_spatial_report(wqp_frame, {}, {'huc8': huc})
+        level = report['levels']['huc8']
+
+        zone = wqp_frame['MonitoringLocationIdentifier'].astype(object).map(huc)
+        expected = wqp_frame.groupby([zone, 'CharacteristicName'], observed=True)['ResultMeasureValue'].agg(
+            ['count', 'mean', 'median', 'min', 'max']
+        ).round(3)
+        assert level['zone_count'] == 3
+        assert level['mapped_records'] == zone.notna().sum()
+        assert level['mapped_records'] + level['unmapped_records'] == report['total_records'] == len(wqp_frame)
+        assert level['unmapped_locations'] == 1
+        for (label, characteristic), row in expected.iterrows():
+            actual = level['zones'][label]['parameters'][characteristic]
+            assert actual == pytest.approx(row.to_dict(), nan_ok=True)
+        assert sum(entry['records'] for entry in level['zones'].values()) == level['mapped_records']
+        assert sum(entry['locations'] for entry in level['zones'].values()) == len(sites) - 1
+
+    def test_grid_zones_carry_bounds(self, wqp_frame):
+        sites = wqp_frame['MonitoringLocationIdentifier'].cat.categories
+        grid = pd.Series('38.0,-121.75', index=sites)
+        report = ReportGenerator.generate_spatial_report(wqp_frame, {}, {'grid': grid}, grid_degrees=0.25)
+        assert report['grid_degrees'] == 0.25
+        assert report['levels']['grid']['zones']['38.0,-121.75']['bounds'] == [-121.75, 38.0, -121.5, 38.25]
+
+    def test_no_values(self):
+        assert 'error' in ReportGenerator.generate_spatial_report(pd.DataFrame(), {}, {})
+
+
+def naive_mann_kendall(values, times):
+    """S and Sen's slope from an explicit loop over period pairs"""
+    points = [(t, v) for t, v in zip(times, values) if not np.isnan(v)]
+    s, slopes = 0, []
+    for i, (t_i, v_i) in enumerate(points):
+        for t_j, v_j in points[i + 1:]:
+            s += int(np.sign(v_j - v_i))
+            slopes.append((v_j - v_i) / (t_j - t_i))
+    return s, float(np.median(slopes)) if slopes else np.nan
+
+
+class TestTrendStatistics:
+    @staticmethod
+    def series(n_groups=12, n_periods=9, seed=0):
+        rng = np.random.default_rng(seed)
+        values = rng.normal(size=(n_groups, n_periods)) + np.arange(n_periods) * rng.normal(size=(n_groups, 1))
+        values[rng.random(values.shape) < 0.2] = np.nan
+        values[0] = np.arange(n_periods)
+        values[1] = -np.arange(n_periods)
+        values[2, 2:] = np.nan
+        return pd.DataFrame(values, columns=2000 + np.arange(n_periods) / 2)
+
+    def test_matches_explicit_pairs(self):
+        series = self.series()
+        results = ReportGenerator._trend_statistics(series)
+        for row, result in zip(series.to_numpy(), results):
+            if result['trend'] == 'insufficient data':
+                assert result['periods'] < report_generator.MIN_TREND_PERIODS
+                continue
+            s, sen = naive_mann_kendall(row, series.columns.to_numpy())
+            assert result['mann_kendall_s'] == s
+            assert result['sens_slope_per_year'] == pytest.approx(sen, abs=1e-6)
+        assert results[0]['trend'] == 'increasing'
+        assert results[1]['trend'] == 'decreasing'
+        assert results[2]['trend'] == 'insufficient data'
+
+    @pytest.mark.parametrize('budget', [0, 81, 81 * 5])
+    def test_block_size_does_not_change_results(self, monkeypatch, budget):
+        series = self.series()
+        expected = ReportGenerator._trend_statistics(series)
+        monkeypatch.setattr(report_generator, 'TREND_PAIR_BUDGET', budget)
+        assert ReportGenerator._trend_statistics(series) == expected
+
+
+class TestComparisonReport:
+    @staticmethod
+    def frame():
+        rows = [
+            ('pH', 'A', 6.0, 'std units'), ('pH', 'A', 7.0, 'std units'), ('pH', 'A', 9.5, 'std units'),
+            ('pH', 'B', 8.0, 'std units'), ('pH', 'B', 8.2, 'std units'),
+            ('pH', 'C', 7.0, 'std units'), ('pH', 'C', 5.0, 'None'),
+            ('Temperature', 'A', 20.0, 'deg C'), ('Temperature', 'B', 12.0, 'deg C'),
+        ]
+        return pd.DataFrame(rows, columns=[
+            'CharacteristicName', 'MonitoringLocationIdentifier', 'ResultMeasureValue', 'ResultMeasureUnitCode'
+        ])
+
+    def test_sites_are_ranked_by_median_highest_first(self):
+        report = ReportGenerator.generate_comparison_report(self.frame(), {}, percentiles=[50])
+        ph = report['comparison']['pH']
+        assert {site: row['rank'] for site, row in ph['locations'].items()} == {'A': 2, 'B': 1, 'C': 3}
+        assert ph['locations']['B']['median'] == 8.1
+        assert ph['locations']['A']['p50'] == 7.0
+        assert ph['median_of_site_medians'] == 7.0
+        assert ph['sites'] == 3
+        assert report['characteristics'] == 2
+        assert report['locations'] == 3
+
+    def test_ties_share_the_highest_rank(self):
+        df = pd.DataFrame({
+            'CharacteristicName': ['pH'] * 3,
+            'MonitoringLocationIdentifier': ['A', 'B', 'C'],
+            'ResultMeasureValue': [7.0, 7.0, 6.0]
+        })
+        locations = ReportGenerator.generate_comparison_report(df, {})['comparison']['pH']['locations']
+        assert [locations[site]['rank'] for site in 'ABC'] == [1, 1, 3]
+
+    def test_threshold_exceedances(self):
+        thresholds = {'pH': {'min': 6.5, 'max': 8.5, 'unit': 'std units'}, 'Arsenic': {'max': 10}}
+        report = ReportGenerator.generate_comparison_report(self.frame(), {}, thresholds=thresholds)
+        ph = report['comparison']['pH']
+        assert ph['threshold'] == thresholds['pH']
+        # C's 5.0 is in another unit, so it is not compared
+        assert {site: (row['compared'], row['exceedances']) for site, row in ph['locations'].items()} == {
+            'A': (3, 2), 'B': (2, 0), 'C': (1, 0)
+        }
+        assert ph['locations']['A']['exceedance_rate'] == pytest.approx(0.6667)
+        assert ph['sites_exceeding'] == 1
+        assert report['unmatched_thresholds'] == ['Arsenic']
+
+    def test_characteristics_without_a_threshold_have_no_exceedances(self):
+        report = ReportGenerator.generate_comparison_report(self.frame(), {}, thresholds={'pH': {'max': 8.5}})
+        temperature = report['comparison']['Temperature']
+        assert temperature['sites_exceeding'] is None
+        assert 'threshold' not in temperature
+        assert temperature['locations']['A']['exceedances'] is None
+
+    def test_by_unit_separates_units(self):
+        report = ReportGenerator.generate_comparison_report(self.frame(), {}, by_unit=True)
+        units = report['comparison']['pH']['units']
+        assert sorted(units) == ['None', 'std units']
+        assert list(units['None']['locations']) == ['C']
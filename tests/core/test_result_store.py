@@ -0,0 +1,123 @@
+"""
+Tests for the local result store and its warm-store command
+"""
+import json
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from app import cli
+from app.core.result_store import ResultStore
+from tests.fixtures.mock_responses import WQP_ROWS
+
+FILTERS = {'statecode': ['US:06'], 'characteristicName': ['pH']}
+
+
+def rows(*days, value=7.0):
+    return pd.DataFrame({
+        'OrganizationIdentifier': 'USGS-CA',
+        'MonitoringLocationIdentifier': 'USGS-11000001',
+        'ActivityStartDate': pd.to_datetime(list(days)),
+        'CharacteristicName': 'pH',
+        'ResultMeasureValue': value
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(tmp_path / 'store')
+
+
+class TestQueries:
+    def test_split_query(self):
+        filters, start, end = ResultStore.split_query({
+            **FILTERS, 'startDateLo': '01-01-2020', 'startDateHi': '06-30-2020'
+        })
+        assert filters == FILTERS
+        assert (start, end) == (date(2020, 1, 1), date(2020, 6, 30))
+
+    def test_open_ended_ranges_stop_today(self):
+        _, _, end = ResultStore.split_query({'startDateLo': '01-01-2020', 'startDateHi': '01-01-2999'})
+        assert end == date.today()
+        assert not ResultStore.supports(FILTERS)
+
+
+class TestMissingIntervals:
+    def test_everything_is_missing_at_first(self, store):
+        assert store.missing_intervals(FILTERS, date(2020, 1, 1), date(2020, 12, 31)) == [
+            (date(2020, 1, 1), date(2020, 12, 31))
+        ]
+
+    def test_only_gaps_around_stored_intervals_are_missing(self, store):
+        store.ingest(FILTERS, rows('2020-03-15'), date(2020, 3, 1), date(2020, 4, 30))
+        store.ingest(FILTERS, rows('2020-08-15'), date(2020, 8, 1), date(2020, 8, 31))
+        assert store.missing_intervals(FILTERS, date(2020, 1, 1), date(2020, 12, 31)) == [
+            (date(2020, 1, 1), date(2020, 2, 29)),
+            (date(2020, 5, 1), date(2020, 7, 31)),
+            (date(2020, 9, 1), date(2020, 12, 31)),
+        ]
+        assert store.missing_intervals(FILTERS, date(2020, 3, 10), date(2020, 4, 10)) == []
+        assert store.missing_intervals({'statecode': ['US:41']}, date(2020, 3, 10), date(2020, 4, 10))
+
+    def test_touching_intervals_merge(self, store):
+        store.ingest(FILTERS, rows(), date(2020, 1, 1), date(2020, 1, 31))
+        store.ingest(FILTERS, rows(), date(2020, 2, 1), date(2020, 2, 29))
+        assert store.coverage(FILTERS) == [(date(2020, 1, 1), date(2020, 2, 29))]
+
+    def test_recent_days_are_refetched(self, tmp_path):
+        store = ResultStore(tmp_path, refresh_days=3)
+        today = date.today()
+        store.ingest(FILTERS, rows(), today - timedelta(days=30), today)
+        assert store.missing_intervals(FILTERS, today - timedelta(days=30), today) == [
+            (today - timedelta(days=2), today)
+        ]
+
+
+class TestIngestAndRead:
+    def test_rows_are_partitioned_by_year_and_read_by_date(self, store):
+        store.ingest(FILTERS, rows('2019-12-31', '2020-01-01', '2020-06-01'), date(2019, 12, 1), date(2020, 6, 30))
+        assert store.last_modified(FILTERS) is not None
+        df = store.read(FILTERS, date(2019, 12, 31), date(2020, 1, 31))
+        assert df['ActivityStartDate'].dt.strftime('%Y-%m-%d').tolist() == ['2019-12-31', '2020-01-01']
+        assert isinstance(df['CharacteristicName'].dtype, pd.CategoricalDtype)
+
+    def test_refetched_intervals_replace_stored_rows(self, store):
+        store.ingest(FILTERS, rows('2020-01-10', '2020-02-10'), date(2020, 1, 1), date(2020, 2, 29))
+        store.ingest(FILTERS, rows('2020-02-12', value=8.0), date(2020, 2, 1), date(2020, 2, 29))
+        df = store.read(FILTERS, date(2020, 1, 1), date(2020, 12, 31))
+        assert df['ActivityStartDate'].dt.strftime('%m-%d').tolist() == ['01-10', '02-12']
+        assert df['ResultMeasureValue'].tolist() == [7.0, 8.0]
+
+    def test_columns_missing_from_a_file_are_skipped(self, store):
+        store.ingest(FILTERS, rows('2020-01-10'), date(2020, 1, 1), date(2020, 1, 31))
+        df = store.read(FILTERS, date(2020, 1, 1), date(2020, 1, 31), columns=['ResultMeasureValue', 'ResultCommentText'])
+        assert list(df.columns) == ['ResultMeasureValue']
+
+    def test_nothing_stored(self, store):
+        assert store.read(FILTERS, date(2020, 1, 1), date(2020, 1, 31)).empty
+
+
+class TestWarmStoreCommand:
+    def test_fetches_only_missing_intervals(self, upstream, store, tmp_path, monkeypatch, capsys):
+        monkeypatch.setattr(cli, 'get_result_store', lambda: store)
+        regions = tmp_path / 'regions.json'
+        regions.write_text(json.dumps([
+            {'state_cd': ['CA'], 'start_date': '2020-01-01', 'end_date': '2020-12-31'}
+        ]))
+
+        cli.main(['warm-store', '--regions', str(regions)])
+        assert len(upstream.requests) == 1
+        output = capsys.readouterr().out
+        assert output.endswith(f"2020-01-01..2020-12-31: {WQP_ROWS} rows\n")
+        filters = json.loads(output.split(' 2020-01-01..')[0])
+        assert len(store.read(filters, date(2020, 1, 1), date(2020, 12, 31))) == WQP_ROWS
+
+        cli.main(['warm-store', '--regions', str(regions)])
+        assert len(upstream.requests) == 1
+        assert capsys.readouterr().out == ''
+
+    def test_regions_are_required(self, monkeypatch):
+        monkeypatch.setattr(cli.get_settings(), 'result_store_regions_file', None)
+        with pytest.raises(SystemExit):
+            cli.main(['warm-store'])
@@ -0,0 +1,57 @@
+"""
+Tests for pre-aggregated rollups
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.rollups import Rollup
+
+
+def centroids(groups, values, weights=None):
+    return pd.DataFrame({
+        'group': groups,
+        'value': values,
+        'weight': weights if weights is not None else np.ones(len(values))
+    })
+
+
+class TestWeightedMedians:
+    def test_unit_weights_give_exact_medians(self):
+        rng = np.random.default_rng(0)
+        groups = rng.integers(0, 20, size=2_000)
+        values = rng.normal(size=2_000).round(1)
+        frame = centroids(groups, values)
+        medians = Rollup.weighted_medians(frame, ['group'])
+        pd.testing.assert_series_equal(medians, frame.groupby('group')['value'].median(), check_names=False)
+
+    def test_even_counts_average_the_middle_pair(self):
+        medians = Rollup.weighted_medians(centroids(['a'] * 4 + ['b'], [4.0, 1.0, 3.0, 2.0, 9.0]), ['group'])
+        assert medians.to_dict() == {'a': 2.5, 'b': 9.0}
+
+    def test_weights_move_the_median(self):
+        medians = Rollup.weighted_medians(centroids(['a'] * 3, [1.0, 2.0, 3.0], [1.0, 1.0, 5.0]), ['group'])
+        assert medians['a'] == 3.0
+
+    def test_exact_half_falls_between_centroids(self):
+        medians = Rollup.weighted_medians(centroids(['a'] * 2, [1.0, 5.0], [3.0, 3.0]), ['group'])
+        assert medians['a'] == 3.0
+
+    def test_array_keys(self):
+        frame = centroids([0, 0, 1], [1.0, 3.0, 5.0])
+        medians = Rollup.weighted_medians(frame, [np.array(['x', 'x', 'y'])])
+        assert medians.to_dict() == {'x': 2.0, 'y': 5.0}
+
+    def test_empty(self):
+        assert Rollup.weighted_medians(centroids([], []), ['group']).empty
+
+
+class TestBuild:
+    def test_cells_keep_counts_and_extremes(self, wqp_frame):
+        rollup = Rollup.build(wqp_frame, sketch_size=64)
+        valid = wqp_frame['ResultMeasureValue'].notna()
+        assert rollup.records == len(wqp_frame)
+        assert rollup.cells['count'].sum() == valid.sum()
+        assert rollup.cells['min'].min() == pytest.approx(wqp_frame['ResultMeasureValue'].min())
+        assert rollup.cells['max'].max() == pytest.approx(wqp_frame['ResultMeasureValue'].max())
+        assert rollup.centroids['weight'].sum() == pytest.approx(valid.sum())
@@ -0,0 +1,118 @@
+"""
+Tests for the state shared by the workers of the multi-worker server
+"""
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from app.core.cache import QueryCache
+from app.core.shared_state import SharedStateClient, SharedStore, start_shared_state
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = start_shared_state(str(tmp_path / 'shared.sock'), max_entries=10, max_bytes=2**20)
+    yield manager
+    manager.shutdown()
+
+
+class TestSharedStore:
+    def test_least_recently_used_blobs_are_evicted(self):
+        store = SharedStore(max_entries=2, max_bytes=100)
+        store.set('a', b'1', ttl=60)
+        store.set('b', b'2', ttl=60)
+        store.get('a')
+        store.set('c', b'3', ttl=60)
+        assert store.get('b') is None
+        assert store.get('a') == b'1'
+        assert store.evictions == 1
+
+    def test_blobs_expire_and_oversized_ones_are_skipped(self):
+        store = SharedStore(max_entries=10, max_bytes=4)
+        store.set('a', b'1', ttl=0)
+        store.set('big', b'12345', ttl=60)
+        time.sleep(0.01)
+        assert store.get('a') is None
+        assert store.get('big') is None
+
+    def test_claims_belong_to_one_owner_until_released_or_expired(self):
+        store = SharedStore(max_entries=10, max_bytes=100)
+        assert store.claim('key', 'worker-1', lease=60)
+        assert not store.claim('key', 'worker-2', lease=60)
+        store.release('key', 'worker-2')
+        assert not store.claim('key', 'worker-2', lease=60)
+        store.release('key', 'worker-1')
+        assert store.claim('key', 'worker-2', lease=0)
+        time.sleep(0.01)
+        assert store.claim('key', 'worker-1', lease=60)
+
+    def test_records(self):
+        store = SharedStore(max_entries=10, max_bytes=100)
+        store.put_record('job', {'status': 'running'}, ttl=60)
+        assert store.get_record('job') == {'status': 'running'}
+        assert store.pop_record('job') == {'status': 'running'}
+        assert store.get_record('job') is None
+
+
+class TestSharedStateClient:
+    def test_unreachable_manager_fails_soft(self, tmp_path):
+        client = SharedStateClient(str(tmp_path / 'missing.sock'))
+        assert client.get('key') is None
+        client.set('key', b'blob', 60)
+        # Claims succeed, so the worker loads on its own
+        assert client.claim('key', 60)
+        assert client.get_record('job') is None
+        assert client.stats()['errors'] == 5
+
+    def test_calls_reach_the_manager(self, manager, tmp_path):
+        client = SharedStateClient(str(tmp_path / 'shared.sock'))
+        other = SharedStateClient(str(tmp_path / 'shared.sock'))
+        client.set('key', b'blob', 60)
+        assert other.get('key') == b'blob'
+        assert client.claim('load', 60)
+        assert not other.claim('load', 60)
+        assert client.stats()['errors'] == 0
+
+    def test_reconnects_after_the_manager_goes_away(self, tmp_path):
+        address = str(tmp_path / 'shared.sock')
+        client = SharedStateClient(address)
+        manager = start_shared_state(address, max_entries=10, max_bytes=2**20)
+        client.set('key', b'blob', 60)
+        manager.shutdown()
+        assert client.get('key') is None
+        assert client.errors == 1
+
+        manager = start_shared_state(address, max_entries=10, max_bytes=2**20)
+        try:
+            client.set('key', b'again', 60)
+            assert client.get('key') == b'again'
+        finally:
+            manager.shutdown()
+
+
+class TestSharedCache:
+    def test_workers_share_results_and_loads(self, manager, tmp_path):
+        address = str(tmp_path / 'shared.sock')
+        workers = [
+            QueryCache(ttl=60, max_entries=10, max_bytes=2**24, shared=SharedStateClient(address), lease=5)
+            for _ in range(2)
+        ]
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            return pd.DataFrame({'ResultMeasureValue': [1.0, 2.0]}), {'source': 'test'}
+
+        async def run():
+            return await asyncio.gather(*[
+                worker.get_or_load({'statecode': ['US:06']}, loader) for worker in workers
+            ])
+
+        results = asyncio.run(run())
+        assert calls == 1
+        assert all(df['ResultMeasureValue'].tolist() == [1.0, 2.0] for df, _ in results)
+        assert sum(worker.coalesced for worker in workers) == 1
@@ -0,0 +1,153 @@
+"""
+Tests for the site catalog and its spatial index
+"""
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.site_catalog import EARTH_RADIUS_KM, SiteCatalog, SiteIndex, grid_cell_bounds, grid_cell_label
+from benchmarks.synthetic import generate_nwis_sites
+
+
+@pytest.fixture(scope='module')
+def sites():
+    sites = generate_nwis_sites(2_000, seed=4)
+    # Sites without coordinates or a HUC are indexed but never matched spatially
+    sites.loc[:9, 'dec_lat_va'] = np.nan
+    sites['huc_cd'] = sites['huc_cd'].astype('float64')
+    sites.loc[10:19, 'huc_cd'] = np.nan
+    return sites
+
+
+@pytest.fixture(scope='module')
+def index(sites):
+    return SiteIndex(sites, cell_size=0.25)
+
+
+def brute_force_distance(sites, latitude, longitude):
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(sites['dec_lat_va']), np.radians(sites['dec_long_va'])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class TestSiteIndex:
+    @pytest.mark.parametrize('bbox', [
+        [-122.0, 37.0, -121.0, 38.0],
+        [-121.6, 38.13, -121.55, 38.2],
+        [-90.0, 10.0, -89.0, 11.0],
+    ])
+    def test_bbox_matches_a_scan(self, sites, index, bbox):
+        min_lon, min_lat, max_lon, max_lat = bbox
+        expected = np.flatnonzero(
+            sites['dec_long_va'].between(min_lon, max_lon) & sites['dec_lat_va'].between(min_lat, max_lat)
+        )
+        assert index.bbox(*bbox).tolist() == expected.tolist()
+
+    @pytest.mark.parametrize('radius_km', [1, 25, 150])
+    def test_radius_matches_a_scan(self, sites, index, radius_km):
+        latitude, longitude = float(sites['dec_lat_va'].iloc[100]), float(sites['dec_long_va'].iloc[100])
+        expected = np.flatnonzero(brute_force_distance(sites, latitude, longitude) <= radius_km)
+        assert index.radius(latitude, longitude, radius_km).tolist() == expected.tolist()
+        assert 100 in expected
+
+    def test_huc_prefixes_keep_leading_zeros(self):
+        sites = pd.DataFrame({'huc_cd': [1010002, 18020109, 18020111, 1810, None]})
+        index = SiteIndex(sites)
+        assert index.huc_prefix('0101').tolist() == [0]
+        assert index.huc_prefix('180201').tolist() == [1, 2]
+        assert index.huc_prefix('18').tolist() == [1, 2, 3]
+        assert index.huc_prefix('19').tolist() == []
+
+    def test_search_combines_filters(self, sites, index):
+        bbox = [-122.5, 37.0, -120.5, 39.0]
+        huc = str(int(sites['huc_cd'].dropna().iloc[0]))[:4]
+        positions = index.search(site_types=['ST'], bbox=bbox, huc=huc)
+        expected = set(index.bbox(*bbox)) & set(index.huc_prefix(huc)) & set(np.flatnonzero(sites['site_tp_cd'] == 'ST'))
+        assert len(positions)
+        assert set(positions) == expected
+        assert index.wqp_site_ids(positions[:1]) == [f"USGS-{sites['site_no'].iloc[positions[0]]}"]
+
+    def test_records_are_json_ready(self, index):
+        record = index.records_at([0])[0]
+        assert record['dec_lat_va'] is None
+        assert record['site_no'].startswith('1')
+
+
+class TestZones:
+    @staticmethod
+    def index():
+        return SiteIndex(pd.DataFrame({
+            'agency_cd': ['USGS', 'USGS', 'USGS', 'USGS'],
+            'site_no': ['01', '02', '03', '04'],
+            'dec_lat_va': [38.1, 38.2, -0.1, None],
+            'dec_long_va': [-121.6, -121.4, 0.1, None],
+            'huc_cd': [18020109, 1010002, 1802, None]
+        }))
+
+    def test_huc_levels_truncate_and_skip_coarser_codes(self):
+        index = self.index()
+        zones = index.zones('huc8')
+        assert list(zones.index) == ['USGS-01', 'USGS-02', 'USGS-03', 'USGS-04']
+        assert zones.dropna().to_dict() == {'USGS-01': '18020109', 'USGS-02': '01010002'}
+        assert index.zones('huc4').dropna().to_dict() == {'USGS-01': '1802', 'USGS-02': '0101', 'USGS-03': '1802'}
+        assert index.zones('huc8') is zones
+
+    def test_grid_cells_are_labelled_by_their_south_west_corner(self):
+        zones = self.index().zones('grid', 0.25)
+        assert zones.dropna().to_dict() == {'USGS-01': '38.0,-121.75', 'USGS-02': '38.0,-121.5', 'USGS-03': '-0.25,0.0'}
+        assert grid_cell_bounds('38.0,-121.75', 0.25) == [-121.75, 38.0, -121.5, 38.25]
+        assert grid_cell_label(np.array([38.1]), np.array([-121.6]), 1.0).tolist() == ['38.0,-122.0']
+
+    def test_unknown_level(self):
+        with pytest.raises(ValueError):
+            self.index().zones('county')
+
+
+class TestSiteCatalog:
+    @staticmethod
+    def catalog(monkeypatch, sites, max_age=60, delay=0.05):
+        catalog = SiteCatalog(site_types=['Stream'], max_age=max_age, cell_size=0.25)
+        loads = []
+
+        def load(state_cd):
+            loads.append(state_cd)
+            time.sleep(delay)
+            return SiteIndex(sites)
+
+        monkeypatch.setattr(catalog, '_load', load)
+        return catalog, loads
+
+    def test_concurrent_callers_share_one_cold_load(self, monkeypatch, sites):
+        catalog, loads = self.catalog(monkeypatch, sites)
+
+        async def run():
+            return await asyncio.gather(*[catalog.get(state) for state in ('ca', 'CA', 'CA', 'or')])
+
+        indexes = asyncio.run(run())
+        assert sorted(loads) == ['CA', 'OR']
+        assert indexes[0] is indexes[1] is indexes[2]
+        assert catalog.loaded('ca') is indexes[0]
+        assert catalog.loaded('WA') is None
+
+    def test_stale_indexes_are_served_while_they_refresh(self, monkeypatch, sites):
+        catalog, loads = self.catalog(monkeypatch, sites, max_age=0)
+
+        async def run():
+            first = await catalog.get('CA')
+            refreshed, served = await asyncio.gather(catalog.get('CA'), catalog.get('CA'))
+            return first, refreshed, served
+
+        first, refreshed, served = asyncio.run(run())
+        assert loads == ['CA', 'CA']
+        assert refreshed is not first
+        assert served is first
+
+    def test_site_types(self):
+        catalog = SiteCatalog(site_types=['Stream', 'Lake'], max_age=60, cell_size=0.25)
+        assert catalog.site_type_codes == ['ST', 'LK']
+        assert catalog.covers(['ST', 'Lake'])
+        assert not catalog.covers(['Well'])
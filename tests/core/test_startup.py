@@ -0,0 +1,84 @@
+"""
+Tests for startup profiling and the warm-up middleware
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.core import startup as startup_module
+from app.core.startup import Startup, WarmUpMiddleware
+
+
+@pytest.fixture
+def startup(monkeypatch):
+    """A startup that has not finished, used by the middleware"""
+    startup = Startup()
+    monkeypatch.setattr(startup_module, 'get_startup', lambda: startup)
+    return startup
+
+
+async def endpoint(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'ok'})
+
+
+async def request(path, timeout=0.05, during=None):
+    """Status and headers of one GET through the middleware; during runs while it waits"""
+    middleware = WarmUpMiddleware(endpoint, timeout=timeout)
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    call = middleware({'type': 'http', 'method': 'GET', 'path': path, 'headers': []}, receive, send)
+    if during is None:
+        await call
+    else:
+        await asyncio.gather(call, during())
+    headers = {name.decode(): value.decode() for name, value in messages[0]['headers']}
+    return messages[0]['status'], headers, messages[1]['body']
+
+
+class TestWarmUpMiddleware:
+    def test_warm_up_routes_are_refused_after_the_timeout(self, startup):
+        status, headers, body = asyncio.run(request('/water-quality/query'))
+        assert status == 503
+        assert headers['retry-after'] == '5'
+        assert json.loads(body)['detail']
+
+    def test_other_routes_are_not_held(self, startup):
+        assert asyncio.run(request('/health'))[0] == 200
+
+    def test_requests_waiting_for_the_warm_up_are_served(self, startup):
+        async def finish():
+            await asyncio.sleep(0.02)
+            startup.mark_ready()
+
+        assert asyncio.run(request('/water-quality/query', timeout=5, during=finish))[0] == 200
+
+    def test_failed_warm_up_refuses_without_waiting(self, startup):
+        startup.mark_failed(ImportError('no pandas'))
+        assert asyncio.run(request('/docs', timeout=60))[0] == 503
+
+
+class TestStartup:
+    def test_loaded_modules_are_not_recorded(self):
+        startup = Startup()
+        startup.import_modules(['json', 'app.core.startup'])
+        assert startup.steps == []
+
+    def test_report_totals_steps_by_kind(self):
+        startup = Startup()
+        startup.record('import', 'pandas', 0.5)
+        startup.record('import', 'numpy', 0.25)
+        startup.record('init', 'upstream client', 0.1)
+        startup.mark_ready()
+        report = startup.report()
+        assert report['ready']
+        assert report['import_seconds'] == 0.75
+        assert report['init_seconds'] == 0.1
+        assert [step['name'] for step in report['steps']] == ['pandas', 'numpy', 'upstream client']
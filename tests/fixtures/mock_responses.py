@@ -0,0 +1,76 @@
+"""
+Canned WQP and NWIS responses, and a local server that records requests
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+# A WQP result CSV with a quoted field containing a newline and a comma
+WQP_CSV = (
+    'OrganizationIdentifier,MonitoringLocationIdentifier,ActivityStartDate,CharacteristicName,'
+    'ResultMeasureValue,ResultMeasureUnitCode,ResultCommentText\n'
+    'USGS-CA,USGS-11000001,2020-01-15,pH,7.2,std units,\n'
+    'USGS-CA,USGS-11000001,2020-02-15,pH,7.4,std units,"field note,\nsecond line"\n'
+    'USGS-CA,USGS-11000002,2020-01-20,"Temperature, water",12.5,deg C,\n'
+    'USGS-CA,USGS-11000002,2020-02-20,"Temperature, water",13.1,deg C,\n'
+    'CEDEN,CEDEN-204,2020-03-01,pH,8.9,std units,\n'
+)
+WQP_ROWS = 5
+
+NWIS_RDB = (
+    '# U.S. Geological Survey\n'
+    '# Site descriptions\n'
+    'agency_cd\tsite_no\tstation_nm\tsite_tp_cd\tdec_lat_va\tdec_long_va\thuc_cd\n'
+    '5s\t15s\t50s\t7s\t16s\t16s\t16s\n'
+    'USGS\t11000001\tSAMPLE CREEK A\tST\t38.5\t-121.5\t18020109\n'
+    'USGS\t11000002\tSAMPLE CREEK B\tST\t38.7\t-121.2\t18020111\n'
+)
+
+Response = Tuple[int, str, bytes]
+Params = Dict[str, List[str]]
+
+
+class RecordingServer:
+    """
+    Serve canned responses by path on a local port, recording each request
+
+    A response is a (status, content type, body) tuple, or a function of
+    the query params returning one. requests holds (path, query params,
+    headers) in arrival order.
+    """
+
+    def __init__(self, responses: Dict[str, Union[Response, Callable[[Params], Response]]]):
+        self.responses = responses
+        self.requests: List[Tuple[str, Params, Dict[str, str]]] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                server.requests.append((url.path, params, dict(self.headers)))
+                response = server.responses.get(url.path, (404, 'text/plain', b''))
+                status, content_type, body = response(params) if callable(response) else response
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self) -> 'RecordingServer':
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
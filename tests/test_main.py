@@ -0,0 +1,23 @@
+"""
+Tests for the application entry point
+"""
+
+
+def test_root_page(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'USGS Water Quality Portal API' in response.text
+
+
+def test_warm_up_adds_the_water_quality_routes(client):
+    paths = client.get('/openapi.json').json()['paths']
+    assert '/water-quality/query' in paths
+    assert '/ready' in paths
+
+
+def test_startup_report_times_the_heavy_imports(client):
+    report = client.get('/ready').json()['startup']
+    names = {step['name'] for step in report['steps']}
+    assert 'app.main' in names
+    assert 'water quality routes' in names
+    assert report['import_seconds'] > 0
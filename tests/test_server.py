@@ -0,0 +1,34 @@
+"""
+Tests for the multi-worker production server
+"""
+import os
+
+from app.config import get_settings
+from app.core.shared_state import get_shared_state
+from app.server import start_worker_shared_state, worker_count
+
+
+def test_worker_count():
+    assert worker_count(3) == 3
+    assert worker_count(0) >= 1
+
+
+def test_shared_state_socket_is_exported_not_written_into_settings(tmp_path, monkeypatch):
+    monkeypatch.delenv('SHARED_STATE_SOCKET', raising=False)
+    before = get_settings()
+    manager = start_worker_shared_state(str(tmp_path))
+    try:
+        socket_path = str(tmp_path / 'shared.sock')
+        assert os.environ['SHARED_STATE_SOCKET'] == socket_path
+        assert before.shared_state_socket is None
+        assert get_settings().shared_state_socket == socket_path
+
+        get_shared_state.cache_clear()
+        client = get_shared_state()
+        client.set('key', b'blob', 60)
+        assert client.get('key') == b'blob'
+    finally:
+        manager.shutdown()
+        monkeypatch.delenv('SHARED_STATE_SOCKET')
+        get_settings.cache_clear()
+        get_shared_state.cache_clear()